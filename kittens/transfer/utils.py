@@ -5,6 +5,8 @@
 from contextlib import contextmanager
 from typing import Generator
 
+from kitty.types import run_once
+
 _cwd = _home = ''
 
 
@@ -49,12 +51,47 @@ def flush(self) -> bytes:
 
 class ZlibCompressor:
 
-    def __init__(self) -> None:
+    def __init__(self, level: int = -1) -> None:
         import zlib
-        self.c = zlib.compressobj()
+        self.c = zlib.compressobj(level)
 
     def compress(self, data: bytes) -> bytes:
         return self.c.compress(data)
 
     def flush(self) -> bytes:
         return self.c.flush()
+
+
+class ZstdCompressor:
+
+    def __init__(self, level: int = 3) -> None:
+        from importlib import import_module
+        self.c = import_module('compression.zstd').ZstdCompressor(level=level)
+
+    def compress(self, data: bytes) -> bytes:
+        ans: bytes = self.c.compress(data)
+        return ans
+
+    def flush(self) -> bytes:
+        ans: bytes = self.c.flush()
+        return ans
+
+
+@run_once
+def zstd_supported() -> bool:
+    # zstd is in the standard library from Python 3.14
+    from importlib.util import find_spec
+    try:
+        return find_spec('compression.zstd') is not None
+    except ImportError:
+        return False
+
+
+def is_compressible(sample: bytes, max_ratio: float = 0.9) -> bool:
+    # Compressing a sample at the fastest level is a cheap estimate of how
+    # well data compresses. Archives, images and video gain nothing.
+    import zlib
+    sample = sample[:64 * 1024]
+    if len(sample) < 4096:
+        return True
+    return len(zlib.compress(sample, 1)) < max_ratio * len(sample)
@@ -9,7 +9,26 @@
 from contextlib import suppress
 from enum import IntEnum
 from itertools import count
-from typing import Any, Callable, ClassVar, DefaultDict, Deque, Dict, Generic, Iterator, List, Optional, Sequence, Tuple, Type, TypeVar, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    DefaultDict,
+    Deque,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 
 from kitty.conf.utils import positive_float, positive_int
 from kitty.fast_data_types import create_canvas
@@ -18,6 +37,9 @@
 
 from .operations import cursor
 
+if TYPE_CHECKING:
+    from kitty.shm import SharedMemory
+
 try:
     fsenc = sys.getfilesystemencoding() or 'utf-8'
     codecs.lookup(fsenc)
@@ -139,8 +161,46 @@ def run_imagemagick(path: str, cmd: Sequence[str], keep_stdout: bool = True) ->
     return p
 
 
+def png_info(path: str) -> Optional[ImageData]:
+    ' Read the size and mode of a PNG image from its header, returns None for animated PNGs '
+    import struct
+    width = height = 0
+    mode = 'rgb'
+    with open(path, 'rb') as f:
+        if f.read(8) != b'\x89PNG\r\n\x1a\n':
+            return None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            size, kind = struct.unpack('>I4s', header)
+            if kind == b'IDAT':
+                break
+            if kind == b'acTL':
+                return None
+            if kind == b'IHDR':
+                width, height, _, color_type = struct.unpack('>IIBB', f.read(10))
+                if color_type in (4, 6):  # gray + alpha and RGBA
+                    mode = 'rgba'
+                size -= 10
+            elif kind == b'tRNS':
+                mode = 'rgba'
+            f.seek(size + 4, os.SEEK_CUR)  # skip data and CRC
+    if not width or not height:
+        return None
+    frame = Frame({
+        'gap': '0', 'canvas': f'{width}x{height}+0+0', 'size': f'{width}x{height}', 'dpi': '72x72', 'index': '0',
+        'transparency': 'True' if mode == 'rgba' else 'False', 'dispose': 'Undefined'})
+    return ImageData('png', width, height, mode, [frame])
+
+
 def identify(path: str) -> ImageData:
     import json
+    with suppress(Exception):
+        # PNG images are decoded natively, avoid running ImageMagick for them
+        ans = png_info(path)
+        if ans is not None:
+            return ans
     q = (
         '{"fmt":"%m","canvas":"%g","transparency":"%A","gap":"%T","index":"%p","size":"%wx%h",'
         '"dpi":"%xx%y","dispose":"%D","orientation":"%[EXIF:Orientation]"},'
@@ -178,6 +238,61 @@ def __init__(self, fmt: str, width: int, height: int, mode: str):
         super().__init__(fmt, width, height, mode, [])
 
 
+def scaled_size(width: int, height: int, available_width: int, available_height: int, scale_up: bool) -> Optional[Tuple[int, int]]:
+    ' The size to resize an image to so that it fits in the available space or None if no resizing is needed '
+    scaled = False
+    if scale_up:
+        if width < available_width:
+            r = available_width / width
+            width, height = available_width, int(height * r)
+            scaled = True
+    if scaled or width > available_width or height > available_height:
+        return fit_image(width, height, available_width, available_height)
+    return None
+
+
+def render_png(
+    path: str, output_prefix: str, m: ImageData, available_width: int, available_height: int, scale_up: bool, flip: bool = False, flop: bool = False,
+) -> Optional[RenderedImage]:
+    ' Render a PNG image using the PNG decoder built into kitty, returns None if the image needs ImageMagick '
+    from array import array
+
+    from kitty.fast_data_types import load_png_data, resize_image_data
+    with open(path, 'rb') as src:
+        data, width, height = load_png_data(src.read())
+    new_size = scaled_size(width, height, available_width, available_height, scale_up)
+    if new_size is not None:
+        if not new_size[0] or not new_size[1]:
+            return None
+        data = resize_image_data(data, width, height, new_size[0], new_size[1], 4)
+        width, height = new_size
+    stride = width * 4
+    if flop:
+        # reversing the pixels flips and flops the image, so it is then flipped back below
+        pixels = array('I', data)
+        pixels.reverse()
+        data = pixels.tobytes()
+        flip = not flip
+    if flip:
+        mv = memoryview(data)
+        data = b''.join(mv[y * stride:(y + 1) * stride] for y in range(height - 1, -1, -1))
+    if m.mode == 'rgb':
+        rgb = bytearray(width * height * 3)
+        for i in range(3):
+            rgb[i::3] = data[i::4]
+        data = bytes(rgb)
+    ans = RenderedImage(m.fmt, width, height, m.mode)
+    frame = Frame(m.frames[0])
+    frame.width = frame.canvas_width = width
+    frame.height = frame.canvas_height = height
+    frame.canvas_x = frame.canvas_y = 0
+    frame.path = output_prefix + f'-0.{m.mode}'
+    with open(frame.path, 'wb') as out:
+        out.write(data)
+    ans.frames = [frame]
+    return ans
+
+
 def render_image(
     path: str, output_prefix: str,
     m: ImageData,
@@ -190,6 +305,11 @@ def render_image(
     import tempfile
     has_multiple_frames = len(m) > 1
     get_multiple_frames = has_multiple_frames and not only_first_frame
+    if m.fmt == 'png' and not has_multiple_frames and not remove_alpha:
+        with suppress(ValueError):
+            rendered = render_png(path, output_prefix, m, available_width, available_height, scale_up, flip, flop)
+            if rendered is not None:
+                return rendered
     exe = which('magick')
     if exe:
         cmd = [exe, 'convert']
@@ -210,15 +330,10 @@ def render_image(
     if only_first_frame and has_multiple_frames:
         cmd[-1] += '[0]'
     cmd.append('-auto-orient')
-    scaled = False
     width, height = m.width, m.height
-    if scale_up:
-        if width < available_width:
-            r = available_width / width
-            width, height = available_width, int(height * r)
-            scaled = True
-    if scaled or width > available_width or height > available_height:
-        width, height = fit_image(width, height, available_width, available_height)
+    new_size = scaled_size(width, height, available_width, available_height, scale_up)
+    if new_size is not None:
+        width, height = new_size
         resize_cmd = ['-resize', f'{width}x{height}!']
         if get_multiple_frames:
             # we have to coalesce, resize and de-coalesce all frames
@@ -313,6 +428,8 @@ def can_display_images() -> bool:
 
 
 ImageKey = Tuple[str, int, int]
+# path, modification time, available width, available height
+ConversionKey = Tuple[str, int, int, int]
 SentImageKey = Tuple[int, int, int]
 T = TypeVar('T')
 
@@ -342,6 +459,57 @@ def __set_name__(self, owner: Type['GraphicsCommand'], name: str) -> None:
         self.name = Alias.currently_processing
 
 
+# The size of the base64 encoded payload of each escape code when transmitting
+# image data in chunks
+TRANSMISSION_CHUNK_SIZE = 4096
+# The amount of raw data compressed or read from a file at a time
+BLOCK_SIZE = 256 * 1024
+
+
+def iter_blocks(data: Union[bytes, memoryview], block_size: int = BLOCK_SIZE) -> Iterator[memoryview]:
+    mv = memoryview(data)
+    for pos in range(0, len(mv), block_size):
+        yield mv[pos:pos + block_size]
+
+
+def iter_compressed(blocks: Iterable[Union[bytes, memoryview]], level: int = -1) -> Iterator[bytes]:
+    import zlib
+    c = zlib.compressobj(level)
+    for block in blocks:
+        if cdata := c.compress(block):
+            yield cdata
+    yield c.flush()
+
+
+def compresses_well(data: Union[bytes, memoryview], level: int = -1, sample_size: int = BLOCK_SIZE) -> bool:
+    # decide based on a leading sample so that data that is already
+    # compressed, such as PNG, is not compressed in its entirety for nothing
+    import zlib
+    sample = memoryview(data)[:sample_size]
+    return len(zlib.compress(sample, level)) < len(sample)
+
+
+def iter_encoded_chunks(blocks: Iterable[Union[bytes, memoryview]], chunk_size: int = TRANSMISSION_CHUNK_SIZE) -> Iterator[bytes]:
+    ' Base64 encode blocks of data, yielding chunks of chunk_size bytes, each of which can be decoded independently '
+    raw_size = chunk_size // 4 * 3
+    pending = b''
+    for block in blocks:
+        mv = memoryview(block)
+        if pending:
+            needed = raw_size - len(pending)
+            pending += mv[:needed]
+            mv = mv[needed:]
+            if len(pending) < raw_size:
+                continue
+            yield standard_b64encode(pending)
+        end = len(mv) - len(mv) % raw_size
+        for pos in range(0, end, raw_size):
+            yield standard_b64encode(mv[pos:pos + raw_size])
+        pending = bytes(mv[end:])
+    if pending:
+        yield standard_b64encode(pending)
+
+
 class GraphicsCommand:
     a = action = Alias(cast(GRT_a, 't'))
     q = quiet = Alias(0)
@@ -405,19 +573,43 @@ def iter_transmission_chunks(self, data: Optional[bytes] = None, level: int = -1
             return
         gc = self.clone()
         gc.S = len(data)
-        if level and len(data) >= compression_threshold:
-            import zlib
-            compressed = zlib.compress(data, level)
-            if len(compressed) < len(data):
-                gc.o = 'z'
-                data = compressed
-                gc.S = len(data)
-        data = standard_b64encode(data)
-        while data:
-            chunk, data = data[:4096], data[4096:]
-            gc.m = 1 if data else 0
-            yield gc.serialize(chunk)
-            gc.clear()
+        blocks: Iterable[Union[bytes, memoryview]] = iter_blocks(data)
+        if level and len(data) >= compression_threshold and compresses_well(data, level):
+            gc.o = 'z'
+            blocks = iter_compressed(blocks, level)
+        yield from gc.iter_serialized_chunks(iter_encoded_chunks(blocks))
+
+    def serialize_with_shm(self, data: bytes, prefix: str = 'kitten-img-') -> Tuple[bytes, 'SharedMemory']:
+        ''' Write data into newly created POSIX shared memory and serialize this
+        command to transmit it. The terminal unlinks the shared memory after
+        reading it, the returned object must be closed once no longer needed. '''
+        from kitty.shm import SharedMemory
+        shm = SharedMemory(size=len(data), prefix=prefix)
+        try:
+            shm.write(data)
+            shm.flush()
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        gc = self.clone()
+        gc.t = 's'
+        gc.S = len(data)
+        return gc.serialize(standard_b64encode(shm.name.encode('ascii'))), shm
+
+    def iter_serialized_chunks(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        ' Serialize this command with the already encoded payload chunks, setting the more key as needed '
+        gc = self.clone()
+        prev: Optional[bytes] = None
+        for chunk in chunks:
+            if prev is not None:
+                gc.m = 1
+                yield gc.serialize(prev)
+                gc.clear()
+            prev = chunk
+        if prev is not None:
+            gc.m = 0
+            yield gc.serialize(prev)
 
 
 class Placement:
@@ -437,9 +629,15 @@ def __init__(self, handler: HandlerType):
         self.image_id_counter = count()
         self.handler = handler
         self.filesystem_ok: Optional[bool] = None
-        self.image_data: Dict[str, ImageData] = {}
-        self.failed_images: Dict[str, Exception] = {}
-        self.converted_images: Dict[ImageKey, ImageKey] = {}
+        self.shm_ok: Optional[bool] = None
+        self.shm_query: Optional['SharedMemory'] = None
+        # the shared memory used to transmit each image, closed as soon as it
+        # is written, kept only to unlink any the terminal has not read by exit
+        self.image_shm: Dict[int, 'SharedMemory'] = {}
+        # keyed by path and modification time so that changed files are re-read
+        self.image_data: Dict[Tuple[str, int], ImageData] = {}
+        self.failed_images: Dict[Tuple[str, int], Exception] = {}
+        self.converted_images: Dict[ConversionKey, ImageKey] = {}
         self.sent_images: Dict[ImageKey, int] = {}
         self.image_id_to_image_data: Dict[int, ImageData] = {}
         self.image_id_to_converted_data: Dict[int, ImageKey] = {}
@@ -449,7 +647,8 @@ def __init__(self, handler: HandlerType):
 
     @property
     def next_image_id(self) -> int:
-        return next(self.image_id_counter) + 2
+        # ids 1 and 2 are used to query for filesystem and shared memory support
+        return next(self.image_id_counter) + 3
 
     @property
     def screen_size(self) -> ScreenSize:
@@ -465,10 +664,27 @@ def __enter__(self) -> None:
         gc.s = gc.v = gc.i = 1
         gc.t = 'f'
         self.handler.cmd.gr_command(gc, standard_b64encode(f.name.encode(fsenc)))
+        gc.i = 2
+        try:
+            cmd, self.shm_query = gc.serialize_with_shm(b'abcd', prefix='kitten-shm-query-')
+        except Exception:
+            self.shm_ok = False  # shared memory not available on this system
+        else:
+            self.handler.write(cmd)
+
+    def release_shm_query(self) -> None:
+        if self.shm_query is not None:
+            self.shm_query.close()
+            self.shm_query.unlink()
+            self.shm_query = None
 
     def __exit__(self, *a: Any) -> None:
         import shutil
         shutil.rmtree(self.tdir, ignore_errors=True)
+        self.release_shm_query()
+        for shm in self.image_shm.values():
+            shm.unlink()
+        self.image_shm.clear()
         self.handler.cmd.clear_images_on_screen(delete_data=True)
         self.delete_all_sent_images()
         del self.handler
@@ -494,6 +710,10 @@ def handle_response(self, apc: str) -> None:
         if image_id == 1:
             self.filesystem_ok = payload == 'OK'
             return
+        if image_id == 2:
+            self.shm_ok = payload == 'OK'
+            self.release_shm_query()
+            return
         if not image_id:
             return
         if not self.transmission_status.get(image_id):
@@ -520,15 +740,20 @@ def resend_image(self, image_id: int, pl: Placement) -> None:
 
     def send_image(self, path: str, max_cols: Optional[int] = None, max_rows: Optional[int] = None, scale_up: bool = False) -> SentImageKey:
         path = os.path.abspath(path)
-        if path in self.failed_images:
-            raise self.failed_images[path]
-        if path not in self.image_data:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = 0
+        ikey = path, mtime
+        if ikey in self.failed_images:
+            raise self.failed_images[ikey]
+        if ikey not in self.image_data:
             try:
-                self.image_data[path] = identify(path)
+                self.image_data[ikey] = identify(path)
             except Exception as e:
-                self.failed_images[path] = e
+                self.failed_images[ikey] = e
                 raise
-        m = self.image_data[path]
+        m = self.image_data[ikey]
         ss = self.screen_size
         if max_cols is None:
             max_cols = ss.cols
@@ -536,13 +761,13 @@ def send_image(self, path: str, max_cols: Optional[int] = None, max_rows: Option
             max_rows = ss.rows
         available_width = max_cols * ss.cell_width
         available_height = max_rows * ss.cell_height
-        key = path, available_width, available_height
+        key = path, mtime, available_width, available_height
         skey = self.converted_images.get(key)
         if skey is None:
             try:
                 self.converted_images[key] = skey = self.convert_image(path, available_width, available_height, m, scale_up)
             except Exception as e:
-                self.failed_images[path] = e
+                self.failed_images[ikey] = e
                 raise
         final_width, final_height = skey[1:]
         if final_width == 0:
@@ -585,21 +810,36 @@ def transmit_image(self, image_data: ImageData, image_id: int, rgba_path: str, w
         gc.s = width
         gc.v = height
         gc.i = image_id
+        if self.shm_ok:
+            try:
+                self.transmit_image_via_shm(gc, image_id, rgba_path)
+            except OSError:
+                pass
+            else:
+                return image_id
         if self.filesystem_ok:
             gc.t = 'f'
             self.handler.cmd.gr_command(
                 gc, standard_b64encode(rgba_path.encode(fsenc)))
         else:
-            import zlib
+            from functools import partial
             with open(rgba_path, 'rb') as f:
-                data = f.read()
-            gc.S = len(data)
-            data = zlib.compress(data)
-            gc.o = 'z'
-            data = standard_b64encode(data)
-            while data:
-                chunk, data = data[:4096], data[4096:]
-                gc.m = 1 if data else 0
-                self.handler.cmd.gr_command(gc, chunk)
-                gc.clear()
+                gc.S = os.fstat(f.fileno()).st_size
+                gc.o = 'z'
+                blocks = iter_compressed(iter(partial(f.read, BLOCK_SIZE), b''))
+                for chunk in gc.iter_serialized_chunks(iter_encoded_chunks(blocks)):
+                    self.handler.write(chunk)
         return image_id
+
+    def transmit_image_via_shm(self, gc: GraphicsCommand, image_id: int, rgba_path: str) -> None:
+        previous = self.image_shm.pop(image_id, None)
+        if previous is not None:
+            previous.unlink()
+        # the converted image is kept on disk till exit so re-sends read it
+        # again rather than keeping every image mapped in memory
+        with open(rgba_path, 'rb') as f:
+            data = f.read()
+        cmd, shm = gc.serialize_with_shm(data)
+        shm.close()
+        self.image_shm[image_id] = shm
+        self.handler.write(cmd)
@@ -76,7 +76,7 @@ def set_kitty_opts(paths: Sequence[str], overrides: Sequence[str] = ()) -> 'Opti
     from kitty.fast_data_types import set_options
     from kitty.utils import suppress_error_logging
     with suppress_error_logging():
-        opts = load_config(*paths, overrides=overrides or None)
+        opts = load_config(*paths, overrides=overrides or None, use_cache=True)
         set_options(opts)
         return opts
 
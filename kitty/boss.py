@@ -8,6 +8,7 @@
 import os
 import re
 import sys
+from collections import deque
 from contextlib import contextmanager, suppress
 from functools import partial
 from gettext import gettext as _
@@ -18,6 +19,7 @@
     Any,
     Callable,
     Container,
+    Deque,
     Dict,
     Generator,
     Iterable,
@@ -35,14 +37,6 @@
 from .child import cached_process_data, default_env, set_default_env
 from .cli import create_opts, parse_args
 from .cli_stub import CLIOptions
-from .clipboard import (
-    Clipboard,
-    ClipboardType,
-    get_clipboard_string,
-    get_primary_selection,
-    set_clipboard_string,
-    set_primary_selection,
-)
 from .conf.utils import BadLine, KeyAction, to_cmdline
 from .config import common_opts_as_dict, prepare_config_file_for_editing
 from .constants import (
@@ -60,6 +54,7 @@
     supports_primary_selection,
     website_url,
 )
+from .debug_startup import finish_profiling_startup
 from .fast_data_types import (
     CLOSE_BEING_CONFIRMED,
     GLFW_MOD_ALT,
@@ -104,6 +99,7 @@
     ring_bell,
     run_with_activation_token,
     safe_pipe,
+    schedule_main_thread_jobs,
     send_data_to_peer,
     set_application_quit_request,
     set_background_image,
@@ -121,7 +117,6 @@
 from .key_encoding import get_name_to_functional_number_map
 from .keys import Mappings
 from .layout.base import set_layout_options
-from .notify import notification_activated
 from .options.types import Options
 from .options.utils import MINIMUM_FONT_SIZE, KeyboardMode, KeyDefinition
 from .os_window_size import initial_window_size_func
@@ -154,10 +149,12 @@
     timed_debug_print,
     which,
 )
-from .window import CommandOutput, CwdRequest, Window
+from .window import CommandOutput, CwdRequest, Window, window_match_locations
 
 if TYPE_CHECKING:
+    from .clipboard import Clipboard
     from .rc.base import ResponseType
+    from .search_query_parser import SearchTreeNode
 # }}}
 
 RCResponse = Union[Dict[str, Any], None, AsyncResponse]
@@ -331,12 +328,14 @@ def __init__(
         global_shortcuts: Dict[str, SingleKey],
     ):
         set_layout_options(opts)
-        self.clipboard = Clipboard()
+        self._clipboard: Optional['Clipboard'] = None
+        self._primary_selection: Optional['Clipboard'] = None
         self.window_for_dispatch: Optional[Window] = None
-        self.primary_selection = Clipboard(ClipboardType.primary_selection)
         self.update_check_started = False
         self.peer_data_map: Dict[int, Optional[Dict[str, Sequence[str]]]] = {}
         self.background_process_death_notify_map: Dict[int, Callable[[int, Optional[Exception]], None]] = {}
+        self.main_thread_jobs: Deque[Callable[[], None]] = deque()
+        self.background_image_changed_at_runtime = self.colors_changed_at_runtime = False
         self.encryption_key = EllipticCurveKey()
         self.encryption_public_key = f'{RC_ENCRYPTION_PROTOCOL_VERSION}:{base64.b85encode(self.encryption_key.public).decode("ascii")}'
         self.clipboard_buffers: Dict[str, str] = {}
@@ -380,11 +379,29 @@ def __init__(
         self.mappings = Mappings(global_shortcuts, self.refresh_active_tab_bar)
         if is_macos:
             from .fast_data_types import cocoa_set_notification_activated_callback
+            from .notify import notification_activated
             cocoa_set_notification_activated_callback(notification_activated)
 
         self.green = '\033[92m'
         self.endc = '\033[0m'
 
+    @property
+    def clipboard(self) -> 'Clipboard':
+        if self._clipboard is None:
+            from .clipboard import Clipboard
+            self._clipboard = Clipboard()
+        return self._clipboard
+
+    @property
+    def primary_selection(self) -> 'Clipboard':
+        if self._primary_selection is None:
+            from .clipboard import Clipboard, ClipboardType
+            self._primary_selection = Clipboard(ClipboardType.primary_selection)
+        return self._primary_selection
+
+    def on_first_frame_rendered(self) -> None:
+        finish_profiling_startup(report=self.args.debug_startup)
+
     def startup_first_child(self, os_window_id: Optional[int], startup_sessions: Iterable[Session] = ()) -> None:
         si = startup_sessions or create_sessions(get_options(), self.args, default_session=get_options().startup_session)
         focused_os_window = wid = 0
@@ -473,11 +490,7 @@ def all_windows(self) -> Iterator[Window]:
         for tab in self.all_tabs:
             yield from tab
 
-    def match_windows(self, match: str, self_window: Optional['Window'] = None) -> Iterator[Window]:
-        if match == 'all':
-            yield from self.all_windows
-            return
-        from .search_query_parser import search
+    def window_query_matcher(self, self_window: Optional['Window'] = None) -> Callable[[str, str, Set[int]], Set[int]]:
         tab = self.active_tab
         if current_focused_os_window_id() <= 0:
             tm = self.os_window_map.get(last_focused_os_window_id())
@@ -494,12 +507,20 @@ def get_matches(location: str, query: str, candidates: Set[int]) -> Set[int]:
                 if q < 0:
                     query = str(window_id_limit + q)
             return {wid for wid in candidates if self.window_id_map[wid].matches_query(location, query, tab, self_window)}
+        return get_matches
 
-        for wid in search(match, (
-            'id', 'title', 'pid', 'cwd', 'cmdline', 'num', 'env', 'var', 'recent', 'state', 'neighbor',
-        ), set(self.window_id_map), get_matches):
+    def match_windows(self, match: str, self_window: Optional['Window'] = None) -> Iterator[Window]:
+        if match == 'all':
+            yield from self.all_windows
+            return
+        from .search_query_parser import search
+        for wid in search(match, window_match_locations, set(self.window_id_map), self.window_query_matcher(self_window)):
             yield self.window_id_map[wid]
 
+    def window_matches_query(self, window: Window, query: 'SearchTreeNode') -> bool:
+        # Evaluate an already parsed match expression against a single window
+        return window.id in query.search({window.id}, self.window_query_matcher())
+
     def tab_for_window(self, window: Window) -> Optional[Tab]:
         for tab in self.all_tabs:
             for w in tab:
@@ -588,10 +609,26 @@ def new_os_window_with_wd(self, wd: Union[str, List[str]], str_is_multiple_paths
             self._new_os_window(special_window)
 
     def add_child(self, window: Window) -> None:
-        assert window.child.pid is not None and window.child.child_fd is not None
-        self.child_monitor.add_child(window.id, window.child.pid, window.child.child_fd, window.screen)
+        # The child process may not have been spawned yet, in which case its
+        # pid is set later via set_child_pid(), see Window.on_child_spawned()
+        assert window.child.child_fd is not None
+        self.child_monitor.add_child(window.id, window.child.pid or 0, window.child.child_fd, window.screen)
         self.window_id_map[window.id] = window
 
+    def call_in_main_thread(self, callback: Callable[[], None]) -> None:
+        ' Can be called from any thread, callback will be run in the main thread at the next loop tick '
+        self.main_thread_jobs.append(callback)
+        schedule_main_thread_jobs()
+
+    def run_main_thread_jobs(self) -> None:
+        while self.main_thread_jobs:
+            job = self.main_thread_jobs.popleft()
+            try:
+                job()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
     def _handle_remote_command(self, cmd: memoryview, window: Optional[Window] = None, peer_id: int = 0) -> RCResponse:
         from .remote_control import is_cmd_allowed, parse_cmd, remote_control_allowed
         response = None
@@ -2172,6 +2209,8 @@ def destroy(self) -> None:
         for tm in self.os_window_map.values():
             tm.destroy()
         self.os_window_map = {}
+        from .fonts.render import shutdown_box_prerender_pool
+        shutdown_box_prerender_pool()
         destroy_global_data()
 
     def paste_to_active_window(self, text: str) -> None:
@@ -2182,17 +2221,17 @@ def paste_to_active_window(self, text: str) -> None:
 
     @ac('cp', 'Paste from the clipboard to the active window')
     def paste_from_clipboard(self) -> None:
-        text = get_clipboard_string()
+        text = self.clipboard.get_text()
         if text:
             w = self.window_for_dispatch or self.active_window
             if w is not None:
                 w.paste_with_actions(text)
 
     def current_primary_selection(self) -> str:
-        return get_primary_selection() if supports_primary_selection else ''
+        return self.primary_selection.get_text() if supports_primary_selection else ''
 
     def current_primary_selection_or_clipboard(self) -> str:
-        return get_primary_selection() if supports_primary_selection else get_clipboard_string()
+        return self.primary_selection.get_text() if supports_primary_selection else self.clipboard.get_text()
 
     @ac('cp', 'Paste from the primary selection, if present, otherwise the clipboard to the active window')
     def paste_from_selection(self) -> None:
@@ -2207,7 +2246,7 @@ def set_primary_selection(self) -> None:
         if w is not None and not w.destroyed:
             text = w.text_for_selection()
             if text:
-                set_primary_selection(text)
+                self.primary_selection.set_text(text)
                 if get_options().copy_on_select:
                     self.copy_to_buffer(get_options().copy_on_select)
 
@@ -2244,9 +2283,9 @@ def copy_to_buffer(self, buffer_name: str) -> None:
             text = w.text_for_selection()
             if text:
                 if buffer_name == 'clipboard':
-                    set_clipboard_string(text)
+                    self.clipboard.set_text(text)
                 elif buffer_name == 'primary':
-                    set_primary_selection(text)
+                    self.primary_selection.set_text(text)
                 else:
                     self.set_clipboard_buffer(buffer_name, text)
 
@@ -2257,9 +2296,9 @@ def copy_to_buffer(self, buffer_name: str) -> None:
         ''')
     def paste_from_buffer(self, buffer_name: str) -> None:
         if buffer_name == 'clipboard':
-            text: Optional[str] = get_clipboard_string()
+            text: Optional[str] = self.clipboard.get_text()
         elif buffer_name == 'primary':
-            text = get_primary_selection()
+            text = self.primary_selection.get_text()
         else:
             text = self.get_clipboard_buffer(buffer_name)
         if text:
@@ -2468,9 +2507,9 @@ def create_window() -> SpecialWindowInstance:
             env, stdin = self.process_stdin_source(stdin=source, window=window)
             if stdin:
                 if dest == 'clipboard':
-                    set_clipboard_string(stdin)
+                    self.clipboard.set_text(stdin)
                 else:
-                    set_primary_selection(stdin)
+                    self.primary_selection.set_text(stdin)
         else:
             env, stdin = self.process_stdin_source(stdin=source, window=window)
             self.run_background_process(cmd, cwd_from=cwd_from, stdin=stdin, env=env)
@@ -2621,6 +2660,7 @@ def disable_ligatures_in(self, where: Union[str, Iterable[Window]], strategy: in
     def patch_colors(self, spec: Dict[str, Optional[int]], configured: bool = False) -> None:
         from kitty.rc.set_colors import nullable_colors
         opts = get_options()
+        self.colors_changed_at_runtime = True
         if configured:
             for k, v in spec.items():
                 if hasattr(opts, k):
@@ -2640,39 +2680,59 @@ def patch_colors(self, spec: Dict[str, Optional[int]], configured: bool = False)
         patch_global_colors(spec, configured)
 
     def apply_new_options(self, opts: Options) -> None:
-        from .fonts.box_drawing import set_scale
+        from .config import changed_option_categories
+        # Only the subsystems affected by the options that actually changed
+        # are updated, as reloading fonts and GPU data is expensive
+        changed = changed_option_categories(get_options(), opts)
         # Update options storage
         set_options(opts, is_wayland(), self.args.debug_rendering, self.args.debug_font_fallback)
         apply_options_update()
         set_layout_options(opts)
         set_default_env(opts.env.copy())
         # Update font data
-        set_scale(opts.box_drawing_scale)
-        from .fonts.render import set_font_family
-        set_font_family(opts, debug_font_matching=self.args.debug_font_fallback)
+        fonts_changed = 'fonts' in changed
+        if fonts_changed:
+            from .fonts.box_drawing import set_scale
+            from .fonts.render import set_font_family
+            set_scale(opts.box_drawing_scale)
+            set_font_family(opts, debug_font_matching=self.args.debug_font_fallback)
         for os_window_id, tm in self.os_window_map.items():
             if tm is not None:
-                os_window_font_size(os_window_id, opts.font_size, True)
-                tm.resize()
+                # also reset font sizes changed at runtime
+                if fonts_changed or os_window_font_size(os_window_id) != opts.font_size:
+                    os_window_font_size(os_window_id, opts.font_size, True)
+                    tm.resize()
+                elif changed & {'layout', 'tab_bar'}:
+                    tm.resize()
         # Update key bindings
-        if is_macos:
-            from .fast_data_types import cocoa_clear_global_shortcuts
-            cocoa_clear_global_shortcuts()
-        self.mappings.update_keymap()
-        if is_macos:
-            from .fast_data_types import cocoa_recreate_global_menu
-            cocoa_recreate_global_menu()
+        if 'keys' in changed:
+            if is_macos:
+                from .fast_data_types import cocoa_clear_global_shortcuts
+                cocoa_clear_global_shortcuts()
+            self.mappings.update_keymap()
+            if is_macos:
+                from .fast_data_types import cocoa_recreate_global_menu
+                cocoa_recreate_global_menu()
         # Update misc options
-        try:
-            set_background_image(opts.background_image, tuple(self.os_window_map), True, opts.background_image_layout)
-        except Exception as e:
-            log_error(f'Failed to set background image with error: {e}')
+        if 'background_image' in changed or self.background_image_changed_at_runtime:
+            self.background_image_changed_at_runtime = False
+            try:
+                set_background_image(opts.background_image, tuple(self.os_window_map), True, opts.background_image_layout)
+            except Exception as e:
+                log_error(f'Failed to set background image with error: {e}')
+        # Also resets colors changed at runtime
         for tm in self.all_tab_managers:
             tm.apply_options()
         # Update colors
+        colors_changed = bool(changed & {'colors', 'background_image'}) or self.colors_changed_at_runtime
+        self.colors_changed_at_runtime = False
+        # The cell uniforms, such as text contrast, gamma and dim_opacity, are
+        # only updated when all GPU data is reloaded
+        reload_all_gpu_data = fonts_changed or 'shaders' in changed
         for w in self.all_windows:
-            self.default_bg_changed_for(w.id)
-            w.refresh(reload_all_gpu_data=True)
+            if colors_changed:
+                self.default_bg_changed_for(w.id)
+            w.refresh(reload_all_gpu_data=reload_all_gpu_data)
         load_shader_programs.recompile_if_needed()
 
     @ac('misc', '''
@@ -2972,6 +3032,7 @@ def chosen(ans: Union[None, int, str]) -> None:
 
     def set_background_image(self, path: Optional[str], os_windows: Tuple[int, ...], configured: bool, layout: Optional[str], png_data: bytes = b'') -> None:
         set_background_image(path, os_windows, configured, layout, png_data)
+        self.background_image_changed_at_runtime = True
         for os_window_id in os_windows:
             self.default_bg_changed_for(os_window_id)
 
@@ -3058,7 +3119,7 @@ def debug_config(self) -> None:
         w = self.window_for_dispatch or self.active_window
         if w is not None:
             output = debug_config(get_options())
-            set_clipboard_string(re.sub(r'\x1b.+?m', '', output))
+            self.clipboard.set_text(re.sub(r'\x1b.+?m', '', output))
             output += '\n\x1b[35mThis debug output has been copied to the clipboard\x1b[m'
             self.display_scrollback(w, output, title=_('Current kitty options'), report_cursor=False)
 
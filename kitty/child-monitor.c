@@ -20,6 +20,9 @@
 #include <sys/socket.h>
 #include <sys/un.h>
 #include <signal.h>
+#ifdef __linux__
+#include <sys/syscall.h>
+#endif
 extern PyTypeObject Screen_Type;
 
 #if defined(__APPLE__) || defined(__OpenBSD__)
@@ -64,10 +67,14 @@ typedef struct {
 
 typedef struct {
     Screen *screen;
-    bool needs_removal;
+    bool needs_removal, exited, foreground_process_group_changed;
     int fd;
     unsigned long id;
     pid_t pid;
+    // foreground_process_group is updated by the I/O thread when it reads
+    // from the child, reported_foreground_process_group by the main thread
+    // when it notifies the window of a change
+    pid_t foreground_process_group, reported_foreground_process_group;
 } Child;
 
 static const Child EMPTY_CHILD = {0};
@@ -83,7 +90,6 @@ static Child children[MAX_CHILDREN] = {{0}};
 static Child scratch[MAX_CHILDREN] = {{0}};
 static Child add_queue[MAX_CHILDREN] = {{0}}, remove_queue[MAX_CHILDREN] = {{0}}, remove_notify[MAX_CHILDREN] = {{0}};
 static size_t add_queue_count = 0, remove_queue_count = 0;
-static struct pollfd children_fds[MAX_CHILDREN + EXTRA_FDS] = {{0}};
 static pthread_mutex_t children_lock, talk_lock;
 static bool kill_signal_received = false, reload_config_signal_received = false;
 static ChildMonitor *the_monitor = NULL;
@@ -97,6 +103,23 @@ static pid_t monitored_pids[256] = {0};
 static size_t monitored_pids_count = 0;
 static ReapedPID reaped_pids[arraysz(monitored_pids)] = {{0}};
 static size_t reaped_pids_count = 0;
+// pids of children that were reaped before their pid was known to the monitor,
+// this can happen when a child is spawned in a background thread and exits
+// immediately. Pids of unrelated processes reaped by waitpid(-1) end up here
+// too, entries are dropped when a child with that pid is registered.
+static pid_t unmatched_reaped_pids[64] = {0};
+static size_t unmatched_reaped_pids_count = 0;
+static bool has_pending_main_thread_jobs = false;
+// pidfds for children and monitored pids, these are owned by the I/O thread.
+// pidfds_dirty is protected by children_lock
+typedef struct {
+    pid_t pid;
+    int fd;
+} PidFD;
+static PidFD pidfds[MAX_CHILDREN + arraysz(monitored_pids)] = {{0}};
+static size_t pidfds_count = 0;
+static bool pidfds_dirty = false, pidfds_supported = true, sigchld_ignored = false;
+static struct pollfd children_fds[MAX_CHILDREN + EXTRA_FDS + arraysz(pidfds)] = {{0}};
 
 
 
@@ -301,9 +324,33 @@ wakeup(ChildMonitor *self, PyObject *args UNUSED) {
     Py_RETURN_NONE;
 }
 
+static bool
+forget_unmatched_reaped_pid(pid_t pid) {
+    // must be called with children_lock held
+    bool found = false;
+    for (ssize_t i = unmatched_reaped_pids_count - 1; i >= 0; i--) {
+        if (unmatched_reaped_pids[i] == pid) {
+            remove_i_from_array(unmatched_reaped_pids, (size_t)i, unmatched_reaped_pids_count);
+            found = true;
+        }
+    }
+    return found;
+}
+
+static bool
+was_reaped_before_being_matched(pid_t pid) {
+    // must be called with children_lock held. The pid may have been recorded
+    // for an unrelated process that was reaped earlier and whose pid has
+    // been recycled for this child, so check that this child is really gone.
+    // A child that has not been reaped yet is at least a zombie, so kill()
+    // succeeds and it is matched normally when it is reaped.
+    if (!forget_unmatched_reaped_pid(pid)) return false;
+    return kill(pid, 0) != 0 && errno == ESRCH;
+}
+
 static PyObject *
 add_child(ChildMonitor *self, PyObject *args) {
-#define add_child_doc "add_child(id, pid, fd, screen) -> Add a child."
+#define add_child_doc "add_child(id, pid, fd, screen) -> Add a child. pid can be zero if the child process has not been spawned yet, in which case it must be set later with set_child_pid()."
     children_mutex(lock);
     if (self->count + add_queue_count >= MAX_CHILDREN) { PyErr_SetString(PyExc_ValueError, "Too many children"); children_mutex(unlock); return NULL; }
     add_queue[add_queue_count] = EMPTY_CHILD;
@@ -313,6 +360,7 @@ add_child(ChildMonitor *self, PyObject *args) {
         return NULL;
     }
 #undef A
+    if (add_queue[add_queue_count].pid > 0) forget_unmatched_reaped_pid(add_queue[add_queue_count].pid);
     INCREF_CHILD(add_queue[add_queue_count]);
     add_queue_count++;
     children_mutex(unlock);
@@ -320,6 +368,34 @@ add_child(ChildMonitor *self, PyObject *args) {
     Py_RETURN_NONE;
 }
 
+static PyObject *
+set_child_pid(ChildMonitor *self, PyObject *args) {
+#define set_child_pid_doc "set_child_pid(id, pid) -> Set the pid of a child that was added before its process was spawned."
+    id_type window_id; int pid;
+    if (!PyArg_ParseTuple(args, "Ki", &window_id, &pid)) return NULL;
+    bool found = false;
+    children_mutex(lock);
+    const bool reaped = was_reaped_before_being_matched(pid);
+#define FIND(queue, count) { \
+    for (size_t i = 0; i < count && !found; i++) { \
+        if (queue[i].id == window_id) { \
+            queue[i].pid = pid; found = true; \
+            if (reaped) { \
+                queue[i].exited = true; \
+                if (OPT(close_on_child_death)) queue[i].needs_removal = true; \
+            } \
+        } \
+    }}
+    FIND(children, self->count);
+    FIND(add_queue, add_queue_count);
+#undef FIND
+    pidfds_dirty = true;
+    children_mutex(unlock);
+    wakeup_io_loop(self, false);
+    if (found) { Py_RETURN_TRUE; }
+    Py_RETURN_FALSE;
+}
+
 #define schedule_write_to_child_generic(id, num, va_start, get_next_arg, va_end) \
     ChildMonitor *self = the_monitor; \
     bool found = false; \
@@ -478,6 +554,10 @@ parse_input(ChildMonitor *self) {
         for (size_t i = 0; i < count; i++) {
             scratch[i] = children[i];
             INCREF_CHILD(scratch[i]);
+            if (children[i].foreground_process_group != children[i].reported_foreground_process_group) {
+                children[i].reported_foreground_process_group = children[i].foreground_process_group;
+                scratch[i].foreground_process_group_changed = true;
+            }
         }
     }
     children_mutex(unlock);
@@ -528,6 +608,21 @@ parse_input(ChildMonitor *self) {
     for (size_t i = 0; i < count; i++) {
         if (!scratch[i].needs_removal) {
             if (do_parse(self, scratch[i].screen, now, false)) input_read = true;
+            if (scratch[i].foreground_process_group_changed && scratch[i].screen->callbacks != Py_None) {
+                PyObject *t = PyObject_CallMethod(scratch[i].screen->callbacks, "on_foreground_process_group_change", "i", (int)scratch[i].foreground_process_group);
+                if (t == NULL) PyErr_Print();
+                else Py_DECREF(t);
+            }
+            Screen *screen = scratch[i].screen;
+            screen_mutex(lock, write);
+            const bool drained = screen->write_buf_drained;
+            screen->write_buf_drained = false;
+            screen_mutex(unlock, write);
+            if (drained && screen->callbacks != Py_None) {
+                PyObject *t = PyObject_CallMethod(screen->callbacks, "on_write_buffer_drained", NULL);
+                if (t == NULL) PyErr_Print();
+                else Py_DECREF(t);
+            }
         }
         DECREF_CHILD(scratch[i]);
     }
@@ -879,6 +974,7 @@ render(monotonic_t now, bool input_read) {
 
     const bool scan_for_animated_images = global_state.check_for_active_animated_images;
     global_state.check_for_active_animated_images = false;
+    static bool first_frame_rendered = false;
 
     for (size_t i = 0; i < global_state.num_os_windows; i++) {
         OSWindow *w = global_state.os_windows + i;
@@ -889,6 +985,9 @@ render(monotonic_t now, bool input_read) {
         if (!render_os_window(w, now, false, scan_for_animated_images)) {
             // since we didn't scan the window for animations, force a rescan on next wakeup/render frame
             if (scan_for_animated_images) global_state.check_for_active_animated_images = true;
+        } else if (!first_frame_rendered) {
+            first_frame_rendered = true;
+            call_boss(on_first_frame_rendered, NULL);
         }
     }
     last_render_at = now;
@@ -940,6 +1039,7 @@ monitor_pid(PyObject *self UNUSED, PyObject *args) {
         ok = false;
     } else {
         monitored_pids[monitored_pids_count++] = pid;
+        pidfds_dirty = true;
     }
     children_mutex(unlock);
     if (!ok) return NULL;
@@ -961,6 +1061,25 @@ report_reaped_pids(void) {
     for (size_t n = 0; n < i; n++) { call_boss(on_monitored_pid_death, "li", (long)pids[n].pid, pids[n].status); }
 }
 
+static PyObject*
+schedule_main_thread_jobs(PyObject *self UNUSED, PyObject *args UNUSED) {
+#define schedule_main_thread_jobs_doc "schedule_main_thread_jobs() -> Cause boss.run_main_thread_jobs() to be called on the main thread at the next loop tick. Safe to call from any thread."
+    children_mutex(lock);
+    has_pending_main_thread_jobs = true;
+    children_mutex(unlock);
+    wakeup_main_loop();
+    Py_RETURN_NONE;
+}
+
+static void
+run_main_thread_jobs(void) {
+    children_mutex(lock);
+    bool pending = has_pending_main_thread_jobs;
+    has_pending_main_thread_jobs = false;
+    children_mutex(unlock);
+    if (pending) { call_boss(run_main_thread_jobs, NULL); }
+}
+
 static void*
 thread_write(void *x) {
     ThreadWriteData *data = (ThreadWriteData*)x;
@@ -1234,6 +1353,7 @@ process_global_state(void *data) {
         input_read = true;
     }
     if (parse_input(self)) input_read = true;
+    grman_process_finished_background_loads();
     render(now, input_read);
 #ifdef __APPLE__
     if (has_cocoa_pending_actions) {
@@ -1242,6 +1362,7 @@ process_global_state(void *data) {
     }
 #endif
     report_reaped_pids();
+    run_main_thread_jobs();
     bool should_quit = false;
     if (global_state.has_pending_closes) should_quit = process_pending_closes(self);
     if (should_quit) {
@@ -1286,12 +1407,14 @@ add_children(ChildMonitor *self) {
         children_fds[EXTRA_FDS + self->count].fd = children[self->count].fd;
         children_fds[EXTRA_FDS + self->count].events = POLLIN;
         self->count++;
+        pidfds_dirty = true;
     }
 }
 
 
 static void
 hangup(pid_t pid) {
+    if (pid <= 0) return;  // child process not yet spawned
     errno = 0;
     pid_t pgid = getpgid(pid);
     if (errno == ESRCH) return;
@@ -1329,6 +1452,7 @@ remove_children(ChildMonitor *self) {
             }
         }
         self->count -= count;
+        if (count) pidfds_dirty = true;
     }
 }
 
@@ -1356,6 +1480,20 @@ read_bytes(int fd, Screen *screen) {
 }
 
 
+static void
+update_foreground_process_group(Child *child) {
+    // Noticing changes here lets the main thread keep the foreground process
+    // information for the child cached, instead of querying it every time.
+    // The foreground process group typically changes when a program is run
+    // or exits and such programs invariably produce output.
+    const pid_t pgrp = tcgetpgrp(child->fd);
+    if (pgrp > 0 && pgrp != child->foreground_process_group) {
+        children_mutex(lock);
+        child->foreground_process_group = pgrp;
+        children_mutex(unlock);
+    }
+}
+
 typedef struct { bool kill_signal, child_died, reload_config; } SignalSet;
 
 static bool
@@ -1383,14 +1521,29 @@ handle_signal(const siginfo_t *siginfo, void *data) {
 }
 
 static void
-mark_child_for_removal(ChildMonitor *self, pid_t pid) {
+mark_child_as_exited(ChildMonitor *self, pid_t pid, bool enable_close_on_child_death) {
+    bool found = false;
     children_mutex(lock);
     for (size_t i = 0; i < self->count; i++) {
         if (children[i].pid == pid) {
-            children[i].needs_removal = true;
+            children[i].exited = true;
+            if (enable_close_on_child_death) children[i].needs_removal = true;
+            found = true;
             break;
         }
     }
+    for (size_t i = 0; i < add_queue_count && !found; i++) {
+        if (add_queue[i].pid == pid) {
+            add_queue[i].exited = true;
+            if (enable_close_on_child_death) add_queue[i].needs_removal = true;
+            found = true;
+        }
+    }
+    if (found) pidfds_dirty = true;
+    else {
+        if (unmatched_reaped_pids_count >= arraysz(unmatched_reaped_pids)) remove_i_from_array(unmatched_reaped_pids, 0, unmatched_reaped_pids_count);
+        unmatched_reaped_pids[unmatched_reaped_pids_count++] = pid;
+    }
     children_mutex(unlock);
 }
 
@@ -1404,6 +1557,7 @@ mark_monitored_pids(pid_t pid, int status) {
                 reaped_pids[reaped_pids_count++].pid = pid;
             }
             remove_i_from_array(monitored_pids, (size_t)i, monitored_pids_count);
+            pidfds_dirty = true;
         }
     }
     children_mutex(unlock);
@@ -1413,18 +1567,131 @@ static void
 reap_children(ChildMonitor *self, bool enable_close_on_child_death) {
     int status;
     pid_t pid;
-    (void)self;
     while(true) {
         pid = waitpid(-1, &status, WNOHANG);
         if (pid == -1) {
             if (errno != EINTR) break;
         } else if (pid > 0) {
-            if (enable_close_on_child_death) mark_child_for_removal(self, pid);
+            mark_child_as_exited(self, pid, enable_close_on_child_death);
             mark_monitored_pids(pid, status);
         } else break;
     }
 }
 
+// pidfds {{{
+// On Linux we poll a pidfd for every child and monitored pid, which gives
+// immediate, race free notification of their exit and allows reaping exactly
+// the process that exited. While every such pid has a pidfd, SIGCHLD is
+// removed from the signalfd so that exits do not wake up the I/O thread twice
+// and nothing is reaped via waitpid(-1). SIGCHLD handling is the fallback for
+// when a pidfd could not be opened and on systems without pidfd support.
+
+static int
+open_pidfd(pid_t pid) {
+#if defined(__linux__) && defined(SYS_pidfd_open)
+    // pidfd_open() sets the close-on-exec flag
+    int fd = (int)syscall(SYS_pidfd_open, pid, 0);
+    if (fd < 0 && (errno == ENOSYS || errno == EPERM)) pidfds_supported = false;
+    return fd;
+#else
+    (void)pid;
+    pidfds_supported = false;
+    return -1;
+#endif
+}
+
+static bool
+is_pid_tracked(const ChildMonitor *self, pid_t pid) {
+    for (size_t i = 0; i < self->count; i++) if (children[i].pid == pid && !children[i].exited) return true;
+    for (size_t i = 0; i < monitored_pids_count; i++) if (monitored_pids[i] == pid) return true;
+    return false;
+}
+
+static void
+track_pid(pid_t pid) {
+    if (pid <= 0 || !pidfds_supported || pidfds_count >= arraysz(pidfds)) return;
+    for (size_t i = 0; i < pidfds_count; i++) if (pidfds[i].pid == pid) return;
+    int fd = open_pidfd(pid);
+    if (fd > -1) { pidfds[pidfds_count].pid = pid; pidfds[pidfds_count++].fd = fd; }
+}
+
+static void
+remove_pidfd(size_t i) {
+    safe_close(pidfds[i].fd, __FILE__, __LINE__);
+    remove_i_from_array(pidfds, i, pidfds_count);
+}
+
+static bool
+has_pidfd(pid_t pid) {
+    for (size_t i = 0; i < pidfds_count; i++) if (pidfds[i].pid == pid) return true;
+    return false;
+}
+
+static bool
+all_tracked_pids_have_pidfds(const ChildMonitor *self) {
+    if (!pidfds_supported) return false;
+    for (size_t i = 0; i < self->count; i++) if (children[i].pid > 0 && !children[i].exited && !has_pidfd(children[i].pid)) return false;
+    for (size_t i = 0; i < monitored_pids_count; i++) if (!has_pidfd(monitored_pids[i])) return false;
+    return true;
+}
+
+static void
+update_sigchld_handling(ChildMonitor *self) {
+    // Children whose pid is not known yet need no SIGCHLD, if they exit
+    // before it is, a pidfd for the zombie is opened once it is known.
+    const bool ignore = all_tracked_pids_have_pidfds(self);
+    if (ignore == sigchld_ignored || self->io_loop_data.signal_read_fd < 0) return;
+#ifdef HAS_SIGNAL_FD
+    sigset_t mask = self->io_loop_data.signals;
+    // SIGCHLD stays blocked, so it remains pending, to be read from the
+    // signalfd once it is handled again
+    if (ignore) sigdelset(&mask, SIGCHLD);
+    if (signalfd(self->io_loop_data.signal_read_fd, &mask, SFD_NONBLOCK | SFD_CLOEXEC) == -1) {
+        log_error("Failed to update the signals handled by the I/O thread with error: %s", strerror(errno));
+        return;
+    }
+    sigchld_ignored = ignore;
+#endif
+}
+
+static void
+sync_pidfds(ChildMonitor *self) {
+    // Must be called in the I/O thread with children_lock held
+    if (!pidfds_dirty) return;
+    pidfds_dirty = false;
+    for (ssize_t i = pidfds_count - 1; i >= 0; i--) {
+        if (!is_pid_tracked(self, pidfds[i].pid)) remove_pidfd(i);
+    }
+    for (size_t i = 0; i < self->count; i++) if (!children[i].exited) track_pid(children[i].pid);
+    for (size_t i = 0; i < monitored_pids_count; i++) track_pid(monitored_pids[i]);
+    update_sigchld_handling(self);
+}
+
+static bool
+reap_exited_pids(ChildMonitor *self, const struct pollfd *fds, bool enable_close_on_child_death) {
+    bool found = false;
+    for (ssize_t i = pidfds_count - 1; i >= 0; i--) {
+        if (!(fds[i].revents & (POLLIN | POLLHUP | POLLNVAL))) continue;
+        found = true;
+        const pid_t pid = pidfds[i].pid;
+        remove_pidfd(i);
+        int status; pid_t ret;
+        while ((ret = waitpid(pid, &status, WNOHANG)) == -1 && errno == EINTR);
+        // ret will be -1 with ECHILD if the process was already reaped via SIGCHLD
+        if (ret == pid) {
+            mark_child_as_exited(self, pid, enable_close_on_child_death);
+            mark_monitored_pids(pid, status);
+        }
+    }
+    return found;
+}
+
+static void
+close_pidfds(void) {
+    while (pidfds_count) remove_pidfd(pidfds_count - 1);
+}
+// }}}
+
 #ifdef KITTY_PRINT_BYTES_SENT_TO_CHILD
 static void
 print_text(const unsigned char *text, ssize_t sz) {
@@ -1439,8 +1706,10 @@ print_text(const unsigned char *text, ssize_t sz) {
 #endif
 
 
-static void
+static bool
 write_to_child(int fd, Screen *screen) {
+    // Returns true if the main thread needs to be told that the buffer has drained
+    bool drained = false;
     size_t written = 0;
     ssize_t ret = 0;
     screen_mutex(lock, write);
@@ -1473,8 +1742,13 @@ write_to_child(int fd, Screen *screen) {
         if (screen->write_buf_used) {
             memmove(screen->write_buf, screen->write_buf + written, screen->write_buf_used);
         }
+        if (screen->write_buf_drain_threshold && screen->write_buf_used <= screen->write_buf_drain_threshold) {
+            screen->write_buf_drain_threshold = 0;
+            screen->write_buf_drained = drained = true;
+        }
     }
     screen_mutex(unlock, write);
+    return drained;
 }
 
 static void*
@@ -1492,9 +1766,13 @@ io_loop(void *data) {
         children_mutex(lock);
         remove_children(self);
         add_children(self);
+        sync_pidfds(self);
         children_mutex(unlock);
         data_received = false;
-        for (i = 0; i < self->count + EXTRA_FDS; i++) children_fds[i].revents = 0;
+        struct pollfd *pidfd_fds = children_fds + EXTRA_FDS + self->count;
+        for (i = 0; i < pidfds_count; i++) { pidfd_fds[i].fd = pidfds[i].fd; pidfd_fds[i].events = POLLIN; }
+        const nfds_t num_fds = self->count + EXTRA_FDS + pidfds_count;
+        for (i = 0; i < num_fds; i++) children_fds[i].revents = 0;
         for (i = 0; i < self->count; i++) {
             screen = children[i].screen;
             /* printf("i:%lu id:%lu fd: %d read_buf_sz: %lu write_buf_used: %lu\n", i, children[i].id, children[i].fd, screen->read_buf_sz, screen->write_buf_used); */
@@ -1506,10 +1784,10 @@ io_loop(void *data) {
         if (has_pending_wakeups) {
             now = monotonic();
             monotonic_t time_delta = OPT(input_delay) - (now - last_main_loop_wakeup_at);
-            if (time_delta >= 0) ret = poll(children_fds, self->count + EXTRA_FDS, monotonic_t_to_ms(time_delta));
+            if (time_delta >= 0) ret = poll(children_fds, num_fds, monotonic_t_to_ms(time_delta));
             else ret = 0;
         } else {
-            ret = poll(children_fds, self->count + EXTRA_FDS, -1);
+            ret = poll(children_fds, num_fds, -1);
         }
         if (ret > 0) {
             if (children_fds[0].revents && POLLIN) drain_fd(children_fds[0].fd); // wakeup
@@ -1525,6 +1803,7 @@ io_loop(void *data) {
                 }
                 if (ss.child_died) reap_children(self, OPT(close_on_child_death));
             }
+            if (pidfds_count && reap_exited_pids(self, pidfd_fds, OPT(close_on_child_death))) data_received = true;
             for (i = 0; i < self->count; i++) {
                 if (children_fds[EXTRA_FDS + i].revents & (POLLIN | POLLHUP)) {
                     data_received = true;
@@ -1534,10 +1813,10 @@ io_loop(void *data) {
                         children_mutex(lock);
                         children[i].needs_removal = true;
                         children_mutex(unlock);
-                    }
+                    } else update_foreground_process_group(children + i);
                 }
                 if (children_fds[EXTRA_FDS + i].revents & POLLOUT) {
-                    write_to_child(children[i].fd, children[i].screen);
+                    if (write_to_child(children[i].fd, children[i].screen)) data_received = true;
                 }
                 if (children_fds[EXTRA_FDS + i].revents & POLLNVAL) {
                     // fd was closed
@@ -1548,7 +1827,7 @@ io_loop(void *data) {
                 }
             }
 #ifdef DEBUG_POLL_EVENTS
-            for (i = 0; i < self->count + EXTRA_FDS; i++) {
+            for (i = 0; i < num_fds; i++) {
 #define P(w) if (children_fds[i].revents & w) printf("i:%lu %s\n", i, #w);
                 P(POLLIN); P(POLLPRI); P(POLLOUT); P(POLLERR); P(POLLHUP); P(POLLNVAL);
 #undef P
@@ -1573,6 +1852,7 @@ io_loop(void *data) {
     children_mutex(lock);
     for (i = 0; i < self->count; i++) children[i].needs_removal = true;
     remove_children(self);
+    close_pidfds();
     children_mutex(unlock);
     return 0;
 }
@@ -1920,6 +2200,7 @@ static PyMethodDef methods[] = {
     METHOD(main_loop, METH_NOARGS)
     METHOD(mark_for_close, METH_VARARGS)
     METHOD(resize_pty, METH_VARARGS)
+    METHOD(set_child_pid, METH_VARARGS)
     METHODB(handled_signals, METH_NOARGS),
     {"set_iutf8_winid", (PyCFunction)pyset_iutf8, METH_VARARGS, ""},
     {NULL}  /* Sentinel */
@@ -1992,6 +2273,7 @@ static PyMethodDef module_methods[] = {
     {"add_timer", (PyCFunction)add_python_timer, METH_VARARGS, ""},
     {"remove_timer", (PyCFunction)remove_python_timer, METH_VARARGS, ""},
     METHODB(monitor_pid, METH_VARARGS),
+    METHODB(schedule_main_thread_jobs, METH_NOARGS),
     METHODB(send_data_to_peer, METH_VARARGS),
     METHODB(cocoa_set_menubar_title, METH_VARARGS),
     METHODB(mask_kitty_signals_process_wide, METH_NOARGS),
@@ -3,14 +3,15 @@
 
 import os
 import sys
-from collections import defaultdict
+from collections import defaultdict, deque
 from contextlib import contextmanager, suppress
 from itertools import count
-from typing import TYPE_CHECKING, DefaultDict, Dict, Generator, List, Optional, Sequence, Tuple
+from typing import TYPE_CHECKING, Callable, DefaultDict, Deque, Dict, Generator, List, NamedTuple, Optional, Sequence, Tuple
 
 import kitty.fast_data_types as fast_data_types
 
 from .constants import handled_signals, is_freebsd, is_macos, kitten_exe, kitty_base_dir, shell_path, terminfo_dir
+from .debug_startup import debug_startup_event
 from .types import run_once
 from .utils import cmdline_for_hold, log_error, which
 
@@ -19,6 +20,8 @@
 except ImportError:
     TypedDict = dict
 if TYPE_CHECKING:
+    from concurrent.futures import Future, ThreadPoolExecutor
+
     from .window import CwdRequest
 
 
@@ -185,6 +188,96 @@ def base64_terminfo_data() -> str:
     return (b'b64:' + fast_data_types.base64_encode(fast_data_types.terminfo_data(), True)).decode('ascii')
 
 
+@run_once
+def spawner() -> 'ThreadPoolExecutor':
+    # A single worker so that children are spawned in the order they are
+    # requested, for example, when loading a session file.
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='KittyChildSpawner')
+
+
+class SystemdScopes:
+    # Creating a scope is a D-Bus round trip, so it is done in a background
+    # thread, with all requests that arrive in a burst sent together.
+
+    max_batch_size = 64
+    unavailable = False
+
+    def __init__(self) -> None:
+        from queue import Queue
+        from threading import Thread
+        self.queue: 'Queue[Tuple[int, str, str]]' = Queue(maxsize=1024)
+        self.timings: Deque[Tuple[int, float]] = deque(maxlen=64)  # (number of pids, seconds) per batch
+        Thread(target=self.run, name='KittySystemdScopes', daemon=True).start()
+
+    def add(self, pid: int, scope_name: str, description: str) -> None:
+        from queue import Full
+        if self.unavailable:
+            return
+        try:
+            self.queue.put_nowait((pid, scope_name, description))
+        except Full:
+            log_error(f'Too many pending systemd scope requests, not moving child process {pid} into a scope')
+
+    def run(self) -> None:
+        from queue import Empty
+        from time import monotonic
+        while not self.unavailable:
+            batch = [self.queue.get()]
+            with suppress(Empty):
+                while len(batch) < self.max_batch_size:
+                    batch.append(self.queue.get_nowait())
+            st = monotonic()
+            try:
+                errors = fast_data_types.systemd_move_pids_into_new_scopes(tuple(batch))
+            except NotImplementedError:
+                self.unavailable = True
+                break
+            except Exception as e:
+                errors = tuple(str(e) for x in batch)
+            duration = monotonic() - st
+            self.timings.append((len(batch), duration))
+            debug_startup_event(f'Moved {len(batch)} child processes into systemd scopes in {duration * 1000:.1f} ms')
+            for (pid, _, _), error in zip(batch, errors):
+                if error:
+                    log_error(f'Could not move child process {pid} into a systemd scope: {error}')
+
+
+@run_once
+def systemd_scopes() -> SystemdScopes:
+    return SystemdScopes()
+
+
+def move_into_systemd_scope(pid: int, scope_name: str, description: str) -> None:
+    systemd_scopes().add(pid, scope_name, description)
+
+
+class PendingFork(NamedTuple):
+    slave: int
+    ready_read_fd: int
+    # owned by the Child, closed by mark_terminal_ready()
+    ready_write_fd: int
+    stdin_read_fd: int
+    stdin_write_fd: int
+    stdin: Optional[bytes]
+
+    def close(self) -> None:
+        for fd in (self.slave, self.ready_read_fd, self.stdin_read_fd, self.stdin_write_fd):
+            if fd > -1:
+                with suppress(OSError):
+                    os.close(fd)
+
+
+class SpawnArgs(NamedTuple):
+    exe: str
+    cwd: str
+    argv: Tuple[str, ...]
+    env: Tuple[str, ...]
+    handled_signals: Tuple[int, ...]
+    kitten_exe: str
+    forward_stdio: bool
+
+
 class ProcessDesc(TypedDict):
     cwd: Optional[str]
     pid: int
@@ -197,8 +290,22 @@ class ProcessDesc(TypedDict):
 class Child:
 
     child_fd: Optional[int] = None
-    pid: Optional[int] = None
+    _pid: Optional[int] = None
     forked = False
+    terminal_ready_fd: int = -1
+    pending_fork: Optional[PendingFork] = None
+    # While a spawn is in progress in the worker thread, marking the terminal
+    # ready is deferred till it completes as the worker uses terminal_ready_fd
+    spawn_in_progress = False
+    terminal_ready_deferred = False
+    spawn_future: Optional['Future[int]'] = None
+    spawn_callback: Optional[Callable[[Optional[Exception]], None]] = None
+    # The foreground process group as last noticed by the I/O thread, -1 if
+    # not yet known. While it is known, data about the foreground process such
+    # as its cwd is cached, until an event such as a change of the group or a
+    # cwd report from shell integration invalidates the cache.
+    foreground_process_group: int = -1
+    cwd_reported_by_shell = False
 
     def __init__(
         self,
@@ -229,6 +336,8 @@ def __init__(
         self.is_default_shell = bool(self.argv and self.argv[0] == shell_path)
         self.should_run_via_run_shell_kitten = is_macos and self.is_default_shell
         self.hold = hold
+        self.foreground_data_cache: Dict[Tuple[str, bool], Tuple[int, Optional[str]]] = {}
+        self.foreground_cmdline_cache: Optional[Tuple[int, List[str]]] = None
 
     def get_final_env(self) -> Dict[str, str]:
         from kitty.options.utils import DELETE_ENV_VAR
@@ -273,10 +382,10 @@ def get_final_env(self) -> Dict[str, str]:
             env.pop('KITTY_IS_CLONE_LAUNCH', None)
         return env
 
-    def fork(self) -> Optional[int]:
-        if self.forked:
-            return None
-        opts = fast_data_types.get_options()
+    def prepare_for_fork(self) -> None:
+        # Create the pty and the synchronization pipes, these are cheap and
+        # allow the child to be attached to the ChildMonitor and accept input
+        # before its process actually exists.
         self.forked = True
         master, slave = openpty()
         stdin, self.stdin = self.stdin, None
@@ -289,6 +398,36 @@ def fork(self) -> Optional[int]:
             os.set_inheritable(stdin_read_fd, True)
         else:
             stdin_read_fd = stdin_write_fd = -1
+        os.set_blocking(master, False)
+        self.child_fd = master
+        self.terminal_ready_fd = ready_write_fd
+        self.pending_fork = PendingFork(slave, ready_read_fd, ready_write_fd, stdin_read_fd, stdin_write_fd, stdin)
+
+    @property
+    def pid(self) -> Optional[int]:
+        # Queries that need the pid wait for a pending spawn to complete
+        if self.spawn_future is not None:
+            self.finish_spawn()
+        return self._pid
+
+    @pid.setter
+    def pid(self, val: Optional[int]) -> None:
+        self._pid = val
+
+    def spawn_prepared(self, args: SpawnArgs) -> int:
+        # Can be called in a thread other than the main thread
+        pf = self.pending_fork
+        assert pf is not None
+        self.pending_fork = None
+        try:
+            return self._spawn(pf, args)
+        except Exception:
+            pf.close()
+            raise
+
+    def prepare_spawn(self) -> SpawnArgs:
+        # Must be called in the main thread as it reads options and boss state
+        opts = fast_data_types.get_options()
         self.final_env = self.get_final_env()
         argv = list(self.argv)
         cwd = self.cwd
@@ -330,39 +469,154 @@ def fork(self) -> Optional[int]:
             argv = cmdline_for_hold(argv)
             final_exe = argv[0]
         env = tuple(f'{k}={v}' for k, v in self.final_env.items())
+        return SpawnArgs(final_exe, cwd, tuple(argv), env, tuple(handled_signals), kitten_exe(), opts.forward_stdio)
+
+    def _spawn(self, pf: PendingFork, a: SpawnArgs) -> int:
+        assert self.child_fd is not None
         pid = fast_data_types.spawn(
-            final_exe, cwd, tuple(argv), env, master, slave, stdin_read_fd, stdin_write_fd,
-            ready_read_fd, ready_write_fd, tuple(handled_signals), kitten_exe(), opts.forward_stdio)
-        os.close(slave)
+            a.exe, a.cwd, a.argv, a.env, self.child_fd, pf.slave, pf.stdin_read_fd, pf.stdin_write_fd,
+            pf.ready_read_fd, pf.ready_write_fd, a.handled_signals, a.kitten_exe, a.forward_stdio)
+        os.close(pf.slave)
+        if pf.stdin is not None:
+            os.close(pf.stdin_read_fd)
+            fast_data_types.thread_write(pf.stdin_write_fd, pf.stdin)
+        os.close(pf.ready_read_fd)
+        return pid
+
+    def on_spawned(self, pid: int) -> None:
         self.pid = pid
-        self.child_fd = master
-        if stdin is not None:
-            os.close(stdin_read_fd)
-            fast_data_types.thread_write(stdin_write_fd, stdin)
-        os.close(ready_read_fd)
-        self.terminal_ready_fd = ready_write_fd
-        if self.child_fd is not None:
-            os.set_blocking(self.child_fd, False)
         if not is_macos:
             ppid = getpid()
-            try:
-                fast_data_types.systemd_move_pid_into_new_scope(pid, f'kitty-{ppid}-{self.id}.scope', f'kitty child process: {pid} launched by: {ppid}')
-            except NotImplementedError:
-                pass
-            except OSError as err:
-                log_error("Could not move child process into a systemd scope: " + str(err))
-        return pid
+            move_into_systemd_scope(pid, f'kitty-{ppid}-{self.id}.scope', f'kitty child process: {pid} launched by: {ppid}')
+
+    def fork(self) -> Optional[int]:
+        if self.forked:
+            return None
+        self.prepare_for_fork()
+        self.on_spawned(self.spawn_prepared(self.prepare_spawn()))
+        return self.pid
+
+    def fork_in_background(self, callback: Callable[[Optional[Exception]], None]) -> None:
+        '''
+        Spawn the child process in a worker thread. The pty is created
+        immediately (unless prepare_for_fork() was already called) so child_fd
+        is available on return. The environment and command line are computed
+        in the main thread, only the actual spawn happens in the worker. Once
+        it completes, pid is set and callback is called in the main thread
+        with the exception, if any, that prevented spawning. Reading pid
+        before that waits for the spawn to complete.
+        '''
+        if self.pending_fork is None:
+            if self.forked:
+                return
+            self.prepare_for_fork()
+        from concurrent.futures import Future
+        boss = fast_data_types.get_boss()
+        try:
+            args = self.prepare_spawn()
+        except Exception as err:
+            fut: 'Future[int]' = Future()
+            fut.set_exception(err)
+        else:
+            fut = spawner().submit(self.spawn_prepared, args)
+        self.spawn_in_progress = True
+        self.spawn_future, self.spawn_callback = fut, callback
+        fut.add_done_callback(lambda f: boss.call_in_main_thread(self.finish_spawn))
+
+    def finish_spawn(self) -> None:
+        # Must be called in the main thread, waits for the spawn worker if it
+        # has not finished yet
+        fut, self.spawn_future = self.spawn_future, None
+        callback, self.spawn_callback = self.spawn_callback, None
+        if fut is None or callback is None:
+            return
+        pid = 0
+        err: Optional[Exception] = None
+        try:
+            pid = fut.result()
+        except Exception as e:
+            err = e
+        self.spawn_in_progress = False
+        if err is None:
+            self.on_spawned(pid)
+        try:
+            callback(err)
+        finally:
+            if self.terminal_ready_deferred:
+                self.mark_terminal_ready()
 
     def __del__(self) -> None:
         fd = getattr(self, 'terminal_ready_fd', -1)
         if fd > -1:
             os.close(fd)
         self.terminal_ready_fd = -1
+        pf = self.pending_fork
+        if pf is not None:
+            self.pending_fork = None
+            pf.close()
 
     def mark_terminal_ready(self) -> None:
-        os.close(self.terminal_ready_fd)
+        if self.spawn_in_progress:
+            self.terminal_ready_deferred = True
+            return
+        self.terminal_ready_deferred = False
+        if self.terminal_ready_fd > -1:
+            os.close(self.terminal_ready_fd)
         self.terminal_ready_fd = -1
 
+    def hangup(self) -> None:
+        # Used when the window is closed before its child process was spawned
+        if self.pid:
+            import signal
+            with suppress(OSError):
+                os.killpg(self.pid, signal.SIGHUP)
+
+    def on_foreground_process_group_change(self, pgrp: int) -> None:
+        self.foreground_process_group = pgrp
+        self.invalidate_foreground_process_cache()
+
+    def on_cwd_reported(self) -> None:
+        self.cwd_reported_by_shell = True
+        self.invalidate_foreground_process_cache()
+
+    def invalidate_foreground_process_cache(self) -> None:
+        self.foreground_data_cache = {}
+        self.foreground_cmdline_cache = None
+
+    @property
+    def foreground_data_cacheable(self) -> bool:
+        # only cache when the I/O thread is tracking the foreground process
+        # group, so that a change to it invalidates the cache
+        return self.foreground_process_group > -1
+
+    def foreground_process_group_and_members(self) -> Tuple[int, List[int]]:
+        # The members are always listed afresh as processes can join or leave
+        # the group without it changing, see get_pid_for_cwd(). The caches are
+        # keyed by the pid chosen from them.
+        assert self.child_fd is not None
+        pgrp = os.tcgetpgrp(self.child_fd)
+        members = processes_in_group(pgrp) if pgrp >= 0 else []
+        return pgrp, members
+
+    def cached_foreground_data(self, which: str, oldest: bool, compute: Callable[[int], Optional[str]]) -> Optional[str]:
+        key = which, oldest
+        ans = pid = None
+        with suppress(Exception):
+            pid = self.get_pid_for_cwd(oldest)
+        if pid is None:
+            return None
+        cached = self.foreground_data_cache.get(key)
+        if cached is not None and cached[0] == pid and self.foreground_data_cacheable:
+            return cached[1]
+        with suppress(Exception):
+            ans = compute(pid)
+        # The cwd of a process can change without any event. Only the shell
+        # reports it via shell integration, so it is cached only while the
+        # shell itself is the foreground process.
+        if self.foreground_data_cacheable and (which != 'cwd' or (self.cwd_reported_by_shell and pid == self.pid)):
+            self.foreground_data_cache[key] = pid, ans
+        return ans
+
     def cmdline_of_pid(self, pid: int) -> List[str]:
         try:
             ans = cmdline_of_pid(pid)
@@ -377,8 +631,7 @@ def foreground_processes(self) -> List[ProcessDesc]:
         if self.child_fd is None:
             return []
         try:
-            pgrp = os.tcgetpgrp(self.child_fd)
-            foreground_processes = processes_in_group(pgrp) if pgrp >= 0 else []
+            foreground_processes = self.foreground_process_group_and_members()[1]
 
             def process_desc(pid: int) -> ProcessDesc:
                 ans: ProcessDesc = {'pid': pid, 'cmdline': None, 'cwd': None}
@@ -403,8 +656,15 @@ def cmdline(self) -> List[str]:
     @property
     def foreground_cmdline(self) -> List[str]:
         try:
-            assert self.pid_for_cwd is not None
-            return self.cmdline_of_pid(self.pid_for_cwd) or self.cmdline
+            pid = self.pid_for_cwd
+            assert pid is not None
+            cached = self.foreground_cmdline_cache
+            if cached is not None and cached[0] == pid and self.foreground_data_cacheable:
+                return list(cached[1])
+            ans = self.cmdline_of_pid(pid)
+            if ans and self.foreground_data_cacheable:
+                self.foreground_cmdline_cache = pid, list(ans)
+            return ans or self.cmdline
         except Exception:
             return self.cmdline
 
@@ -425,9 +685,7 @@ def current_cwd(self) -> Optional[str]:
 
     def get_pid_for_cwd(self, oldest: bool = False) -> Optional[int]:
         with suppress(Exception):
-            assert self.child_fd is not None
-            pgrp = os.tcgetpgrp(self.child_fd)
-            foreground_processes = processes_in_group(pgrp) if pgrp >= 0 else []
+            foreground_processes = self.foreground_process_group_and_members()[1]
             if foreground_processes:
                 # there is no easy way that I know of to know which process is the
                 # foreground process in this group from the users perspective,
@@ -447,20 +705,15 @@ def pid_for_cwd(self) -> Optional[int]:
         return self.get_pid_for_cwd()
 
     def get_foreground_cwd(self, oldest: bool = False) -> Optional[str]:
-        with suppress(Exception):
-            pid = self.get_pid_for_cwd(oldest)
-            if pid is not None:
-                return cwd_of_process(pid) or None
-        return None
+        return self.cached_foreground_data('cwd', oldest, lambda pid: cwd_of_process(pid) or None)
 
     def get_foreground_exe(self, oldest: bool = False) -> Optional[str]:
-        with suppress(Exception):
-            pid = self.get_pid_for_cwd(oldest)
-            if pid is not None:
-                c = cmdline_of_pid(pid)
-                if c:
-                    return c[0]
-        return None
+
+        def exe(pid: int) -> Optional[str]:
+            c = cmdline_of_pid(pid)
+            return c[0] if c else None
+
+        return self.cached_foreground_data('exe', oldest, exe)
 
     @property
     def foreground_cwd(self) -> Optional[str]:
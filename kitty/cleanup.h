@@ -18,6 +18,7 @@ typedef enum {
     PNG_READER_CLEANUP_FUNC,
     FONTCONFIG_CLEANUP_FUNC,
     SYSTEMD_CLEANUP_FUNC,
+    GRAPHICS_CLEANUP_FUNC,
 
     NUM_CLEANUP_FUNCS
 } AtExitCleanupFunc;
@@ -1005,6 +1005,12 @@ def options_spec() -> str:
 present in the main font.
 
 
+--debug-startup
+type=bool-set
+Print out the time taken by the various stages of startup, up to the rendering
+of the first frame, and the time taken to import individual Python modules.
+
+
 --watcher
 completion=type:file ext:py relative:conf group:"Watcher files"
 This option is deprecated in favor of the :opt:`watcher` option in
@@ -1082,12 +1088,12 @@ def create_opts(args: CLIOptions, accumulate_bad_lines: Optional[List[BadLineTyp
     from .config import load_config
     config = default_config_paths(args.config)
     overrides = map(parse_override, args.override or ())
-    opts = load_config(*config, overrides=overrides, accumulate_bad_lines=accumulate_bad_lines)
+    opts = load_config(*config, overrides=overrides, accumulate_bad_lines=accumulate_bad_lines, use_cache=True)
     return opts
 
 
 def create_default_opts() -> KittyOpts:
     from .config import load_config
     config = default_config_paths(())
-    opts = load_config(*config)
+    opts = load_config(*config, use_cache=True)
     return opts
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # License: GPL v3 Copyright: 2018, Kovid Goyal <kovid at kovidgoyal.net>
 
+import io
 import os
 import re
 import sys
@@ -171,6 +172,85 @@ def set_file(self, file: str) -> Iterator['CurrentlyParsing']:
 
 
 currently_parsing = CurrentlyParsing()
+FileSignature = Optional[Tuple[int, int, int]]
+
+
+def file_signature(path: str) -> FileSignature:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def glob_include(base_path_for_includes: str, pattern: str) -> Tuple[str, ...]:
+    from pathlib import Path
+    return tuple(map(lambda x: str(os.fspath(x)), sorted(Path(base_path_for_includes).glob(pattern))))
+
+
+def env_include(pattern: str) -> Tuple[Tuple[str, str], ...]:
+    from fnmatch import fnmatchcase
+    return tuple((k, v) for k, v in os.environ.items() if fnmatchcase(k, pattern))
+
+
+def read_include_file(path: str) -> Union[str, OSError]:
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except OSError as err:
+        return err
+
+
+def read_include_files(paths: Sequence[str]) -> Iterator[Tuple[str, Union[str, OSError]]]:
+    # Files matched by globinclude are independent of each other, so read them
+    # concurrently, parsing each one as soon as it and all the files before it
+    # are available
+    if len(paths) < 4:
+        for path in paths:
+            yield path, read_include_file(path)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(8, len(paths)), thread_name_prefix='KittyConfigInclude') as pool:
+        yield from zip(paths, pool.map(read_include_file, paths))
+
+
+class ConfigDependencies:
+    ''' Everything the result of parsing a set of config files depends on,
+    used to cheaply check if a previously parsed result is still valid. '''
+
+    def __init__(self) -> None:
+        self.files: Dict[str, FileSignature] = {}
+        self.globs: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        self.env_includes: Dict[str, Tuple[Tuple[str, str], ...]] = {}
+
+    def add_file(self, path: str) -> None:
+        if path not in self.files:
+            self.files[path] = file_signature(path)
+
+    def is_current(self) -> bool:
+        for path, sig in self.files.items():
+            if file_signature(path) != sig:
+                return False
+        for (base, pattern), matches in self.globs.items():
+            if glob_include(base, pattern) != matches:
+                return False
+        for pattern, vals in self.env_includes.items():
+            if env_include(pattern) != vals:
+                return False
+        return True
+
+
+config_dependencies: Optional[ConfigDependencies] = None
+
+
+@contextmanager
+def track_config_dependencies() -> Iterator[ConfigDependencies]:
+    global config_dependencies
+    orig, config_dependencies = config_dependencies, ConfigDependencies()
+    try:
+        yield config_dependencies
+    finally:
+        config_dependencies = orig
 
 
 @run_once
@@ -212,39 +292,43 @@ def parse_line(
     if key in ('include', 'globinclude', 'envinclude'):
         val = expandvars(os.path.expanduser(val.strip()), {'KITTY_OS': os_name()})
         if key == 'globinclude':
-            from pathlib import Path
-            vals = tuple(map(lambda x: str(os.fspath(x)), sorted(Path(base_path_for_includes).glob(val))))
+            vals = glob_include(base_path_for_includes, val)
+            if config_dependencies is not None:
+                config_dependencies.globs[(base_path_for_includes, val)] = vals
         elif key == 'envinclude':
-            from fnmatch import fnmatchcase
-            for x in os.environ:
-                if fnmatchcase(x, val):
-                    with currently_parsing.set_file(f'<env var: {x}>'):
-                        _parse(
-                            NamedLineIterator(os.path.join(base_path_for_includes, ''), iter(os.environ[x].splitlines())),
-                            parse_conf_item,
-                            ans,
-                            accumulate_bad_lines
-                        )
+            env_vals = env_include(val)
+            if config_dependencies is not None:
+                config_dependencies.env_includes[val] = env_vals
+            for x, env_val in env_vals:
+                with currently_parsing.set_file(f'<env var: {x}>'):
+                    _parse(
+                        NamedLineIterator(os.path.join(base_path_for_includes, ''), iter(env_val.splitlines())),
+                        parse_conf_item,
+                        ans,
+                        accumulate_bad_lines
+                    )
             return
         else:
             if not os.path.isabs(val):
                 val = os.path.join(base_path_for_includes, val)
             vals = (val,)
-        for val in vals:
-            try:
-                with open(val, encoding='utf-8', errors='replace') as include:
-                    with currently_parsing.set_file(val):
-                        _parse(include, parse_conf_item, ans, accumulate_bad_lines)
-            except FileNotFoundError:
+        if config_dependencies is not None:
+            for val in vals:
+                config_dependencies.add_file(val)
+        for val, data in read_include_files(vals):
+            if isinstance(data, FileNotFoundError):
                 log_error(
                     'Could not find included config file: {}, ignoring'.
                     format(val)
                 )
-            except OSError:
+            elif isinstance(data, OSError):
                 log_error(
                     'Could not read from included config file: {}, ignoring'.
                     format(val)
                 )
+            else:
+                with currently_parsing.set_file(val):
+                    _parse(NamedLineIterator(val, iter(io.StringIO(data))), parse_conf_item, ans, accumulate_bad_lines)
         return
     if not parse_conf_item(key, val, ans):
         log_error(f'Ignoring unknown config key: {key}')
@@ -347,6 +431,8 @@ def load_config(
             with currently_parsing.set_file(path):
                 vals = parse_config(sys.stdin)
         else:
+            if config_dependencies is not None:
+                config_dependencies.add_file(path)
             try:
                 with open(path, encoding='utf-8', errors='replace') as f:
                     with currently_parsing.set_file(path):
@@ -5,16 +5,27 @@
 import os
 from contextlib import contextmanager, suppress
 from functools import partial
-from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple
+from typing import Any, Dict, FrozenSet, Generator, Iterable, List, Optional, Set, Tuple, get_args
 
-from .conf.utils import BadLine, parse_config_base
+from .conf.utils import BadLine, ConfigDependencies, file_signature, parse_config_base, track_config_dependencies
 from .conf.utils import load_config as _load_config
 from .constants import cache_dir, defconf
+from .fast_data_types import GLFW_MOD_KITTY, Color, SingleKey
 from .options.types import Options, defaults, option_names
 from .options.utils import KeyboardMode, KeyboardModeMap, KeyDefinition, MouseMap, MouseMapping, build_action_aliases
+from .types import run_once
 from .typing import TypedDict
 from .utils import log_error
 
+# Environment variables that change between otherwise identical kitty
+# invocations and that do not affect the result of parsing the config
+VOLATILE_ENV_VARS = frozenset((
+    '_', 'PWD', 'OLDPWD', 'SHLVL', 'WINDOWID', 'KITTY_PID', 'KITTY_WINDOW_ID', 'KITTY_LISTEN_ON',
+    'KITTY_PUBLIC_KEY', 'KITTY_STDIO_FORWARDED', 'DESKTOP_STARTUP_ID', 'XDG_ACTIVATION_TOKEN',
+    'INVOCATION_ID', 'JOURNAL_STREAM', 'SSH_AUTH_SOCK', 'SSH_AGENT_PID', 'SSH_CLIENT', 'SSH_CONNECTION', 'SSH_TTY',
+))
+MAX_COMPILED_CONFIGS = 16
+
 
 def option_names_for_completion() -> Tuple[str, ...]:
     return option_names
@@ -160,10 +171,130 @@ def parse_config(lines: Iterable[str], accumulate_bad_lines: Optional[List[BadLi
     return ans
 
 
-def load_config(*paths: str, overrides: Optional[Iterable[str]] = None, accumulate_bad_lines: Optional[List[BadLine]] = None) -> Options:
-    from .options.parse import merge_result_dicts
+def _unpickle_single_key(mods: int, is_native: bool, key: int, defined_with_kitty_mod: bool) -> SingleKey:
+    if defined_with_kitty_mod:
+        return SingleKey(mods=GLFW_MOD_KITTY, is_native=is_native, key=key).resolve_kitty_mod(mods)
+    return SingleKey(mods=mods, is_native=is_native, key=key)
+
+
+def _pickle_single_key(k: SingleKey) -> Tuple[Any, Tuple[int, bool, int, bool]]:
+    return _unpickle_single_key, (k.mods, k.is_native, k.key, k.defined_with_kitty_mod)
+
+
+def _pickle_color(c: Color) -> Tuple[Any, Tuple[int, int, int, int]]:
+    return Color, (c.red, c.green, c.blue, c.alpha)
+
+
+@run_once
+def register_pickle_reducers() -> None:
+    import copyreg
+    copyreg.pickle(SingleKey, _pickle_single_key)
+    copyreg.pickle(Color, _pickle_color)
+
+
+def compiled_config_path(paths: Tuple[str, ...], overrides: Tuple[str, ...]) -> str:
+    from hashlib import sha256
+
+    from . import fast_data_types
+    from .constants import config_dir, str_version
+    code_signature = (
+        str_version, file_signature(getattr(fast_data_types, '__file__', '')),
+        file_signature(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'options', 'parse.py')))
+    env = sorted((k, v) for k, v in os.environ.items() if k not in VOLATILE_ENV_VARS)
+    key = json.dumps([code_signature, config_dir, [os.path.abspath(p) for p in paths if p], overrides, env])
+    return os.path.join(cache_dir(), 'compiled-config', sha256(key.encode('utf-8', 'surrogateescape')).hexdigest() + '.pickle')
+
+
+def load_compiled_config(path: str) -> Optional[Options]:
+    import pickle
+    register_pickle_reducers()
+    try:
+        with open(path, 'rb') as f:
+            deps, opts = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as err:
+        log_error(f'Ignoring corrupted compiled config at {path} with error: {err}')
+        return None
+    if not isinstance(deps, ConfigDependencies) or not isinstance(opts, Options) or not deps.is_current():
+        return None
+    return opts
+
+
+def save_compiled_config(path: str, deps: ConfigDependencies, opts: Options) -> None:
+    import pickle
+    register_pickle_reducers()
+    try:
+        data = pickle.dumps((deps, opts), protocol=pickle.HIGHEST_PROTOCOL)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_save(data, path)
+    except Exception as err:
+        log_error(f'Failed to save compiled config to {path} with error: {err}')
+        return
+    with suppress(OSError):
+        base = os.path.dirname(path)
+        entries = sorted((e for e in os.scandir(base) if e.name.endswith('.pickle')), key=lambda e: e.stat().st_mtime, reverse=True)
+        for e in entries[MAX_COMPILED_CONFIGS:]:
+            os.remove(e.path)
+
+
+@contextmanager
+def recording_error_logging(errors: List[str]) -> Generator[None, None, None]:
+    from .fast_data_types import log_error_string
+    before = getattr(log_error, 'redirect', None)
+    output = before or log_error_string
+
+    def redirect(msg: str) -> None:
+        errors.append(msg)
+        output(msg)
+
+    setattr(log_error, 'redirect', redirect)
+    try:
+        yield
+    finally:
+        if before is None:
+            delattr(log_error, 'redirect')
+        else:
+            setattr(log_error, 'redirect', before)
 
+
+def load_config(
+    *paths: str, overrides: Optional[Iterable[str]] = None, accumulate_bad_lines: Optional[List[BadLine]] = None, use_cache: bool = False
+) -> Options:
     overrides = tuple(overrides) if overrides is not None else ()
+    cpath = ''
+    if use_cache and '-' not in paths:
+        try:
+            cpath = compiled_config_path(paths, overrides)
+        except OSError as err:
+            log_error(f'Failed to find the location for the compiled config with error: {err}')
+    if not cpath:
+        opts = _parse_and_finalize_config(paths, overrides, accumulate_bad_lines)
+    else:
+        # The finalized options are cached on disk along with the signatures
+        # of all the files they were read from, which are checked on every
+        # load, avoiding the expensive parsing of the config files at startup.
+        # Configs with errors are not cached so that the errors are reported
+        # on every load, whether they are logged or accumulated as bad lines.
+        cached = load_compiled_config(cpath)
+        if cached is None:
+            errors: List[str] = []
+            bad_lines = [] if accumulate_bad_lines is None else accumulate_bad_lines
+            num_bad_lines = len(bad_lines)
+            with track_config_dependencies() as deps, recording_error_logging(errors):
+                opts = _parse_and_finalize_config(paths, overrides, accumulate_bad_lines)
+            if not errors and len(bad_lines) == num_bad_lines:
+                save_compiled_config(cpath, deps, opts)
+        else:
+            opts = cached
+    opts.all_config_paths = paths
+    opts.config_overrides = overrides
+    return opts
+
+
+def _parse_and_finalize_config(paths: Tuple[str, ...], overrides: Tuple[str, ...], accumulate_bad_lines: Optional[List[BadLine]] = None) -> Options:
+    from .options.parse import merge_result_dicts
+
     opts_dict, found_paths = _load_config(
         defaults, partial(parse_config, accumulate_bad_lines=accumulate_bad_lines), merge_result_dicts, *paths, overrides=overrides)
     opts = Options(opts_dict)
@@ -181,11 +312,64 @@ def load_config(*paths: str, overrides: Optional[Iterable[str]] = None, accumula
         log_error('Cannot use both macos_titlebar_color and background_opacity')
         opts.macos_titlebar_color = 0
     opts.config_paths = found_paths
-    opts.all_config_paths = paths
-    opts.config_overrides = overrides
     return opts
 
 
+# Options whose changes require the fonts, and therefore all sprites, to be reloaded
+FONT_OPTIONS = frozenset((
+    'font_family', 'bold_font', 'italic_font', 'bold_italic_font', 'font_size', 'font_features', 'modify_font',
+    'symbol_map', 'narrow_symbols', 'box_drawing_scale', 'undercurl_style', 'force_ltr', 'disable_ligatures',
+    'macos_thicken_font', 'cursor_beam_thickness', 'cursor_underline_thickness',
+))
+# Options used by the shader programs or their uniforms, which are only re-read
+# when all GPU data is reloaded
+SHADER_OPTIONS = frozenset(('text_composition_strategy', 'text_fg_override_threshold', 'dim_opacity'))
+BACKGROUND_IMAGE_OPTIONS = frozenset(('background_image', 'background_image_layout', 'background_image_linear'))
+KEY_OPTIONS = frozenset(('kitty_mod', 'clear_all_shortcuts', 'clear_all_mouse_actions'))
+LAYOUT_OPTIONS = frozenset(('enabled_layouts', 'draw_minimal_borders', 'placement_strategy'))
+TAB_BAR_PREFIXES = ('tab_', 'active_tab_', 'inactive_tab_', 'bell_on_tab')
+COLOR_OPTIONS = frozenset((
+    'background_opacity', 'dynamic_background_opacity', 'background_tint', 'background_tint_gaps',
+    'inactive_text_alpha',
+))
+
+
+def option_category(name: str) -> str:
+    if name in FONT_OPTIONS:
+        return 'fonts'
+    if name in KEY_OPTIONS:
+        return 'keys'
+    if name in SHADER_OPTIONS:
+        return 'shaders'
+    if name in BACKGROUND_IMAGE_OPTIONS:
+        return 'background_image'
+    if name.startswith(TAB_BAR_PREFIXES):
+        return 'tab_bar'
+    if name in LAYOUT_OPTIONS or (name.startswith(('window_', 'single_window_')) and not name.startswith('window_logo_')):
+        return 'layout'
+    ann = Options.__annotations__.get(name)
+    if name in COLOR_OPTIONS or ann is Color or Color in get_args(ann) or (name.startswith('color') and name[5:].isdigit()):
+        return 'colors'
+    return 'other'
+
+
+def keymap_signature(opts: Options) -> Tuple[Any, ...]:
+    return (
+        tuple((name, m.on_unknown, m.on_action, tuple((k, repr(v)) for k, v in m.keymap.items())) for name, m in opts.keyboard_modes.items()),
+        opts.mousemap, opts.alias_map.aliases,
+    )
+
+
+def changed_option_categories(old: Options, new: Options) -> FrozenSet[str]:
+    ''' Classify the options that differ between old and new by the subsystem
+    that has to be updated to apply them, one of: fonts, keys, shaders,
+    background_image, tab_bar, layout, colors or other '''
+    ans: Set[str] = {option_category(name) for name in option_names if getattr(old, name) != getattr(new, name)}
+    if 'keys' not in ans and keymap_signature(old) != keymap_signature(new):
+        ans.add('keys')
+    return frozenset(ans)
+
+
 class KittyCommonOpts(TypedDict):
     select_by_word_characters: str
     open_url_with: List[str]
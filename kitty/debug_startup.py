@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# License: GPL v3 Copyright: 2024, Kovid Goyal <kovid at kovidgoyal.net>
+
+# Profiling of kitty startup, enabled by --debug-startup. This module must
+# import nothing from kitty as it is used to time those imports.
+
+import builtins
+import sys
+import time
+from typing import Any, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+
+class ImportRecord(NamedTuple):
+    name: str
+    self_time: float
+    cumulative_time: float
+    depth: int
+
+
+def resolve_name(name: str, globals: Optional[Mapping[str, object]], level: int) -> str:
+    if not level or not globals:
+        return name
+    package = str(globals.get('__package__') or globals.get('__name__', ''))
+    base = package.rsplit('.', level - 1)[0] if level > 1 else package
+    return f'{base}.{name}' if name else base
+
+
+class StartupProfiler:
+
+    def __init__(self) -> None:
+        self.start_time = time.monotonic()
+        self.imports: List[ImportRecord] = []
+        self.milestones: List[Tuple[str, float]] = []
+        # time spent in recorded imports made by each import currently in progress
+        self.child_times: List[float] = []
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+
+    def stop(self) -> None:
+        if builtins.__import__ == self.timed_import:
+            builtins.__import__ = self.original_import
+
+    def timed_import(
+        self, name: str, globals: Optional[Mapping[str, object]] = None, locals: Optional[Mapping[str, object]] = None,
+        fromlist: Optional[Sequence[str]] = (), level: int = 0
+    ) -> Any:
+        num_modules = len(sys.modules)
+        q = resolve_name(name, globals, level)
+        preexisting = q in sys.modules
+        self.child_times.append(0.)
+        st = time.monotonic()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.monotonic() - st
+            children = self.child_times.pop()
+            if len(sys.modules) > num_modules:
+                # only imports that actually loaded new modules are recorded
+                if fromlist and preexisting:
+                    q = f'{q}.{{{",".join(fromlist)}}}'
+                self.imports.append(ImportRecord(q, elapsed - children, elapsed, len(self.child_times)))
+                if self.child_times:
+                    self.child_times[-1] += elapsed
+
+    def milestone(self, name: str) -> None:
+        self.milestones.append((name, time.monotonic() - self.start_time))
+
+    def report(self, num_slowest: int = 25) -> str:
+        lines = ['Startup profile (times in milliseconds since the start of kitty):']
+        for name, at in self.milestones:
+            lines.append(f'  {at * 1000:9.1f}  {name}')
+        total = sum(r.cumulative_time for r in self.imports if r.depth == 0)
+        lines.append(f'Imported {len(sys.modules)} modules, top level imports took: {total * 1000:.1f} ms')
+        lines.append(f'The {num_slowest} slowest imports (self time, cumulative time):')
+        for r in sorted(self.imports, key=lambda r: r.self_time, reverse=True)[:num_slowest]:
+            lines.append(f'  {r.self_time * 1000:9.1f}  {r.cumulative_time * 1000:9.1f}  {r.name}')
+        return '\n'.join(lines)
+
+
+profiler: Optional[StartupProfiler] = None
+enabled = False
+
+
+def start_profiling_startup() -> None:
+    global profiler, enabled
+    enabled = True
+    if profiler is None:
+        profiler = StartupProfiler()
+
+
+def startup_milestone(name: str) -> None:
+    if profiler is not None:
+        profiler.milestone(name)
+
+
+def debug_startup_event(msg: str) -> None:
+    # For work done in the background during startup that can finish after the
+    # first frame, such as moving children into systemd scopes. Can be called
+    # from any thread.
+    if not enabled:
+        return
+    p = profiler
+    if p is not None:
+        p.milestone(msg)
+    else:
+        print(f'[{time.monotonic():.3f}] {msg}', file=sys.stderr, flush=True)
+
+
+def finish_profiling_startup(report: bool = True) -> None:
+    global profiler
+    if profiler is not None:
+        p, profiler = profiler, None
+        p.stop()
+        p.milestone('First frame rendered')
+        if report:
+            print(p.report(), file=sys.stderr, flush=True)
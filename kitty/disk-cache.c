@@ -6,6 +6,8 @@
  */
 
 #define MAX_KEY_SIZE 16u
+// Data smaller than this is not worth compressing
+#define MIN_COMPRESS_SIZE 4096u
 
 #include "disk-cache.h"
 #include "safe-wrappers.h"
@@ -20,14 +22,17 @@
 #include <sys/stat.h>
 #include <fcntl.h>
 #include <time.h>
+#include <zlib.h>
 
 
 typedef struct {
     void *hash_key;
     uint8_t *data;
-    size_t data_sz;
+    // data_sz is the size of the uncompressed data, stored_sz the size of
+    // the data in the cache file, which is smaller if it is compressed
+    size_t data_sz, stored_sz;
     unsigned short hash_keylen;
-    bool written_to_disk;
+    bool written_to_disk, is_compressed, is_encoded;
     off_t pos_in_cache_file;
     uint8_t encryption_key[64];
     UT_hash_handle hh;
@@ -50,11 +55,11 @@ typedef struct {
     Py_ssize_t small_hole_threshold;
     pthread_mutex_t lock;
     pthread_t write_thread;
-    bool thread_started, lock_inited, loop_data_inited, shutting_down, fully_initialized;
+    bool thread_started, lock_inited, loop_data_inited, shutting_down, fully_initialized, compress;
     LoopData loop_data;
     CacheEntry *entries, currently_writing;
     Holes holes;
-    unsigned long long total_size;
+    unsigned long long total_size, stored_size;
 } DiskCache;
 
 void
@@ -73,6 +78,7 @@ new_diskcache_object(PyTypeObject *type, PyObject UNUSED *args, PyObject UNUSED
     if (self) {
         self->cache_file_fd = -1;
         self->small_hole_threshold = 512;
+        self->compress = true;
     }
     return (PyObject*) self;
 }
@@ -152,12 +158,12 @@ defrag(DiskCache *self) {
     size_t total_data_size = 0, num_entries_to_defrag = 0;
     CacheEntry *tmp, *s;
     HASH_ITER(hh, self->entries, s, tmp) {
-        if (s->pos_in_cache_file > -1 && s->data_sz) {
-            total_data_size += s->data_sz;
+        if (s->pos_in_cache_file > -1 && s->stored_sz) {
+            total_data_size += s->stored_sz;
             DefragEntry *e = defrag_entries + num_entries_to_defrag++;
             e->hash_keylen = s->hash_keylen;
             e->old_offset = s->pos_in_cache_file;
-            e->data_sz = s->data_sz;
+            e->data_sz = s->stored_sz;
             if (s->hash_key) memcpy(e->hash_key, s->hash_key, s->hash_keylen);
         }
     }
@@ -229,7 +235,7 @@ find_hole_to_use(DiskCache *self, const off_t required_sz) {
 static inline bool
 needs_defrag(DiskCache *self) {
     off_t size_on_disk = size_of_cache_file(self);
-    return self->total_size && size_on_disk > 0 && (size_t)size_on_disk > self->total_size * 2;
+    return self->stored_size && size_on_disk > 0 && (size_t)size_on_disk > self->stored_size * 2;
 }
 
 static void
@@ -258,10 +264,12 @@ static void
 remove_from_disk(DiskCache *self, CacheEntry *s) {
     if (s->written_to_disk) {
         s->written_to_disk = false;
-        if (s->data_sz && s->pos_in_cache_file > -1) {
-            add_hole(self, s->pos_in_cache_file, s->data_sz);
+        if (s->stored_sz && s->pos_in_cache_file > -1) {
+            add_hole(self, s->pos_in_cache_file, s->stored_sz);
             s->pos_in_cache_file = -1;
         }
+        self->stored_size -= MIN(self->stored_size, s->stored_sz);
+        s->stored_sz = 0; s->is_compressed = false;
     }
 }
 
@@ -276,24 +284,58 @@ find_cache_entry_to_write(DiskCache *self) {
                 self->currently_writing.data = s->data;
                 s->data = NULL;
                 self->currently_writing.data_sz = s->data_sz;
+                self->currently_writing.stored_sz = s->data_sz;
                 self->currently_writing.pos_in_cache_file = -1;
-                xor_data64(s->encryption_key, self->currently_writing.data, s->data_sz);
+                self->currently_writing.is_compressed = false;
+                // the data is encrypted by encode_currently_writing() after
+                // it has been compressed, outside the lock
+                self->currently_writing.is_encoded = false;
+                memcpy(self->currently_writing.encryption_key, s->encryption_key, sizeof(s->encryption_key));
                 self->currently_writing.hash_keylen = MIN(s->hash_keylen, MAX_KEY_SIZE);
                 memcpy(self->currently_writing.hash_key, s->hash_key, self->currently_writing.hash_keylen);
-                find_hole_to_use(self, self->currently_writing.data_sz);
                 return true;
             }
             s->written_to_disk = true;
             s->pos_in_cache_file = 0;
-            s->data_sz = 0;
+            s->data_sz = 0; s->stored_sz = 0;
         }
     }
     return false;
 }
 
+static uint8_t*
+compress_currently_writing(const DiskCache *self, size_t *compressed_sz) {
+    // Called without the lock, currently_writing.data is only read here and
+    // in read_from_disk_cache() until encode_currently_writing() is called
+    const size_t sz = self->currently_writing.data_sz;
+    if (!self->compress || sz < MIN_COMPRESS_SIZE) return NULL;
+    uLongf dest_sz = compressBound(sz);
+    uint8_t *ans = malloc(dest_sz);
+    if (!ans) return NULL;
+    // Only keep the compressed data if it saves at least an eighth of the space
+    if (compress2(ans, &dest_sz, self->currently_writing.data, sz, Z_BEST_SPEED) != Z_OK || dest_sz > sz - sz / 8) {
+        free(ans); return NULL;
+    }
+    *compressed_sz = dest_sz;
+    return ans;
+}
+
+static void
+encode_currently_writing(DiskCache *self, uint8_t *compressed, size_t compressed_sz) {
+    if (compressed) {
+        free(self->currently_writing.data);
+        self->currently_writing.data = compressed;
+        self->currently_writing.stored_sz = compressed_sz;
+        self->currently_writing.is_compressed = true;
+    }
+    xor_data64(self->currently_writing.encryption_key, self->currently_writing.data, self->currently_writing.stored_sz);
+    self->currently_writing.is_encoded = true;
+    find_hole_to_use(self, self->currently_writing.stored_sz);
+}
+
 static bool
 write_dirty_entry(DiskCache *self) {
-    size_t left = self->currently_writing.data_sz;
+    size_t left = self->currently_writing.stored_sz;
     uint8_t *p = self->currently_writing.data;
     if (self->currently_writing.pos_in_cache_file < 0) {
         self->currently_writing.pos_in_cache_file = size_of_cache_file(self);
@@ -330,10 +372,14 @@ retire_currently_writing(DiskCache *self) {
     if (s) {
         s->written_to_disk = true;
         s->pos_in_cache_file = self->currently_writing.pos_in_cache_file;
+        s->stored_sz = self->currently_writing.stored_sz;
+        s->is_compressed = self->currently_writing.is_compressed;
+        self->stored_size += s->stored_sz;
     }
     free(self->currently_writing.data);
     self->currently_writing.data = NULL;
-    self->currently_writing.data_sz = 0;
+    self->currently_writing.data_sz = 0; self->currently_writing.stored_sz = 0;
+    self->currently_writing.is_encoded = false;
 }
 
 static void*
@@ -351,6 +397,11 @@ write_loop(void *data) {
         size_t count = HASH_COUNT(self->entries);
         mutex(unlock);
         if (found_dirty_entry) {
+            size_t compressed_sz = 0;
+            uint8_t *compressed = compress_currently_writing(self, &compressed_sz);
+            mutex(lock);
+            encode_currently_writing(self, compressed, compressed_sz);
+            mutex(unlock);
             write_dirty_entry(self);
             mutex(lock);
             retire_currently_writing(self);
@@ -359,7 +410,12 @@ write_loop(void *data) {
         } else if (!count) {
             mutex(lock);
             if (self->cache_file_fd > -1) {
-                if (ftruncate(self->cache_file_fd, 0) == 0) lseek(self->cache_file_fd, 0, SEEK_END);
+                if (ftruncate(self->cache_file_fd, 0) == 0) {
+                    lseek(self->cache_file_fd, 0, SEEK_END);
+                    // the holes no longer exist, leaving them would cause
+                    // data appended to the file to be overwritten
+                    self->holes.count = 0; self->holes.largest_hole_size = 0;
+                }
             }
             mutex(unlock);
         }
@@ -545,7 +601,7 @@ clear_disk_cache(PyObject *self_) {
         HASH_DEL(self->entries, s);
         free_cache_entry(s);
     }
-    self->total_size = 0;
+    self->total_size = 0; self->stored_size = 0;
     self->holes.count = 0;
     self->holes.largest_hole_size = 0;
     if (self->cache_file_fd > -1) add_hole(self, 0, size_of_cache_file(self));
@@ -576,15 +632,30 @@ read_from_cache_file(const DiskCache *self, off_t pos, size_t sz, void *dest) {
     }
 }
 
+static void
+decode_stored_data(const CacheEntry *s, uint8_t *stored, size_t stored_sz, bool is_compressed, void *dest) {
+    xor_data64(s->encryption_key, stored, stored_sz);
+    if (!is_compressed) return;
+    uLongf sz = s->data_sz;
+    if (uncompress(dest, &sz, stored, stored_sz) != Z_OK || sz != s->data_sz) PyErr_SetString(PyExc_OSError, "Disk cache entry is corrupted");
+}
+
 static void
 read_from_cache_entry(const DiskCache *self, const CacheEntry *s, void *dest) {
-    size_t sz = s->data_sz;
     off_t pos = s->pos_in_cache_file;
     if (pos < 0) {
         PyErr_SetString(PyExc_OSError, "Cache entry was not written, could not read from it");
         return;
     }
-    read_from_cache_file(self, pos, sz, dest);
+    if (!s->is_compressed) {
+        read_from_cache_file(self, pos, s->stored_sz, dest);
+        if (!PyErr_Occurred()) decode_stored_data(s, dest, s->stored_sz, false, dest);
+        return;
+    }
+    RAII_ALLOC(uint8_t, stored, malloc(s->stored_sz));
+    if (!stored) { PyErr_NoMemory(); return; }
+    read_from_cache_file(self, pos, s->stored_sz, stored);
+    if (!PyErr_Occurred()) decode_stored_data(s, stored, s->stored_sz, true, dest);
 }
 
 void*
@@ -603,13 +674,20 @@ read_from_disk_cache(PyObject *self_, const void *key, size_t key_sz, void*(allo
 
     if (s->data) { memcpy(data, s->data, s->data_sz); }
     else if (self->currently_writing.data && self->currently_writing.hash_key && self->currently_writing.hash_keylen == key_sz && memcmp(self->currently_writing.hash_key, key, key_sz) == 0) {
-        memcpy(data, self->currently_writing.data, s->data_sz);
-        xor_data64(s->encryption_key, data, s->data_sz);
-    }
-    else {
-        read_from_cache_entry(self, s, data);
-        xor_data64(s->encryption_key, data, s->data_sz);
+        const CacheEntry *cw = &self->currently_writing;
+        if (!cw->is_encoded) memcpy(data, cw->data, s->data_sz);
+        else if (!cw->is_compressed) {
+            memcpy(data, cw->data, s->data_sz);
+            decode_stored_data(s, data, s->data_sz, false, data);
+        } else {
+            uint8_t *stored = malloc(cw->stored_sz);
+            if (!stored) { PyErr_NoMemory(); goto end; }
+            memcpy(stored, cw->data, cw->stored_sz);
+            decode_stored_data(s, stored, cw->stored_sz, true, data);
+            free(stored);
+        }
     }
+    else read_from_cache_entry(self, s, data);
     if (store_in_ram && !s->data && s->data_sz) {
         void *copy = malloc(s->data_sz);
         if (copy) {
@@ -810,6 +888,7 @@ static PyMethodDef methods[] = {
 static PyMemberDef members[] = {
     {"total_size", T_ULONGLONG, offsetof(DiskCache, total_size), READONLY, "total_size"},
     {"small_hole_threshold", T_PYSSIZET, offsetof(DiskCache, small_hole_threshold), 0, "small_hole_threshold"},
+    {"compress", T_BOOL, offsetof(DiskCache, compress), 0, "compress"},
     {NULL},
 };
 
@@ -191,6 +191,9 @@ def main() -> None:
         if first_arg.startswith('+'):
             namespaced(['+', first_arg[1:]] + sys.argv[2:])
         else:
+            if '--debug-startup' in sys.argv:
+                from kitty.debug_startup import start_profiling_startup
+                start_profiling_startup()
             from kitty.main import main as kitty_main
             kitty_main()
     else:
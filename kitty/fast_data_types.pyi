@@ -4,6 +4,7 @@ from typing import Any, Callable, Dict, Iterator, List, NewType, Optional, Tuple
 
 from kitty.boss import Boss
 from kitty.fonts import FontFeature
+from kitty.fonts.fallback_cache import FallbackFontCache
 from kitty.fonts.render import FontObject
 from kitty.marks import MarkerFunc
 from kitty.options.types import Options
@@ -418,6 +419,10 @@ def fc_match_postscript_name(
     pass
 
 
+def set_fallback_font_cache(cache: Optional[FallbackFontCache]) -> None:
+    pass
+
+
 class CoreTextFont(TypedDict):
     path: str
     postscript_name: str
@@ -454,6 +459,10 @@ def monitor_pid(pid: int) -> None:
     pass
 
 
+def schedule_main_thread_jobs() -> None:
+    pass
+
+
 def add_window(os_window_id: int, tab_id: int, title: str) -> int:
     pass
 
@@ -736,6 +745,7 @@ def patch_color_profiles(
 
 
 def create_canvas(d: bytes, w: int, x: int, y: int, cw: int, ch: int, bpp: int) -> bytes: ...
+def resize_image_data(data: Union[bytes, bytearray, memoryview], width: int, height: int, new_width: int, new_height: int, bytes_per_pixel: int) -> bytes: ...
 
 
 def os_window_font_size(
@@ -1088,6 +1098,9 @@ class Screen:
     def cursor_at_prompt(self) -> bool:
         pass
 
+    def graphics_usage(self) -> Dict[str, int]:
+        pass
+
     def ignore_bells_for(self, duration: float = 1) -> None:
         pass
 
@@ -1127,6 +1140,9 @@ class Screen:
     def send_escape_code_to_child(self, code: int, text: Union[str, bytes, Tuple[Union[str, bytes], ...]]) -> bool:
         pass
 
+    def write_buffer_credit(self, window: int, resume_below: int) -> int:
+        pass
+
     def reset_callbacks(self) -> None:
         pass
 
@@ -1272,6 +1288,9 @@ class ChildMonitor:
     def add_child(self, id: int, pid: int, fd: int, screen: Screen) -> None:
         pass
 
+    def set_child_pid(self, id: int, pid: int) -> bool:
+        pass
+
     def mark_for_close(self, window_id: int) -> bool:
         pass
 
@@ -1584,3 +1603,4 @@ def monotonic() -> float: ...
 def timed_debug_print(x: str) -> None: ...
 def opengl_version_string() -> str: ...
 def systemd_move_pid_into_new_scope(pid: int, scope_name: str, description: str) -> str: ...
+def systemd_move_pids_into_new_scopes(items: Tuple[Tuple[int, str, str], ...]) -> Tuple[Optional[str], ...]: ...
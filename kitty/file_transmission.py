@@ -17,9 +17,9 @@
 from gettext import gettext as _
 from itertools import count
 from time import time_ns
-from typing import IO, Any, Callable, DefaultDict, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from typing import IO, Any, Callable, DefaultDict, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-from kittens.transfer.utils import IdentityCompressor, ZlibCompressor, abspath, expand_home, home_path
+from kittens.transfer.utils import IdentityCompressor, ZlibCompressor, ZstdCompressor, abspath, expand_home, home_path, is_compressible, zstd_supported
 from kitty.fast_data_types import ESC_OSC, FILE_TRANSFER_CODE, AES256GCMDecrypt, add_timer, base64_decode, base64_encode, get_boss, get_options, monotonic
 from kitty.types import run_once
 
@@ -27,6 +27,13 @@
 
 EXPIRE_TIME = 10  # minutes
 MAX_ACTIVE_RECEIVES = MAX_ACTIVE_SENDS = 10
+# Sending file data to the child pauses when this many bytes are waiting to be
+# read by it and resumes when the I/O thread reports that it has read all but
+# RESUME_SENDS_BELOW bytes. Reading from disk stays up to a window ahead.
+SEND_WINDOW = 4 * 1024 * 1024
+RESUME_SENDS_BELOW = 1024 * 1024
+SEND_BATCH_SIZE = 256 * 1024
+SIGNATURE_BATCH_SIZE = 64 * 1024
 ftc_prefix = str(FILE_TRANSFER_CODE)
 
 
@@ -178,6 +185,7 @@ class Action(NameReprEnum):
 class Compression(NameReprEnum):
     zlib = auto()
     none = auto()
+    zstd = auto()
 
 
 class FileType(NameReprEnum):
@@ -213,6 +221,7 @@ def __init__(
         name: str = '',
         size: int = -1,
         ttype: TransmissionType = TransmissionType.simple,
+        compression: Compression = Compression.none,
     ) -> None:
         super().__init__(msg)
         self.transmit = transmit
@@ -222,13 +231,15 @@ def __init__(
         self.name = name
         self.size = size
         self.ttype = ttype
+        self.compression = compression
 
     def as_ftc(self, request_id: str) -> 'FileTransmissionCommand':
         name = self.code if isinstance(self.code, str) else self.code.name
         if self.human_msg:
             name += ':' + self.human_msg
         return FileTransmissionCommand(
-            action=Action.status, id=request_id, file_id=self.file_id, status=name, name=self.name, size=self.size, ttype=self.ttype
+            action=Action.status, id=request_id, file_id=self.file_id, status=name, name=self.name, size=self.size, ttype=self.ttype,
+            compression=self.compression,
         )
 
 
@@ -374,6 +385,77 @@ def __call__(self, data: bytes, is_last: bool = False) -> bytes:
         return ans
 
 
+class ZstdDecompressor:
+
+    def __init__(self) -> None:
+        from importlib import import_module
+        self.d = import_module('compression.zstd').ZstdDecompressor()
+
+    def __call__(self, data: bytes, is_last: bool = False) -> bytes:
+        ans: bytes = self.d.decompress(data)
+        return ans
+
+
+Compressor = Union[IdentityCompressor, ZlibCompressor, ZstdCompressor]
+Decompressor = Union[IdentityDecompressor, ZlibDecompressor, ZstdDecompressor]
+
+
+def compressor_for(compression: Compression, sample: bytes) -> Compressor:
+    if compression is Compression.none:
+        return IdentityCompressor()
+    # data that does not compress is still sent as a valid stream, but with the
+    # cheapest settings, so as not to waste CPU on it
+    compressible = is_compressible(sample)
+    if compression is Compression.zstd and zstd_supported():
+        return ZstdCompressor(3 if compressible else 1)
+    return ZlibCompressor(-1 if compressible else 0)
+
+
+def decompressor_for(compression: Compression) -> Decompressor:
+    if compression is Compression.zlib:
+        return ZlibDecompressor()
+    if compression is Compression.zstd:
+        return ZstdDecompressor()
+    return IdentityDecompressor()
+
+
+@dataclass
+class TransferStats:
+    started_at: float = 0
+    finished_at: float = 0
+    files: int = 0
+    uncompressed_bytes: int = 0
+    transmitted_bytes: int = 0
+
+    def add(self, transmitted: int, uncompressed: int, file_done: bool = False) -> None:
+        if not self.started_at:
+            self.started_at = monotonic()
+        self.transmitted_bytes += transmitted
+        self.uncompressed_bytes += uncompressed
+        self.files += int(file_done)
+
+    @property
+    def ratio(self) -> float:
+        return self.transmitted_bytes / self.uncompressed_bytes if self.uncompressed_bytes else 1.
+
+    @property
+    def throughput(self) -> float:
+        ' Uncompressed bytes per second '
+        duration = (self.finished_at or monotonic()) - self.started_at
+        return self.uncompressed_bytes / duration if self.started_at and duration > 0 else 0.
+
+    def __str__(self) -> str:
+        from kittens.tui.utils import human_size
+        return (f'{self.files} files, {human_size(self.uncompressed_bytes)} sent as {human_size(self.transmitted_bytes)}'
+                f' (ratio: {self.ratio:.2f}) at {human_size(int(self.throughput))}/s')
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'files': self.files, 'uncompressed_bytes': self.uncompressed_bytes, 'transmitted_bytes': self.transmitted_bytes,
+            'ratio': self.ratio, 'throughput': self.throughput, 'summary': str(self),
+        }
+
+
 class PatchFile:
 
     def __init__(self, path: str, expected_size: int):
@@ -460,7 +542,11 @@ def __init__(self, ftc: FileTransmissionCommand) -> None:
         self.ttype = ftc.ttype
         self.link_target = b''
         self.needs_data_sent = self.ttype is not TransmissionType.simple
-        self.decompressor: Union[ZlibDecompressor, IdentityDecompressor] = ZlibDecompressor() if ftc.compression is Compression.zlib else IdentityDecompressor()
+        self.requested_compression = self.compression = ftc.compression
+        if self.compression is Compression.zstd and not zstd_supported():
+            # the client is told to use zlib instead when the file is started
+            self.compression = Compression.zlib
+        self.decompressor = decompressor_for(self.compression)
         self.closed = self.ftype is FileType.directory
         self.actual_file: Union[PatchFile, IO[bytes], None] = None
         self.failed = False
@@ -597,6 +683,8 @@ def __init__(self, request_id: str, quiet: int, bypass: str) -> None:
         self.send_errors = quiet < 2
         self.pending_files_to_transmit_signature_of: Deque[Tuple[PatchFile, str]] = deque()
         self.signature_pending_chunks: Deque[FileTransmissionCommand] = deque()
+        self.reading_signature = False
+        self.stats = TransferStats()
 
     @property
     def is_expired(self) -> bool:
@@ -655,15 +743,19 @@ def __init__(self, ftc: FileTransmissionCommand):
         self.stat = os.stat(self.path, follow_symlinks=False)
         if stat.S_ISDIR(self.stat.st_mode):
             raise TransmissionError(ErrorCode.EINVAL, msg='Cannot send a directory', file_id=self.file_id)
-        self.compressor: Union[ZlibCompressor, IdentityCompressor] = IdentityCompressor()
+        # chosen based on the first chunk of data
+        self.compressor: Optional[Compressor] = None
+        self.compression = ftc.compression
+        # zstd is negotiated, the compression actually used is sent with the
+        # first data command for the file
+        self.announce_compression = self.compression is Compression.zstd
+        if self.compression is Compression.zstd and not zstd_supported():
+            self.compression = Compression.zlib
         self.target = b''
         self.open_file: Optional[io.BufferedReader] = None
         if stat.S_ISLNK(self.stat.st_mode):
             self.target = os.readlink(self.path).encode('utf-8')
-        else:
-            self.open_file = open(self.path, 'rb')
-            if ftc.compression is Compression.zlib:
-                self.compressor = ZlibCompressor()
+            self.compressor = IdentityCompressor()
         from kittens.transfer import rsync
         self.differ = rsync.Differ() if self.waiting_for_signature else None
         self.buf = bytearray()
@@ -683,11 +775,14 @@ def close(self) -> None:
             self.open_file = None
         self.differ = None
 
-    def next_chunk(self, sz: int = 1024 * 1024) -> Tuple[bytes, int]:
+    def next_chunk(self, sz: int = 256 * 1024) -> Tuple[bytes, int]:
         if self.target:
             self.transmitted = True
             data = self.target
         else:
+            if self.open_file is None and not stat.S_ISLNK(self.stat.st_mode):
+                # opened only when needed so that queued files do not use up file descriptors
+                self.open_file = open(self.path, 'rb')
             if self.open_file is None:
                 self.transmitted = True
                 data = b''
@@ -699,10 +794,13 @@ def next_chunk(self, sz: int = 1024 * 1024) -> Tuple[bytes, int]:
                 else:
                     self.write_pos = 0
                     has_more = self.differ.next_op(self.open_file.readinto, self.write)
-                    data = memoryview(self.buf)[:self.write_pos]
+                    # a copy as the previous chunk may not have been sent yet
+                    data = bytes(memoryview(self.buf)[:self.write_pos])
                     if not has_more:
                         self.transmitted = True
         uncompressed_sz = len(data)
+        if self.compressor is None:
+            self.compressor = compressor_for(self.compression, data)
         cchunk = self.compressor.compress(data)
         if self.transmitted and not isinstance(self.compressor, IdentityCompressor):
             cchunk += self.compressor.flush()
@@ -730,6 +828,9 @@ def __init__(self, request_id: str, quiet: int, bypass: str, num_of_args: int) -
         self.active_file: Optional[SourceFile] = None
         self.pending_chunks: Deque[FileTransmissionCommand] = deque()
         self.metadata_sent = False
+        self.reading = False
+        self.pending_bytes = 0
+        self.stats = TransferStats()
 
     @property
     def spec_complete(self) -> bool:
@@ -769,45 +870,163 @@ def close(self) -> None:
             self.active_file.close()
             self.active_file = None
 
-    def next_chunk(self) -> Optional[FileTransmissionCommand]:
+    def next_ready_file(self) -> Optional[SourceFile]:
+        for f in self.queued_files_map.values():
+            if f.ready_to_transmit:
+                return self.queued_files_map.pop(f.file_id)
+        return None
+
+    def read_chunks(self) -> List[FileTransmissionCommand]:
+        # Called in the I/O thread. Data from consecutive files is read till
+        # the batch is full, so that sending many small files does not need a
+        # round trip to the main thread for every file.
         self.last_activity_at = monotonic()
-        if self.pending_chunks:
-            return self.pending_chunks.popleft()
-        af = self.active_file
-        if af is None:
-            for f in self.queued_files_map.values():
-                if f.ready_to_transmit:
-                    self.active_file = af = f
-                    break
+        ans: List[FileTransmissionCommand] = []
+        budget = SEND_BATCH_SIZE
+        while budget > 0:
+            af = self.active_file
             if af is None:
-                return None
-            self.queued_files_map.pop(af.file_id, None)
-        while True:
+                af = self.active_file = self.next_ready_file()
+                if af is None:
+                    break
             chunk, uncompressed_sz = af.next_chunk()
             if af.transmitted:
                 self.active_file = None
-                break
+            budget -= max(uncompressed_sz, 4096)
+            self.stats.add(len(chunk), uncompressed_sz, af.transmitted)
+            first = len(ans)
             if chunk:
+                ans.extend(split_for_transfer(chunk, file_id=af.file_id, mark_last=af.transmitted))
+            elif af.transmitted:
+                ans.append(FileTransmissionCommand(action=Action.end_data, file_id=af.file_id))
+            if af.announce_compression and len(ans) > first:
+                af.announce_compression = False
+                ans[first].compression = af.compression
+        return ans
+
+
+IOCallback = Callable[[Any, Optional[Exception]], None]
+
+
+class IOWorker:
+    # Reading, writing, hashing and patching files is done in this thread so
+    # that large transfers do not block the GUI thread. Jobs are run in the
+    # order they are submitted and their callbacks are called in the main
+    # thread in the same order. Submitting never blocks, instead once too many
+    # jobs are queued the worker is saturated and FileTransmission defers
+    # commands from the child till it catches up. At most max_deferred_bytes
+    # of commands are deferred, a transfer that would exceed that fails with
+    # EIO, so that a slow disk cannot cause the whole transfer to be buffered
+    # in memory.
+
+    max_queued_jobs = 1024
+
+    def __init__(self, call_in_main_thread: Callable[[Callable[[], None]], None]) -> None:
+        from queue import Queue
+        from threading import Lock, Thread
+        self.call_in_main_thread = call_in_main_thread
+        self.lock = Lock()
+        self.finished_jobs: Deque[Tuple[Optional[IOCallback], Any, Optional[Exception]]] = deque()
+        self.queue: 'Queue[Optional[Tuple[Callable[[], Any], Optional[IOCallback]]]]' = Queue()
+        self.in_flight = 0
+        self.on_jobs_finished: Optional[Callable[[], None]] = None
+        self.thread = Thread(target=self.run, name='FileTransmissionIO', daemon=True)
+        self.thread.start()
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.in_flight >= self.max_queued_jobs
+
+    def submit(self, job: Callable[[], Any], callback: Optional[IOCallback] = None) -> None:
+        self.in_flight += 1
+        self.queue.put((job, callback))
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
                 break
-        if chunk:
-            self.pending_chunks.extend(split_for_transfer(chunk, file_id=af.file_id, mark_last=af.transmitted))
-            return self.pending_chunks.popleft()
-        elif af.transmitted:
-            return FileTransmissionCommand(action=Action.end_data, file_id=af.file_id)
-        return None
+            job, callback = item
+            result, err = run_io_job(job)
+            with self.lock:
+                # results are handed over in batches, not one main loop wakeup per job
+                needs_dispatch = not self.finished_jobs
+                self.finished_jobs.append((callback, result, err))
+            if needs_dispatch:
+                self.call_in_main_thread(self.dispatch_finished_jobs)
+
+    def dispatch_finished_jobs(self) -> None:
+        while True:
+            with self.lock:
+                if not self.finished_jobs:
+                    break
+                callback, result, err = self.finished_jobs.popleft()
+            self.in_flight -= 1
+            if callback is None:
+                if err is not None:
+                    log_error(f'File transmission I/O failed with error: {err}')
+                continue
+            try:
+                callback(result, err)
+            except Exception:
+                import traceback
+                log_error(f'File transmission I/O callback failed with error: {traceback.format_exc()}')
+        if self.on_jobs_finished is not None:
+            self.on_jobs_finished()
+
+    def shutdown(self) -> None:
+        self.queue.put(None)
 
-    def return_chunk(self, ftc: FileTransmissionCommand) -> None:
-        self.pending_chunks.insert(0, ftc)
+
+def run_io_job(job: Callable[[], Any]) -> Tuple[Any, Optional[Exception]]:
+    try:
+        return job(), None
+    except Exception as err:
+        return None, err
 
 
 class FileTransmission:
 
+    max_deferred_bytes = 64 * 1024 * 1024
+
     def __init__(self, window_id: int):
         self.window_id = window_id
         self.active_receives: Dict[str, ActiveReceive] = {}
         self.active_sends: Dict[str, ActiveSend] = {}
         self.pending_receive_responses: Deque[FileTransmissionCommand] = deque()
         self.pending_timer: Optional[int] = None
+        self.io_worker: Optional[IOWorker] = None
+        self.finished_transfers: Deque[Tuple[str, str, TransferStats]] = deque(maxlen=16)
+        self.deferred_commands: Deque[Tuple[FileTransmissionCommand, int]] = deque()
+        self.deferred_bytes = 0
+        self.overflowed_transfers: Set[str] = set()
+
+    def run_io(self, job: Callable[[], Any], callback: Optional[IOCallback] = None) -> None:
+        if self.io_worker is None:
+            self.io_worker = IOWorker(get_boss().call_in_main_thread)
+            self.io_worker.on_jobs_finished = self.process_deferred_commands
+        self.io_worker.submit(job, callback)
+
+    def process_deferred_commands(self) -> None:
+        while self.deferred_commands and not (self.io_worker is not None and self.io_worker.is_saturated):
+            cmd, size = self.deferred_commands.popleft()
+            self.deferred_bytes -= size
+            self.handle_command(cmd)
+
+    def fail_overflowed_transfer(self, transfer_id: str) -> None:
+        self.overflowed_transfers.add(transfer_id)
+        self.deferred_commands = deque(x for x in self.deferred_commands if x[0].id != transfer_id)
+        self.deferred_bytes = sum(x[1] for x in self.deferred_commands)
+        log_error(f'File transmission {transfer_id} failed as too much data was buffered waiting for disk I/O')
+        send_errors = True
+        if (ar := self.active_receives.get(transfer_id)) is not None:
+            send_errors = ar.send_errors
+            self.drop_receive(transfer_id)
+        elif (asd := self.active_sends.get(transfer_id)) is not None:
+            send_errors = asd.send_errors
+            self.drop_send(transfer_id)
+        if send_errors:
+            self.send_status_response('EIO', request_id=transfer_id, msg='Too much data buffered as the disk is too slow')
 
     def callback_after(self, callback: Callable[[Optional[int]], None], timeout: float = 0) -> Optional[int]:
         return add_timer(callback, timeout, False)
@@ -829,23 +1048,39 @@ def try_pending(self, timer_id: Optional[int]) -> None:
         self.prune_expired()
 
     def __del__(self) -> None:
-        for ar in self.active_receives.values():
-            ar.close()
-        self.active_receives = {}
-        for a in self.active_sends.values():
-            a.close()
+        w, self.io_worker = self.io_worker, None
+        items: List[Union[ActiveReceive, ActiveSend]] = list(self.active_receives.values())
+        items.extend(self.active_sends.values())
+        for x in items:
+            if w is None:
+                x.close()
+            else:
+                w.submit(x.close)
         self.active_receives = {}
         self.active_sends = {}
+        if w is not None:
+            w.shutdown()
 
     def drop_receive(self, receive_id: str) -> None:
         ar = self.active_receives.pop(receive_id, None)
         if ar is not None:
-            ar.close()
+            self.run_io(ar.close, lambda *a: self.record_stats('receive', ar.id, ar.stats))
 
     def drop_send(self, send_id: str) -> None:
         a = self.active_sends.pop(send_id, None)
         if a is not None:
-            a.close()
+            # the callback runs after any reads still in flight have completed
+            self.run_io(a.close, lambda *x: self.record_stats('send', a.id, a.stats))
+
+    def record_stats(self, kind: str, transfer_id: str, stats: TransferStats) -> None:
+        if not stats.started_at:
+            return
+        stats.finished_at = stats.finished_at or monotonic()
+        self.finished_transfers.append((kind, transfer_id, stats))
+
+    def transfer_stats(self) -> List[Dict[str, Any]]:
+        ' Statistics for recently finished transfers, oldest first '
+        return [dict(kind=kind, id=transfer_id, **stats.as_dict()) for kind, transfer_id, stats in self.finished_transfers]
 
     def prune_expired(self) -> None:
         for k in tuple(self.active_receives):
@@ -855,7 +1090,7 @@ def prune_expired(self) -> None:
             if self.active_sends[a].is_expired:
                 self.drop_send(a)
 
-    def handle_serialized_command(self, data: memoryview) -> None:
+    def handle_serialized_command(self, data: Union[str, bytes, memoryview]) -> None:
         try:
             cmd = FileTransmissionCommand.deserialize(data)
         except Exception as e:
@@ -865,6 +1100,24 @@ def handle_serialized_command(self, data: memoryview) -> None:
         if not cmd.id:
             log_error('File transmission command without id received, ignoring')
             return
+        if cmd.id in self.overflowed_transfers:
+            # the rest of a transfer that has already failed
+            if cmd.action in (Action.cancel, Action.finish):
+                self.overflowed_transfers.discard(cmd.id)
+            return
+        if self.deferred_commands or (self.io_worker is not None and self.io_worker.is_saturated):
+            # the I/O thread is behind, process commands, in order, once it catches up
+            if self.deferred_bytes + len(data) > self.max_deferred_bytes:
+                self.fail_overflowed_transfer(cmd.id)
+                if cmd.action in (Action.cancel, Action.finish):
+                    self.overflowed_transfers.discard(cmd.id)
+                return
+            self.deferred_commands.append((cmd, len(data)))
+            self.deferred_bytes += len(data)
+            return
+        self.handle_command(cmd)
+
+    def handle_command(self, cmd: FileTransmissionCommand) -> None:
         if cmd.action is Action.cancel:
             if cmd.id in self.active_receives:
                 self.handle_receive_cmd(cmd)
@@ -886,32 +1139,21 @@ def handle_send_cmd(self, cmd: FileTransmissionCommand) -> None:
                 self.drop_send(cmd.id)
                 return
             if cmd.action is Action.file:
-                try:
-                    asd.add_send_file(cmd) if asd.metadata_sent else asd.add_file_spec(cmd)
-                except OSError as err:
-                    self.send_fail_on_os_error(err, 'Failed to add send file', asd, cmd.file_id)
-                    self.drop_send(asd.id)
+                if asd.metadata_sent:
+                    self.run_io(partial(asd.add_send_file, cmd), partial(self.send_file_added, asd, cmd.file_id))
                     return
+                try:
+                    asd.add_file_spec(cmd)
                 except TransmissionError as err:
                     self.drop_send(asd.id)
                     if asd.send_errors:
                         self.send_transmission_error(asd.id, err)
                     return
-                if asd.metadata_sent:
-                    self.pump_send_chunks(asd)
-                else:
-                    if asd.spec_complete and asd.accepted:
-                        self.send_metadata_for_send_transfer(asd)
+                if asd.spec_complete and asd.accepted:
+                    self.send_metadata_for_send_transfer(asd)
                 return
             if cmd.action in (Action.data, Action.end_data):
-                try:
-                    asd.add_signature_data(cmd)
-                except TransmissionError as err:
-                    self.drop_send(asd.id)
-                    if asd.send_errors:
-                        self.send_transmission_error(asd.id, err)
-                else:
-                    self.pump_send_chunks(asd)
+                self.run_io(partial(asd.add_signature_data, cmd), partial(self.send_file_added, asd, cmd.file_id))
             elif cmd.action in (Action.status, Action.finish):
                 self.drop_send(asd.id)
                 return
@@ -935,9 +1177,31 @@ def handle_send_cmd(self, cmd: FileTransmissionCommand) -> None:
             if asd.send_acknowledgements:
                 self.send_status_response(ErrorCode.CANCELED, request_id=asd.id)
 
+    def send_file_added(self, asd: ActiveSend, file_id: str, result: None, err: Optional[Exception]) -> None:
+        if self.active_sends.get(asd.id) is not asd:
+            return
+        if isinstance(err, OSError):
+            self.send_fail_on_os_error(err, 'Failed to add send file', asd, file_id)
+            self.drop_send(asd.id)
+        elif isinstance(err, TransmissionError):
+            self.drop_send(asd.id)
+            if asd.send_errors:
+                self.send_transmission_error(asd.id, err)
+        elif err is not None:
+            raise err
+        else:
+            self.pump_send_chunks(asd)
+
     def send_metadata_for_send_transfer(self, asd: ActiveSend) -> None:
+        self.run_io(partial(list, iter_file_metadata(asd.file_specs)), partial(self.send_metadata, asd))
+
+    def send_metadata(self, asd: ActiveSend, metadata: List[Union[FileTransmissionCommand, TransmissionError]], err: Optional[Exception]) -> None:
+        if err is not None:
+            raise err
+        if self.active_sends.get(asd.id) is not asd:
+            return
         sent = False
-        for ftc in iter_file_metadata(asd.file_specs):
+        for ftc in metadata:
             if isinstance(ftc, TransmissionError):
                 sent = True
                 if asd.send_errors:
@@ -953,25 +1217,52 @@ def send_metadata_for_send_transfer(self, asd: ActiveSend) -> None:
             self.send_status_response(code=ErrorCode.ENOENT, request_id=asd.id, msg='No files found')
             self.drop_send(asd.id)
 
+    def send_credit(self) -> int:
+        # The number of bytes that can be written before the child has to read
+        # some, when zero on_write_buffer_drained() is called once it has.
+        window = get_boss().window_id_map.get(self.window_id)
+        return 0 if window is None else window.screen.write_buffer_credit(SEND_WINDOW, RESUME_SENDS_BELOW)
+
+    def on_write_buffer_drained(self) -> None:
+        self.pump_sends(None)
+
     def pump_send_chunks(self, asd: ActiveSend) -> None:
-        while True:
-            try:
-                ftc = asd.next_chunk()
-            except OSError as err:
-                fid = asd.active_file.file_id if asd.active_file else ''
-                self.send_fail_on_os_error(err, 'Failed to read data from file', asd, file_id=fid)
-                self.drop_send(asd.id)
-                break
-            if ftc is None:
-                break
+        credit = 0
+        while asd.pending_chunks:
+            if credit <= 0:
+                credit = self.send_credit()
+                if credit <= 0:
+                    break
+            ftc = asd.pending_chunks[0]
             ftc.id = asd.id
             if not self.write_ftc_to_child(ftc, use_pending=False):
-                asd.return_chunk(ftc)
                 self.callback_after(self.pump_sends, 0.05)
-                break
+                return
+            asd.pending_chunks.popleft()
+            asd.pending_bytes -= len(ftc.data)
+            credit -= len(ftc.data) * 4 // 3
+        if not asd.reading and asd.pending_bytes < SEND_WINDOW:
+            # read ahead while the child consumes what has been written
+            asd.reading = True
+            self.run_io(asd.read_chunks, partial(self.send_chunks_read, asd))
+
+    def send_chunks_read(self, asd: ActiveSend, chunks: List[FileTransmissionCommand], err: Optional[Exception]) -> None:
+        asd.reading = False
+        if self.active_sends.get(asd.id) is not asd:
+            return
+        if isinstance(err, OSError):
+            fid = asd.active_file.file_id if asd.active_file else ''
+            self.send_fail_on_os_error(err, 'Failed to read data from file', asd, file_id=fid)
+            self.drop_send(asd.id)
+        elif err is not None:
+            raise err
+        elif chunks:
+            asd.pending_chunks.extend(chunks)
+            asd.pending_bytes += sum(len(c.data) for c in chunks)
+            self.pump_send_chunks(asd)
 
     def pump_sends(self, timer_id: Optional[int]) -> None:
-        for asd in self.active_sends.values():
+        for asd in tuple(self.active_sends.values()):
             if asd.metadata_sent:
                 self.pump_send_chunks(asd)
 
@@ -999,85 +1290,117 @@ def handle_receive_cmd(self, cmd: FileTransmissionCommand) -> None:
             return
 
         if cmd.action is Action.cancel:
-            self.drop_receive(ar.id)
-            if ar.send_acknowledgements:
-                self.send_status_response(ErrorCode.CANCELED, request_id=ar.id)
+            self.active_receives.pop(ar.id, None)
+            self.run_io(ar.close, partial(self.receive_canceled, ar))
         elif cmd.action is Action.file:
-            try:
-                df = ar.start_file(cmd)
-            except TransmissionError as err:
-                if ar.send_errors:
-                    self.send_transmission_error(ar.id, err)
-            except Exception as err:
-                log_error(f'Transmission protocol failed to start file with error: {err}')
-                if ar.send_errors:
-                    te = TransmissionError(file_id=cmd.file_id, msg=str(err))
-                    self.send_transmission_error(ar.id, te)
-            else:
-                if df.ftype is FileType.directory:
-                    try:
-                        os.makedirs(df.name, exist_ok=True)
-                    except OSError as err:
-                        self.send_fail_on_os_error(err, 'Failed to create directory', ar, df.file_id)
-                    else:
-                        self.send_status_response(ErrorCode.OK, ar.id, df.file_id, name=df.name)
-                else:
-                    if ar.send_acknowledgements:
-                        sz = df.existing_stat.st_size if df.existing_stat is not None else -1
-                        ttype = TransmissionType.rsync \
-                            if sz > -1 and df.ttype is TransmissionType.rsync and df.ftype is FileType.regular else TransmissionType.simple
-                        self.send_status_response(code=ErrorCode.STARTED, request_id=ar.id, file_id=df.file_id, name=df.name, size=sz, ttype=ttype)
-                        df.ttype = ttype
-                        if ttype is TransmissionType.rsync:
-                            try:
-                                fs = df.signature_iterator()
-                            except OSError as err:
-                                self.send_fail_on_os_error(err, 'Failed to open file to read signature', ar, df.file_id)
-                            else:
-                                ar.pending_files_to_transmit_signature_of.append((fs, df.file_id))
-                                self.callback_after(partial(self.transmit_rsync_signature, ar.id))
+            self.run_io(partial(self.start_dest_file, ar, cmd), partial(self.dest_file_started, ar, cmd.file_id))
         elif cmd.action in (Action.data, Action.end_data):
-            try:
-                before = 0
-                bf = ar.files.get(cmd.file_id)
-                if bf is not None:
-                    before = bf.bytes_written
-                df = ar.add_data(cmd)
-                if df.failed:
-                    return
-                if ar.send_acknowledgements:
-                    if df.closed:
-                        self.send_status_response(
-                            code=ErrorCode.OK, request_id=ar.id, file_id=df.file_id, name=df.name, size=df.bytes_written)
-                    elif df.bytes_written > before:
-                        self.send_status_response(
-                            code=ErrorCode.PROGRESS, request_id=ar.id, file_id=df.file_id, size=df.bytes_written)
-            except TransmissionError as err:
-                if ar.send_errors:
-                    self.send_transmission_error(ar.id, err)
-            except Exception as err:
-                import traceback
-                st = traceback.format_exc()
-                log_error(f'Transmission protocol failed to write data to file with error: {st}')
-                if ar.send_errors:
-                    te = TransmissionError(file_id=cmd.file_id, msg=str(err))
-                    self.send_transmission_error(ar.id, te)
+            self.run_io(partial(self.add_dest_data, ar, cmd), partial(self.dest_data_added, ar, cmd.file_id))
         elif cmd.action is Action.finish:
-            try:
-                ar.commit(self.send_fail_on_os_error)
-            except TransmissionError as err:
-                if ar.send_errors:
-                    self.send_transmission_error(ar.id, err)
-            except Exception as err:
-                log_error(f'Transmission protocol failed to commit receive with error: {err}')
-                if ar.send_errors:
-                    te = TransmissionError(msg=str(err))
-                    self.send_transmission_error(ar.id, te)
-            finally:
-                self.drop_receive(ar.id)
+            self.active_receives.pop(ar.id, None)
+            self.run_io(partial(self.commit_receive, ar), partial(self.receive_committed, ar))
         else:
             log_error(f'Transmission receive command with unknown action: {cmd.action}, ignoring')
 
+    def receive_canceled(self, ar: ActiveReceive, result: None, err: Optional[Exception]) -> None:
+        if ar.send_acknowledgements:
+            self.send_status_response(ErrorCode.CANCELED, request_id=ar.id)
+
+    def start_dest_file(self, ar: ActiveReceive, cmd: FileTransmissionCommand) -> Tuple[DestFile, Optional[OSError]]:
+        # Called in the I/O thread
+        df = ar.start_file(cmd)
+        if df.ftype is FileType.directory:
+            try:
+                os.makedirs(df.name, exist_ok=True)
+            except OSError as err:
+                return df, err
+        return df, None
+
+    def dest_file_started(self, ar: ActiveReceive, file_id: str, result: Tuple[DestFile, Optional[OSError]], err: Optional[Exception]) -> None:
+        if isinstance(err, TransmissionError):
+            if ar.send_errors:
+                self.send_transmission_error(ar.id, err)
+            return
+        if err is not None:
+            log_error(f'Transmission protocol failed to start file with error: {err}')
+            if ar.send_errors:
+                te = TransmissionError(file_id=file_id, msg=str(err))
+                self.send_transmission_error(ar.id, te)
+            return
+        df, mkdir_err = result
+        if df.ftype is FileType.directory:
+            if mkdir_err is not None:
+                self.send_fail_on_os_error(mkdir_err, 'Failed to create directory', ar, df.file_id)
+            else:
+                self.send_status_response(ErrorCode.OK, ar.id, df.file_id, name=df.name)
+        elif ar.send_acknowledgements:
+            sz = df.existing_stat.st_size if df.existing_stat is not None else -1
+            ttype = TransmissionType.rsync \
+                if sz > -1 and df.ttype is TransmissionType.rsync and df.ftype is FileType.regular else TransmissionType.simple
+            self.send_status_response(
+                code=ErrorCode.STARTED, request_id=ar.id, file_id=df.file_id, name=df.name, size=sz, ttype=ttype,
+                compression=df.compression if df.requested_compression is Compression.zstd else Compression.none)
+            df.ttype = ttype
+            if ttype is TransmissionType.rsync:
+                try:
+                    fs = df.signature_iterator()
+                except OSError as oserr:
+                    self.send_fail_on_os_error(oserr, 'Failed to open file to read signature', ar, df.file_id)
+                else:
+                    ar.pending_files_to_transmit_signature_of.append((fs, df.file_id))
+                    self.callback_after(partial(self.transmit_rsync_signature, ar.id))
+
+    def add_dest_data(self, ar: ActiveReceive, cmd: FileTransmissionCommand) -> Optional[Tuple[DestFile, int, bool, int]]:
+        # Called in the I/O thread. The state of the file is returned as
+        # later jobs may change it before the main thread sees the result.
+        before = 0
+        bf = ar.files.get(cmd.file_id)
+        if bf is not None:
+            before = bf.bytes_written
+        df = ar.add_data(cmd)
+        ar.stats.add(len(cmd.data), df.bytes_written - before, df.closed)
+        if df.failed:
+            return None
+        return df, before, df.closed, df.bytes_written
+
+    def dest_data_added(self, ar: ActiveReceive, file_id: str, result: Optional[Tuple[DestFile, int, bool, int]], err: Optional[Exception]) -> None:
+        if isinstance(err, TransmissionError):
+            if ar.send_errors:
+                self.send_transmission_error(ar.id, err)
+        elif err is not None:
+            import traceback
+            st = ''.join(traceback.format_exception(type(err), err, err.__traceback__))
+            log_error(f'Transmission protocol failed to write data to file with error: {st}')
+            if ar.send_errors:
+                te = TransmissionError(file_id=file_id, msg=str(err))
+                self.send_transmission_error(ar.id, te)
+        elif result is not None and ar.send_acknowledgements:
+            df, before, closed, bytes_written = result
+            if closed:
+                self.send_status_response(
+                    code=ErrorCode.OK, request_id=ar.id, file_id=df.file_id, name=df.name, size=bytes_written)
+            elif bytes_written > before:
+                self.send_status_response(
+                    code=ErrorCode.PROGRESS, request_id=ar.id, file_id=df.file_id, size=bytes_written)
+
+    def commit_receive(self, ar: ActiveReceive) -> None:
+        # Called in the I/O thread
+        try:
+            ar.commit(self.send_fail_on_os_error)
+        finally:
+            ar.close()
+
+    def receive_committed(self, ar: ActiveReceive, result: None, err: Optional[Exception]) -> None:
+        self.record_stats('receive', ar.id, ar.stats)
+        if isinstance(err, TransmissionError):
+            if ar.send_errors:
+                self.send_transmission_error(ar.id, err)
+        elif err is not None:
+            log_error(f'Transmission protocol failed to commit receive with error: {err}')
+            if ar.send_errors:
+                te = TransmissionError(msg=str(err))
+                self.send_transmission_error(ar.id, te)
+
     def transmit_rsync_signature(self, receive_id: str, timer_id: Optional[int] = None) -> None:
         q = self.active_receives.get(receive_id)
         if q is None:
@@ -1089,26 +1412,42 @@ def transmit_rsync_signature(self, receive_id: str, timer_id: Optional[int] = No
             else:
                 self.callback_after(partial(self.transmit_rsync_signature, receive_id), timeout=0.1)
                 return
-        if not ar.pending_files_to_transmit_signature_of:
+        if not ar.pending_files_to_transmit_signature_of or ar.reading_signature:
             return
-        fs, file_id = ar.pending_files_to_transmit_signature_of[0]
+        ar.reading_signature = True
+        self.run_io(partial(self.read_signatures, tuple(ar.pending_files_to_transmit_signature_of)), partial(self.signatures_read, ar))
+
+    def read_signatures(self, pending: Tuple[Tuple[PatchFile, str], ...]) -> List[Tuple[str, memoryview, bool, Optional[OSError]]]:
+        # Called in the I/O thread. The signatures of consecutive files are
+        # read till the buffer is full, so that the signatures of small files
+        # are sent together.
         pos = 0
-        buf = memoryview(bytearray(4096))
-        is_finished = False
-        while len(buf) >= pos + 32:
+        buf = memoryview(bytearray(SIGNATURE_BATCH_SIZE))
+        ans: List[Tuple[str, memoryview, bool, Optional[OSError]]] = []
+        for fs, file_id in pending:
+            start, is_finished = pos, False
             try:
-                n = fs.next_signature_block(buf[pos:])
+                while len(buf) >= pos + 32:
+                    n = fs.next_signature_block(buf[pos:])
+                    if not n:
+                        is_finished = True
+                        break
+                    pos += n
             except OSError as err:
-                if ar.send_errors:
-                    self.send_fail_on_os_error(err, 'Failed to read signature', ar, file_id)
-                return
-            if not n:
-                is_finished = True
-                ar.pending_files_to_transmit_signature_of.popleft()
+                ans.append((file_id, buf[start:pos], False, err))
                 break
-            pos += n
+            ans.append((file_id, buf[start:pos], is_finished, None))
+            if not is_finished:
+                break
+        return ans
 
-        chunk = buf[:pos]
+    def signatures_read(self, ar: ActiveReceive, results: List[Tuple[str, memoryview, bool, Optional[OSError]]], err: Optional[Exception]) -> None:
+        ar.reading_signature = False
+        if self.active_receives.get(ar.id) is not ar:
+            return
+        if err is not None:
+            raise err
+        receive_id = ar.id
         has_capacity = True
 
         def write_ftc(data: FileTransmissionCommand) -> None:
@@ -1120,12 +1459,17 @@ def write_ftc(data: FileTransmissionCommand) -> None:
             else:
                 ar.signature_pending_chunks.append(data)
 
-        if len(chunk):
+        for file_id, chunk, is_finished, read_err in results:
             for data in split_for_transfer(chunk, session_id=receive_id, file_id=file_id):
                 write_ftc(data)
-        if is_finished:
-            endftc = FileTransmissionCommand(id=receive_id, action=Action.end_data, file_id=file_id)
-            write_ftc(endftc)
+            if read_err is not None:
+                if ar.send_errors:
+                    self.send_fail_on_os_error(read_err, 'Failed to read signature', ar, file_id)
+                return
+            if is_finished:
+                ar.pending_files_to_transmit_signature_of.popleft()
+                endftc = FileTransmissionCommand(id=receive_id, action=Action.end_data, file_id=file_id)
+                write_ftc(endftc)
         self.callback_after(partial(self.transmit_rsync_signature, receive_id))
 
     def send_status_response(
@@ -1133,8 +1477,9 @@ def send_status_response(
         request_id: str = '', file_id: str = '', msg: str = '',
         name: str = '', size: int = -1,
         ttype: TransmissionType = TransmissionType.simple,
+        compression: Compression = Compression.none,
     ) -> bool:
-        err = TransmissionError(code=code, msg=msg, file_id=file_id, name=name, size=size, ttype=ttype)
+        err = TransmissionError(code=code, msg=msg, file_id=file_id, name=name, size=size, ttype=ttype, compression=compression)
         return self.write_ftc_to_child(err.as_ftc(request_id))
 
     def send_transmission_error(self, request_id: str, err: TransmissionError) -> bool:
@@ -1246,3 +1591,25 @@ def start_send(self, aid: str) -> None:
     def callback_after(self, callback: Callable[[Optional[int]], None], timeout: float = 0) -> Optional[int]:
         callback(None)
         return None
+
+    def send_credit(self) -> int:
+        return SEND_WINDOW
+
+    def run_io(self, job: Callable[[], Any], callback: Optional[IOCallback] = None) -> None:
+        if self.io_worker is None:
+            result, err = run_io_job(job)
+            if callback is not None:
+                callback(result, err)
+        else:
+            self.io_worker.submit(job, callback)
+
+    def use_io_thread(self) -> None:
+        from queue import Queue
+        self.main_thread_jobs: 'Queue[Callable[[], None]]' = Queue()
+        self.io_worker = IOWorker(self.main_thread_jobs.put)
+        self.io_worker.on_jobs_finished = self.process_deferred_commands
+
+    def wait_for_io(self) -> None:
+        # Run the callbacks of all submitted I/O jobs, as the main loop would
+        while self.io_worker is not None and self.io_worker.in_flight:
+            self.main_thread_jobs.get()()
@@ -18,6 +18,9 @@
 
 static bool initialized = false;
 static void* libfontconfig_handle = NULL;
+// Python object with lookup() and store() methods used to persist the fallback
+// fonts chosen by fontconfig across kitty instances
+static PyObject *fallback_font_cache = NULL;
 
 #define FcInit dynamically_loaded_fc_symbol.Init
 #define FcFini dynamically_loaded_fc_symbol.Fini
@@ -129,6 +132,7 @@ ensure_initialized(void) {
 
 static void
 finalize(void) {
+    Py_CLEAR(fallback_font_cache);
     if (initialized) {
         FcFini();
         dlclose(libfontconfig_handle);
@@ -435,38 +439,95 @@ end:
     return ok;
 }
 
+static bool
+face_has_chars(PyObject *face, size_t num) {
+    for (size_t i = 0; i < num; i++) {
+        if (!glyph_id_for_codepoint(face, char_buf[i])) return false;
+    }
+    return true;
+}
+
+static PyObject*
+fallback_face_for_descriptor(PyObject *d, size_t num, FONTS_DATA_HANDLE fg, bool *has_chars) {
+    ssize_t idx = -1;
+    PyObject *q;
+    while ((q = iter_fallback_faces(fg, &idx))) {
+        if (face_equals_descriptor(q, d)) {
+            *has_chars = face_has_chars(q, num);
+            return PyLong_FromSsize_t(idx);
+        }
+    }
+    PyObject *ans = face_from_descriptor(d, fg);
+    if (ans) *has_chars = face_has_chars(ans, num);
+    return ans;
+}
+
+static PyObject*
+cached_fallback_face(PyObject *text, bool bold, bool italic, bool emoji_presentation, size_t num, FONTS_DATA_HANDLE fg) {
+    PyObject *ans = NULL;
+    bool has_chars = false;
+    PyObject *d = PyObject_CallMethod(fallback_font_cache, "lookup", "OOOO", text, bold ? Py_True : Py_False, italic ? Py_True : Py_False, emoji_presentation ? Py_True : Py_False);
+    if (d == NULL) { PyErr_Print(); return NULL; }
+    if (d != Py_None) {
+        ans = fallback_face_for_descriptor(d, num, fg, &has_chars);
+        // the cached font may have been removed or may not cover all characters
+        // from the block it was cached for, in which case ask fontconfig
+        if (ans == NULL) PyErr_Clear();
+        else if (!has_chars) Py_CLEAR(ans);
+    }
+    Py_DECREF(d);
+    return ans;
+}
+
 PyObject*
 create_fallback_face(PyObject UNUSED *base_face, CPUCell* cell, bool bold, bool italic, bool emoji_presentation, FONTS_DATA_HANDLE fg) {
     ensure_initialized();
-    PyObject *ans = NULL;
-    FcPattern *pat = FcPatternCreate();
-    if (pat == NULL) return PyErr_NoMemory();
+    PyObject *ans = NULL, *text = NULL;
+    FcPattern *pat = NULL;
+    size_t num = cell_as_unicode_for_fallback(cell, char_buf);
+    if (fallback_font_cache && num) {
+        text = PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND, char_buf, num);
+        if (text == NULL) PyErr_Clear();
+        else if ((ans = cached_fallback_face(text, bold, italic, emoji_presentation, num, fg))) goto end;
+    }
+    pat = FcPatternCreate();
+    if (pat == NULL) { PyErr_NoMemory(); goto end; }
     AP(FcPatternAddString, FC_FAMILY, (const FcChar8*)(emoji_presentation ? "emoji" : "monospace"), "family");
     if (!emoji_presentation && bold) { AP(FcPatternAddInteger, FC_WEIGHT, FC_WEIGHT_BOLD, "weight"); }
     if (!emoji_presentation && italic) { AP(FcPatternAddInteger, FC_SLANT, FC_SLANT_ITALIC, "slant"); }
     if (emoji_presentation) { AP(FcPatternAddBool, FC_COLOR, true, "color"); }
-    size_t num = cell_as_unicode_for_fallback(cell, char_buf);
     add_charset(pat, num);
     PyObject *d = _fc_match(pat);
     if (d) {
-        ssize_t idx = -1;
-        PyObject *q;
-        while ((q = iter_fallback_faces(fg, &idx))) {
-            if (face_equals_descriptor(q, d)) { ans = PyLong_FromSsize_t(idx); Py_CLEAR(d); goto end; }
+        bool has_chars = false;
+        ans = fallback_face_for_descriptor(d, num, fg, &has_chars);
+        if (ans && has_chars && text) {
+            PyObject *ret = PyObject_CallMethod(
+                fallback_font_cache, "store", "OOOOO", text, bold ? Py_True : Py_False, italic ? Py_True : Py_False, emoji_presentation ? Py_True : Py_False, d);
+            if (ret == NULL) PyErr_Print();
+            else Py_DECREF(ret);
         }
-        ans = face_from_descriptor(d, fg);
         Py_CLEAR(d);
     }
 end:
+    Py_CLEAR(text);
     if (pat != NULL) FcPatternDestroy(pat);
     return ans;
 }
 
+static PyObject*
+set_fallback_font_cache(PyObject UNUSED *self, PyObject *cache) {
+    Py_CLEAR(fallback_font_cache);
+    if (cache != Py_None) { fallback_font_cache = cache; Py_INCREF(cache); }
+    Py_RETURN_NONE;
+}
+
 #undef AP
 static PyMethodDef module_methods[] = {
     METHODB(fc_list, METH_VARARGS),
     METHODB(fc_match, METH_VARARGS),
     METHODB(fc_match_postscript_name, METH_VARARGS),
+    METHODB(set_fallback_font_cache, METH_O),
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
@@ -23,6 +23,12 @@ def __init__(self, name: str, parsed: bytes):
     def __repr__(self) -> str:
         return repr(self.name)
 
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, FontFeature) and self.name == other.name and self.parsed == other.parsed
+
+    def __hash__(self) -> int:
+        return hash((self.name, self.parsed))
+
 
 class ModificationType(Enum):
     underline_position = auto()
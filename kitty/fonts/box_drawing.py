@@ -7,6 +7,8 @@
 #
 
 import math
+import sys
+from array import array
 from functools import lru_cache, wraps
 from functools import partial as p
 from itertools import repeat
@@ -27,23 +29,53 @@ def thickness(level: int = 1, horizontal: bool = True) -> int:
     return int(math.ceil(pts * (_dpi / 72.0)))
 
 
+def fill_indices(buf: BufType, start: int, stop: int, step: int = 1, val: int = 255) -> None:
+    ' Set buf[i] = val for i in range(start, stop, step) using a single slice assignment when possible '
+    indices = range(start, stop, step)
+    if not indices:
+        return
+    if indices[0] >= 0 and indices[-1] < len(buf):
+        buf[start:stop:step] = bytes((val,)) * len(indices)
+    else:
+        # out of bounds indices wrap around or raise IndexError, exactly as
+        # per pixel assignment would
+        for i in indices:
+            buf[i] = val
+
+
+def fill_rect(buf: BufType, width: int, x1: int, x2: int, y1: int, y2: int, val: int = 255) -> None:
+    ' Set all pixels in the rectangle [x1, x2) x [y1, y2) to val '
+    if x2 <= x1 or y2 <= y1:
+        return
+    if x1 == 0 and x2 == width:
+        fill_indices(buf, y1 * width, y2 * width, 1, val)
+    elif x2 - x1 < y2 - y1:
+        for x in range(x1, x2):
+            fill_indices(buf, x + y1 * width, x + y2 * width, width, val)
+    else:
+        for y in range(y1, y2):
+            fill_indices(buf, x1 + y * width, x2 + y * width, 1, val)
+
+
+def mirror_rows(src: BufType, dest: BufType, width: int, height: int) -> None:
+    ' Copy src to dest, flipping it horizontally '
+    for y in range(height):
+        offset = y * width
+        dest[offset:offset + width] = bytes(src[offset:offset + width])[::-1]
+
+
 def draw_hline(buf: BufType, width: int, x1: int, x2: int, y: int, level: int) -> None:
     ' Draw a horizontal line between [x1, x2) centered at y with the thickness given by level '
     sz = thickness(level=level, horizontal=False)
     start = y - sz // 2
-    for y in range(start, start + sz):
-        offset = y * width
-        for x in range(x1, x2):
-            buf[offset + x] = 255
+    fill_rect(buf, width, x1, x2, start, start + sz)
 
 
 def draw_vline(buf: BufType, width: int, y1: int, y2: int, x: int, level: int) -> None:
     ' Draw a vertical line between [y1, y2) centered at x with the thickness given by level '
     sz = thickness(level=level, horizontal=True)
     start = x - sz // 2
-    for x in range(start, start + sz):
-        for y in range(y1, y2):
-            buf[x + y * width] = 255
+    fill_rect(buf, width, start, start + sz, y1, y2)
 
 
 def half_hline(buf: BufType, width: int, height: int, level: int = 1, which: str = 'left', extend_by: int = 0) -> None:
@@ -144,22 +176,30 @@ def cross(buf: BufType, width: int, height: int, a: int = 1, b: int = 1, c: int
 
 
 def downsample(src: BufType, dest: BufType, dest_width: int, dest_height: int, factor: int = 4) -> None:
+    # Rows of pixels are summed as big integers with one 16 bit lane per
+    # pixel, this is exact as long as no lane can overflow, which is the case
+    # for factor <= 16
     src_width = factor * dest_width
-
-    def average_intensity_in_src(dest_x: int, dest_y: int) -> int:
-        src_y = dest_y * factor
-        src_x = dest_x * factor
-        total = 0
-        for y in range(src_y, src_y + factor):
-            offset = src_width * y
-            for x in range(src_x, src_x + factor):
-                total += src[offset + x]
-        return total // (factor * factor)
-
+    src_row_size = src_width * factor
+    area = factor * factor
+    lanes = bytearray(2 * src_width)
     for y in range(dest_height):
+        src_offset = src_row_size * y
+        rows = bytes(src[src_offset:src_offset + src_row_size])
+        if not rows.strip(b'\0'):
+            continue  # all factor rows are empty
+        total = 0
+        for i in range(0, src_row_size, src_width):
+            lanes[::2] = rows[i:i + src_width]
+            total += int.from_bytes(lanes, 'little')
+        # now sum each group of factor adjacent lanes into the first lane of the group
+        total = sum(total >> (16 * i) for i in range(factor))
+        block_totals = array('H', total.to_bytes(2 * src_width, 'little'))
+        if sys.byteorder == 'big':
+            block_totals.byteswap()
         offset = dest_width * y
-        for x in range(dest_width):
-            dest[offset + x] = min(255, dest[offset + x] + average_intensity_in_src(x, y))
+        dest[offset:offset + dest_width] = bytes(
+            min(255, d + t // area) for d, t in zip(dest[offset:offset + dest_width], block_totals[::factor]))
 
 
 class SSByteArray(bytearray):
@@ -183,11 +223,17 @@ def supersampled_wrapper(buf: BufType, width: int, height: int, *args: Any, **kw
 
 
 def fill_region(buf: BufType, width: int, height: int, xlimits: Iterable[Iterable[float]], inverted: bool = False) -> None:
+    # Set the pixels in column x to full if upper <= y <= lower else empty,
+    # for each (upper, lower) in xlimits
     full, empty = (0, 255) if inverted else (255, 0)
-    for y in range(height):
-        offset = y * width
-        for x, (upper, lower) in enumerate(xlimits):
-            buf[x + offset] = full if upper <= y <= lower else empty
+    limits = tuple(xlimits)[:width]
+    fill_rect(buf, width, 0, len(limits), 0, height, empty)
+    for x, (upper, lower) in enumerate(limits):
+        if not upper <= lower or upper > height - 1 or lower < 0:
+            continue
+        y1 = 0 if upper <= 0 else math.ceil(upper)
+        y2 = height if lower >= height - 1 else math.floor(lower) + 1
+        fill_indices(buf, x + y1 * width, x + y2 * width, width, full)
 
 
 def line_equation(x1: int, y1: int, x2: int, y2: int) -> Callable[[int], float]:
@@ -262,13 +308,9 @@ def thick_line(buf: BufType, width: int, height: int, thickness_in_pixels: int,
     leq = line_equation(*p1, *p2)
     delta, extra = divmod(thickness_in_pixels, 2)
 
-    for x in range(p1[0], p2[0] + 1):
-        if 0 <= x < width:
-            y_p = leq(x)
-            r = range(int(y_p) - delta, int(y_p) + delta + extra)
-            for y in r:
-                if 0 <= y < height:
-                    buf[x + y * width] = 255
+    for x in range(max(0, p1[0]), min(width, p2[0] + 1)):
+        y_p = int(leq(x))
+        fill_indices(buf, x + max(0, y_p - delta) * width, x + min(height, y_p + delta + extra) * width, width)
 
 
 @supersampled()
@@ -410,11 +452,7 @@ def D(buf: SSByteArray, width: int, height: int, left: bool = True) -> None:
     else:
         mbuf = bytearray(width * height)
         fill_region(mbuf, width, height, xlimits)
-        for y in range(height):
-            offset = y * width
-            for src_x in range(width):
-                dest_x = width - 1 - src_x
-                buf[offset + dest_x] = mbuf[offset + src_x]
+        mirror_rows(mbuf, buf, width, height)
 
 
 def draw_parametrized_curve(
@@ -426,21 +464,40 @@ def draw_parametrized_curve(
     delta, extra = divmod(thickness(level), 2)
     delta *= supersample_factor
     extra *= supersample_factor
-    seen = set()
-    for i in range(num_samples + 1):
-        t = i / num_samples
-        p = int(xfunc(t)), int(yfunc(t))
-        if p in seen:
-            continue
-        x_p, y_p = p
-        seen.add(p)
-        for y in range(y_p - delta, y_p + delta + extra):
-            if 0 <= y < height:
-                offset = y * width
-                for x in range(x_p - delta, x_p + delta + extra):
-                    if 0 <= x < width:
-                        pos = offset + x
-                        buf[pos] = min(255, buf[pos] + 255)
+    points = {(int(xfunc(t)), int(yfunc(t))) for t in (i / num_samples for i in range(num_samples + 1))}
+    if not points:
+        return
+    # Every point is drawn as a square of side delta + extra, the union of the
+    # squares is computed one row at a time, as a bitmask of pixel columns
+    # with bit i corresponding to the column base + i
+    base = min(x for x, y in points) - delta
+    centers: Dict[int, int] = {}
+    for x_p, y_p in points:
+        centers[y_p] = centers.get(y_p, 0) | (1 << (x_p - base))
+    rows: Dict[int, int] = {}
+    for y_p, bits in centers.items():
+        widened = 0
+        for k in range(-delta, delta + extra):
+            widened |= (bits << k) if k >= 0 else (bits >> -k)
+        for y in range(max(0, y_p - delta), min(height, y_p + delta + extra)):
+            rows[y] = rows.get(y, 0) | widened
+    for y, bits in rows.items():
+        offset = y * width
+        for start, end in set_bit_runs(bits):
+            fill_indices(buf, offset + max(0, base + start), offset + min(width, base + end))
+
+
+def set_bit_runs(bits: int) -> Iterator[Tuple[int, int]]:
+    ' Yield the [start, end) bit positions of every run of set bits in the non-negative integer bits '
+    pos = 0
+    while bits:
+        skip = (bits & -bits).bit_length() - 1  # number of trailing zeros
+        bits >>= skip
+        pos += skip
+        run = (~bits & (bits + 1)).bit_length() - 1  # number of trailing ones
+        yield pos, pos + run
+        bits >>= run
+        pos += run
 
 
 def circle_equations(
@@ -533,11 +590,7 @@ def rounded_separator(buf: SSByteArray, width: int, height: int, level: int = 1,
         mbuf = SSByteArray(width * height)
         mbuf.supersample_factor = buf.supersample_factor
         draw_parametrized_curve(mbuf, width, height, level, bezier_x, bezier_y)
-        for y in range(height):
-            offset = y * width
-            for src_x in range(width):
-                dest_x = width - 1 - src_x
-                buf[offset + dest_x] = mbuf[offset + src_x]
+        mirror_rows(mbuf, buf, width, height)
 
 
 @supersampled()
@@ -749,12 +802,9 @@ def shade(
                 continue
 
             # Fill the square
-            for yr in range(square_height):
-                y = r * square_height + yr + ey
-                offset = width * y
-                for xc in range(square_width):
-                    x = c * square_width + xc + ex
-                    buf[offset + x] = 255
+            x = c * square_width + ex
+            y = r * square_height + ey
+            fill_rect(buf, width, x, x + square_width, y, y + square_height)
 
     if not fill_blank:
         return
@@ -771,10 +821,7 @@ def shade(
         cols = range(width // 2 - 1, width)
         rows = range(height)
 
-    for r in rows:
-        off = r * width
-        for c in cols:
-            buf[off + c] = 255
+    fill_rect(buf, width, cols.start, cols.stop, rows.start, rows.stop)
 
 
 def mask(
@@ -782,11 +829,8 @@ def mask(
 ) -> None:
     m = bytearray(width * height)
     mask_func(m, width, height)
-    for y in range(height):
-        offset = y * width
-        for x in range(width):
-            p = offset + x
-            buf[p] = int(255.0 * (buf[p] / 255.0 * m[p] / 255.0))
+    n = width * height
+    buf[:n] = bytes(int(255.0 * (b / 255.0 * mb / 255.0)) if b and mb else 0 for b, mb in zip(buf[:n], m))
 
 
 def quad(buf: BufType, width: int, height: int, x: int = 0, y: int = 0) -> None:
@@ -796,10 +840,7 @@ def quad(buf: BufType, width: int, height: int, x: int = 0, y: int = 0) -> None:
     num_rows = height // 2
     top = y * num_rows
     bottom = height if y else num_rows
-    for r in range(top, bottom):
-        off = r * width
-        for c in range(left, right):
-            buf[off + c] = 255
+    fill_rect(buf, width, left, right, top, bottom)
 
 
 def sextant(buf: BufType, width: int, height: int, level: int = 1, which: int = 0) -> None:
@@ -815,10 +856,7 @@ def draw_sextant(row: int = 0, col: int = 0) -> None:
             x_start, x_end = 0, width // 2
         else:
             x_start, x_end = width // 2, width
-        for r in range(y_start, y_end):
-            off = r * width
-            for c in range(x_start, x_end):
-                buf[c + off] = 255
+        fill_rect(buf, width, x_start, x_end, y_start, y_end)
 
     def add_row(q: int, r: int) -> None:
         if q & 1:
@@ -840,18 +878,13 @@ def smooth_mosaic(
     bx, by = int(b[0] * (width - 1)), int(b[1] * (height - 1))
     line = line_equation(ax, ay, bx, by)
 
-    def lower_condition(x: int, y: int) -> bool:
-        return y >= line(x)
-
-    def upper_condition(x: int, y: int) -> bool:
-        return y <= line(x)
-
-    condition = lower_condition if lower else upper_condition
-    for y in range(height):
-        offset = width * y
-        for x in range(width):
-            if condition(x, y):
-                buf[offset + x] = 255
+    for x in range(width):
+        y_line = line(x)
+        if lower:
+            y1, y2 = (0 if y_line <= 0 else math.ceil(y_line)), height
+        else:
+            y1, y2 = 0, (-1 if y_line < 0 else math.floor(y_line)) + 1
+        fill_indices(buf, x + y1 * width, x + min(y2, height) * width, width)
 
 
 def eight_range(size: int, which: int) -> range:
@@ -880,10 +913,7 @@ def eight_bar(buf: BufType, width: int, height: int, level: int = 1, which: int
     else:
         y_range = range(0, height)
         x_range = eight_range(width, which)
-    for y in y_range:
-        offset = y * width
-        for x in x_range:
-            buf[offset + x] = 255
+    fill_rect(buf, width, x_range.start, x_range.stop, y_range.start, y_range.stop)
 
 
 def eight_block(buf: BufType, width: int, height: int, level: int = 1, which: Tuple[int, ...] = (0,), horizontal: bool = False) -> None:
@@ -896,10 +926,7 @@ def frame(buf: BufType, width: int, height: int, edges: Tuple[Literal['l', 'r',
     v = thickness(level=level, horizontal=False)
 
     def line(x1: int, x2: int, y1: int, y2: int) -> None:
-        for y in range(y1, y2):
-            offset = y * width
-            for x in range(x1, x2):
-                buf[x + offset] = 255
+        fill_rect(buf, width, x1, x2, y1, y2)
 
     def hline(y1: int, y2: int) -> None:
         line(0, width, y1, y2)
@@ -936,10 +963,7 @@ def progress_bar(buf: BufType, width: int, height: int, which: Literal['l', 'm',
         x1, x2 = 0, width
     else:
         x1, x2 = 0, width - gap_factor*v
-    for y in range(y1, y2):
-        offset = y * width
-        for x in range(x1, x2):
-            buf[x + offset] = 255
+    fill_rect(buf, width, x1, x2, y1, y2)
 
 
 @lru_cache(maxsize=64)
@@ -964,10 +988,7 @@ def braille_dot(buf: BufType, width: int, height: int, col: int, row: int) -> No
     x_start = x_gaps[col] + col * dot_width
     y_start = y_gaps[row] + row * dot_height
     if y_start < height and x_start < width:
-        for y in range(y_start, min(height, y_start + dot_height)):
-            offset = y * width
-            for x in range(x_start, min(width, x_start + dot_width)):
-                buf[offset + x] = 255
+        fill_rect(buf, width, x_start, min(width, x_start + dot_width), y_start, min(height, y_start + dot_height))
 
 
 def braille(buf: BufType, width: int, height: int, which: int = 0) -> None:
@@ -1280,7 +1301,16 @@ def render_box_char(ch: str, buf: BufType, width: int, height: int, dpi: float =
     return buf
 
 
-def render_missing_glyph(buf: BufType, width: int, height: int) -> None:
+def render_box_glyphs(codepoints: Iterable[int], width: int, height: int, dpi: float, box_scale: Sequence[float]) -> List[Tuple[int, bytes]]:
+    # Used to pre-render glyphs in a worker process, so must depend only on
+    # its arguments
+    set_scale(box_scale)
+    return [(cp, bytes(render_box_char(chr(cp), bytearray(width * height), width, height, dpi))) for cp in codepoints]
+
+
+def render_missing_glyph(buf: BufType, width: int, height: int, dpi: float = 96.0) -> None:
+    global _dpi
+    _dpi = dpi
     frame(buf, width, height)
 
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# License: GPL v3 Copyright: 2024, Kovid Goyal <kovid at kovidgoyal.net>
+
+# On disk cache of the fallback fonts chosen by fontconfig for text not present
+# in the configured fonts, so that new kitty instances do not need to repeat
+# the expensive fontconfig queries. Single characters are cached by the block
+# of codepoints they belong to, the C code verifies that a cached font actually
+# has the characters before using it, falling back to querying fontconfig.
+
+import atexit
+import json
+import os
+import threading
+from contextlib import suppress
+from hashlib import sha256
+from typing import Any, Dict, List, Optional
+
+from kitty.constants import cache_dir, str_version
+from kitty.typing import FontConfigPattern
+
+BLOCK_SHIFT = 8
+SAVE_DELAY = 2.0
+
+
+def fontconfig_fingerprint() -> str:
+    # fontconfig rescans fonts and rebuilds its caches when fonts are installed
+    # or its configuration changes, so use the modification times of these
+    # directories to detect when cached choices may no longer be valid
+    home = os.path.expanduser('~')
+    config = os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(home, '.cache')
+    data = os.environ.get('XDG_DATA_HOME') or os.path.join(home, '.local', 'share')
+    paths = (
+        os.environ.get('FONTCONFIG_FILE') or '/etc/fonts/fonts.conf', '/etc/fonts/conf.d',
+        os.path.join(config, 'fontconfig'), os.path.join(config, 'fontconfig', 'conf.d'),
+        os.path.join(cache, 'fontconfig'), '/var/cache/fontconfig', '/usr/lib/fontconfig/cache',
+        '/usr/share/fonts', '/usr/local/share/fonts', os.path.join(data, 'fonts'), os.path.join(home, '.fonts'),
+    )
+    parts = [str_version, os.environ.get('FONTCONFIG_PATH', '')]
+    for path in paths:
+        try:
+            parts.append(f'{path}:{os.stat(path).st_mtime_ns}')
+        except OSError:
+            parts.append(f'{path}:')
+    return sha256('\0'.join(parts).encode()).hexdigest()[:32]
+
+
+class FallbackFontCache:
+
+    def __init__(self) -> None:
+        self.path = ''
+        self.descriptors: List[FontConfigPattern] = []
+        self.entries: Dict[str, int] = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.save_timer: Optional[threading.Timer] = None
+        self.save_at_exit_registered = False
+
+    @property
+    def cache_dir(self) -> str:
+        return os.path.join(cache_dir(), 'font-fallback')
+
+    def load(self) -> None:
+        self.loaded = True
+        self.path = os.path.join(self.cache_dir, fontconfig_fingerprint() + '.json')
+        try:
+            with open(self.path, 'rb') as f:
+                data = json.loads(f.read())
+            self.descriptors, self.entries = data['descriptors'], data['entries']
+        except Exception:
+            self.descriptors, self.entries = [], {}
+
+    def keys(self, text: str, bold: bool, italic: bool, emoji_presentation: bool) -> List[str]:
+        style = 'e' if emoji_presentation else ('b' if bold else '') + ('i' if italic else '')
+        ans = [f'{style}:{text}']
+        if len(text) == 1:
+            ans.append(f'{style}:block:{ord(text) >> BLOCK_SHIFT:x}')
+        return ans
+
+    def lookup(self, text: str, bold: bool, italic: bool, emoji_presentation: bool) -> Optional[FontConfigPattern]:
+        if not self.loaded:
+            self.load()
+        for key in self.keys(text, bold, italic, emoji_presentation):
+            idx = self.entries.get(key)
+            if idx is not None:
+                return self.descriptors[idx]
+        return None
+
+    def store(self, text: str, bold: bool, italic: bool, emoji_presentation: bool, descriptor: FontConfigPattern) -> None:
+        if not self.loaded:
+            self.load()
+        keys = self.keys(text, bold, italic, emoji_presentation)
+        # the first font found for a block is used for all characters in it,
+        # characters it does not have get their own entries
+        key = keys[-1] if keys[-1] not in self.entries else keys[0]
+        with self.lock:
+            try:
+                idx = self.descriptors.index(descriptor)
+            except ValueError:
+                idx = len(self.descriptors)
+                self.descriptors.append(descriptor)
+            self.entries[key] = idx
+            if self.save_timer is None:
+                # write in a background thread, batching the many entries
+                # added when rendering text in a new script
+                if not self.save_at_exit_registered:
+                    self.save_at_exit_registered = True
+                    atexit.register(self.save)
+                self.save_timer = threading.Timer(SAVE_DELAY, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def save(self) -> None:
+        from kitty.config import atomic_save
+        with self.lock:
+            if self.save_timer is None:
+                return
+            self.save_timer.cancel()
+            self.save_timer = None
+            data: Dict[str, Any] = {'descriptors': self.descriptors, 'entries': self.entries}
+            raw = json.dumps(data, ensure_ascii=False).encode()
+        with suppress(OSError):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atomic_save(raw, self.path)
+            # remove caches made with older fontconfig configurations
+            for x in os.scandir(self.cache_dir):
+                if x.name.endswith('.json') and x.path != self.path:
+                    os.remove(x.path)
+
+
+fallback_font_cache = FallbackFontCache()
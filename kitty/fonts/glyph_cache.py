@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# License: GPL v3 Copyright: 2024, Kovid Goyal <kovid at kovidgoyal.net>
+
+# On disk cache of glyphs rendered by kitty itself, such as box drawing
+# characters, so that they need not be re-rendered at every startup or change
+# in font size. The bitmaps for one set of rendering parameters are stored in
+# a single append only file of fixed size records. Each record is the key,
+# a checksum of the key and bitmap, and the bitmap. New records are written in
+# batches in a background thread.
+
+import atexit
+import os
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import suppress
+from hashlib import sha256
+from typing import Dict, Hashable, List, Optional, Tuple
+from zlib import crc32
+
+from kitty.constants import cache_dir, str_version
+
+MAX_CACHE_FILES = 64
+MAX_TABLES_IN_MEMORY = 8
+SAVE_DELAY = 2.0
+record_header = struct.Struct('<II')
+key_struct = struct.Struct('<I')
+
+
+def checksum(key_num: int, bitmap: bytes) -> int:
+    return crc32(bitmap, crc32(key_struct.pack(key_num)))
+
+
+class GlyphTable:
+
+    ' The glyphs of bitmap_size bytes rendered with one set of parameters '
+
+    def __init__(self, path: str, bitmap_size: int) -> None:
+        self.path, self.bitmap_size = path, bitmap_size
+        self.glyphs: Dict[int, bytes] = {}
+        self.lock = threading.Lock()
+        self.pending: List[bytes] = []
+        self.save_timer: Optional[threading.Timer] = None
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return False
+        with suppress(OSError):
+            os.utime(self.path)
+        record_size = record_header.size + self.bitmap_size
+        if len(data) % record_size:
+            # remove any partially written record at the end so that future
+            # records are correctly aligned
+            data = data[:len(data) - len(data) % record_size]
+            with suppress(OSError):
+                os.truncate(self.path, len(data))
+        for offset in range(0, len(data), record_size):
+            key_num, crc = record_header.unpack_from(data, offset)
+            bitmap = data[offset + record_header.size:offset + record_size]
+            if checksum(key_num, bitmap) != crc:
+                # the file is corrupted, start afresh
+                self.glyphs.clear()
+                with suppress(OSError):
+                    os.remove(self.path)
+                return False
+            self.glyphs[key_num] = bitmap
+        return True
+
+    def get(self, key_num: int) -> Optional[bytes]:
+        return self.glyphs.get(key_num)
+
+    def set(self, key_num: int, bitmap: bytes) -> None:
+        if len(bitmap) != self.bitmap_size:
+            raise ValueError(f'Bitmap of size {len(bitmap)} does not match the cache bitmap size: {self.bitmap_size}')
+        self.glyphs[key_num] = bitmap
+        with self.lock:
+            self.pending.append(record_header.pack(key_num, checksum(key_num, bitmap)) + bitmap)
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(SAVE_DELAY, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+                # unlike the timer, this keeps the table alive till exit
+                atexit.register(self.save)
+
+    def save(self) -> None:
+        with self.lock:
+            if self.save_timer is None:
+                return
+            self.save_timer.cancel()
+            self.save_timer = None
+            atexit.unregister(self.save)
+            data, self.pending = b''.join(self.pending), []
+        with suppress(OSError):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.write(data)
+
+
+class GlyphCache:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.tables: 'OrderedDict[Tuple[Hashable, ...], GlyphTable]' = OrderedDict()
+
+    @property
+    def cache_dir(self) -> str:
+        return os.path.join(cache_dir(), self.name)
+
+    def table(self, bitmap_size: int, *key: Hashable) -> GlyphTable:
+        # The table for glyphs of bitmap_size bytes rendered with the
+        # specified parameters, loading it from disk if needed
+        key = (bitmap_size, str_version) + key
+        ans = self.tables.get(key)
+        if ans is None:
+            ans = GlyphTable(os.path.join(self.cache_dir, sha256(repr(key).encode()).hexdigest()[:32] + '.glyphs'), bitmap_size)
+            if not ans.load():
+                self.prune()
+            self.tables[key] = ans
+            while len(self.tables) > MAX_TABLES_IN_MEMORY:
+                self.tables.popitem(last=False)
+        else:
+            self.tables.move_to_end(key)
+        return ans
+
+    def prune(self) -> None:
+        with suppress(OSError):
+            entries = sorted(
+                (e for e in os.scandir(self.cache_dir) if e.name.endswith('.glyphs')), key=lambda e: e.stat().st_mtime, reverse=True)
+            for e in entries[MAX_CACHE_FILES - 1:]:
+                os.remove(e.path)
+
+
+box_glyph_cache = GlyphCache('box-drawing')
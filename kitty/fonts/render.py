@@ -3,15 +3,16 @@
 
 import ctypes
 import sys
-from functools import partial
+from functools import lru_cache, partial
 from math import ceil, cos, floor, pi
-from typing import TYPE_CHECKING, Any, Callable, Dict, Generator, List, Optional, Tuple, Union, cast
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generator, List, Optional, Set, Tuple, Union, cast
 
 from kitty.constants import is_macos
 from kitty.fast_data_types import (
     NUM_UNDERLINE_STYLES,
     Screen,
     create_test_font_group,
+    get_boss,
     get_fallback_font,
     get_options,
     set_font_data,
@@ -21,7 +22,9 @@
     test_render_line,
     test_shape,
 )
-from kitty.fonts.box_drawing import BufType, distribute_dots, render_box_char, render_missing_glyph
+from kitty.fonts import box_drawing
+from kitty.fonts.box_drawing import BufType, distribute_dots, fill_rect, render_box_char, render_missing_glyph
+from kitty.fonts.glyph_cache import box_glyph_cache
 from kitty.options.types import Options, defaults
 from kitty.types import _T
 from kitty.typing import CoreTextFont, FontConfigPattern
@@ -32,6 +35,9 @@
     from .core_text import font_for_family as font_for_family_macos
     from .core_text import get_font_files as get_font_files_coretext
 else:
+    from kitty.fast_data_types import set_fallback_font_cache
+
+    from .fallback_cache import fallback_font_cache
     from .fontconfig import find_font_features
     from .fontconfig import font_for_family as font_for_family_fontconfig
     from .fontconfig import get_font_files as get_font_files_fontconfig
@@ -206,6 +212,8 @@ def set_font_family(opts: Optional[Options] = None, override_font_size: Optional
     font_features.update(opts.font_features)
     if debug_font_matching:
         dump_faces(ftypes, indices)
+    if not is_macos:
+        set_fallback_font_cache(fallback_font_cache)
     set_font_data(
         render_box_drawing, prerender_function, descriptor_for_idx,
         indices['bold'], indices['italic'], indices['bi'], num_symbol_fonts,
@@ -214,21 +222,21 @@ def set_font_family(opts: Optional[Options] = None, override_font_size: Optional
 
 
 if TYPE_CHECKING:
+    from concurrent.futures import Future, ProcessPoolExecutor
+
     CBufType = ctypes.Array[ctypes.c_ubyte]
 else:
     CBufType = None
-UnderlineCallback = Callable[[CBufType, int, int, int, int], None]
+UnderlineCallback = Callable[[bytearray, int, int, int, int], None]
 
 
-def add_line(buf: CBufType, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
+def add_line(buf: bytearray, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
     y = position - thickness // 2
-    while thickness > 0 and -1 < y < cell_height:
-        thickness -= 1
-        ctypes.memset(ctypes.addressof(buf) + (cell_width * y), 255, cell_width)
-        y += 1
+    if -1 < y < cell_height:
+        fill_rect(buf, cell_width, 0, cell_width, y, min(y + thickness, cell_height))
 
 
-def add_dline(buf: CBufType, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
+def add_dline(buf: bytearray, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
     a = min(position - thickness, cell_height - 1)
     b = min(position, cell_height - 1)
     top, bottom = min(a, b), max(a, b)
@@ -245,10 +253,10 @@ def add_dline(buf: CBufType, cell_width: int, position: int, thickness: int, cel
     top = max(0, min(top, cell_height - 1))
     bottom = max(0, min(bottom, cell_height - 1))
     for y in {top, bottom}:
-        ctypes.memset(ctypes.addressof(buf) + (cell_width * y), 255, cell_width)
+        fill_rect(buf, cell_width, 0, cell_width, y, y + 1)
 
 
-def add_curl(buf: CBufType, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
+def add_curl(buf: bytearray, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
     max_x, max_y = cell_width - 1, cell_height - 1
     opts = get_options()
     xfactor = (4.0 if 'dense' in opts.undercurl_style else 2.0) * pi / max_x
@@ -279,26 +287,40 @@ def add_intensity(x: int, y: int, val: int) -> None:
         i1 = int(255 * abs(y - floor(y)))
         add_intensity(x, y1, 255 - i1)  # upper bound
         add_intensity(x, y2, i1)  # lower bound
-        # fill between upper and lower bound
-        for t in range(1, thickness + 1):
-            add_intensity(x, y1 + t, 255)
-
-
-def add_dots(buf: CBufType, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
+        # fill between upper and lower bound, rows below the cell are clipped
+        # to its last row
+        top, bottom = y1 + 1 + position, y1 + thickness + position
+        if top < 0:
+            for t in range(1, thickness + 1):
+                add_intensity(x, y1 + t, 255)
+        elif bottom > top:
+            top, bottom = min(top, max_y), min(bottom, max_y)
+            buf[cell_width * top + x:cell_width * bottom + x + 1:cell_width] = b'\xff' * (bottom - top + 1)
+        elif bottom == top:
+            buf[cell_width * min(top, max_y) + x] = 255
+
+
+def add_pattern_rows(buf: bytearray, cell_width: int, position: int, thickness: int, cell_height: int, row: bytearray) -> None:
+    y = max(0, 1 + position - thickness // 2)
+    num_rows = min(1 + position - thickness // 2 + thickness, cell_height) - y
+    if num_rows > 0:
+        buf[cell_width * y:cell_width * (y + num_rows)] = row * num_rows
+
+
+def add_dots(buf: bytearray, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
     spacing, size = distribute_dots(cell_width, cell_width // (2 * thickness))
-
-    y = 1 + position - thickness // 2
-    for i in range(y, min(y + thickness, cell_height)):
-        for j, s in enumerate(spacing):
-            buf[cell_width * i + j * size + s: cell_width * i + (j + 1) * size + s] = [255] * size
+    row = bytearray(cell_width)
+    for j, s in enumerate(spacing):
+        row[j * size + s:(j + 1) * size + s] = b'\xff' * size
+    add_pattern_rows(buf, cell_width, position, thickness, cell_height, row[:cell_width])
 
 
-def add_dashes(buf: CBufType, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
+def add_dashes(buf: bytearray, cell_width: int, position: int, thickness: int, cell_height: int) -> None:
     halfspace_width = cell_width // 4
-    y = 1 + position - thickness // 2
-    for i in range(y, min(y + thickness, cell_height)):
-        buf[cell_width * i:cell_width * i + (cell_width - 3 * halfspace_width)] = [255] * (cell_width - 3 * halfspace_width)
-        buf[cell_width * i + 3 * halfspace_width:cell_width * (i + 1)] = [255] * (cell_width - 3 * halfspace_width)
+    row = bytearray(cell_width)
+    row[:cell_width - 3 * halfspace_width] = b'\xff' * (cell_width - 3 * halfspace_width)
+    row[3 * halfspace_width:] = b'\xff' * (cell_width - 3 * halfspace_width)
+    add_pattern_rows(buf, cell_width, position, thickness, cell_height, row)
 
 
 def render_special(
@@ -316,17 +338,15 @@ def render_special(
 ) -> CBufType:
     underline_position = min(underline_position, cell_height - sum(divmod(underline_thickness, 2)))
     CharTexture = ctypes.c_ubyte * (cell_width * cell_height)
+    buf = bytearray(cell_width * cell_height)
 
     if missing:
-        buf = bytearray(cell_width * cell_height)
-        render_missing_glyph(buf, cell_width, cell_height)
+        render_missing_glyph(buf, cell_width, cell_height, (dpi_x + dpi_y) / 2.0)
         return CharTexture.from_buffer(buf)
 
-    ans = CharTexture()
-
     def dl(f: UnderlineCallback, *a: Any) -> None:
         try:
-            f(ans, cell_width, *a)
+            f(buf, cell_width, *a)
         except Exception as e:
             log_error(f'Failed to render {f.__name__} at cell_width={cell_width} and cell_height={cell_height} with error: {e}')
 
@@ -338,7 +358,7 @@ def dl(f: UnderlineCallback, *a: Any) -> None:
     if strikethrough:
         dl(add_line, strikethrough_position, strikethrough_thickness, cell_height)
 
-    return ans
+    return CharTexture.from_buffer(buf)
 
 
 def render_cursor(
@@ -351,23 +371,17 @@ def render_cursor(
     dpi_y: float = 0
 ) -> CBufType:
     CharTexture = ctypes.c_ubyte * (cell_width * cell_height)
-    ans = CharTexture()
+    buf = bytearray(cell_width * cell_height)
 
     def vert(edge: str, width_pt: float = 1) -> None:
         width = max(1, min(int(round(width_pt * dpi_x / 72.0)), cell_width))
         left = 0 if edge == 'left' else max(0, cell_width - width)
-        for y in range(cell_height):
-            offset = y * cell_width + left
-            for x in range(offset, offset + width):
-                ans[x] = 255
+        fill_rect(buf, cell_width, left, left + width, 0, cell_height)
 
     def horz(edge: str, height_pt: float = 1) -> None:
         height = max(1, min(int(round(height_pt * dpi_y / 72.0)), cell_height))
         top = 0 if edge == 'top' else max(0, cell_height - height)
-        for y in range(top, top + height):
-            offset = y * cell_width
-            for x in range(cell_width):
-                ans[offset + x] = 255
+        fill_rect(buf, cell_width, 0, cell_width, top, top + height)
 
     if which == 1:  # beam
         vert('left', cursor_beam_thickness)
@@ -378,7 +392,7 @@ def horz(edge: str, height_pt: float = 1) -> None:
         vert('right')
         horz('top')
         horz('bottom')
-    return ans
+    return CharTexture.from_buffer(buf)
 
 
 def prerender_function(
@@ -394,7 +408,32 @@ def prerender_function(
     dpi_x: float,
     dpi_y: float
 ) -> Tuple[Tuple[int, ...], Tuple[CBufType, ...]]:
-    # Pre-render the special underline, strikethrough and missing and cursor cells
+    # Pre-render the special underline, strikethrough and missing and cursor
+    # cells. The cells are only read by the caller, so they are shared between
+    # all font groups (OS windows) with the same metrics.
+    ans = prerender_special_cells(
+        cell_width, cell_height, baseline, underline_position, underline_thickness, strikethrough_position, strikethrough_thickness,
+        cursor_beam_thickness, cursor_underline_thickness, dpi_x, dpi_y, get_options().undercurl_style, box_drawing.scale)
+    prerender_box_glyphs(cell_width, cell_height, (dpi_x + dpi_y) / 2.0)
+    return ans
+
+
+@lru_cache(maxsize=8)
+def prerender_special_cells(
+    cell_width: int,
+    cell_height: int,
+    baseline: int,
+    underline_position: int,
+    underline_thickness: int,
+    strikethrough_position: int,
+    strikethrough_thickness: int,
+    cursor_beam_thickness: float,
+    cursor_underline_thickness: float,
+    dpi_x: float,
+    dpi_y: float,
+    undercurl_style: str,
+    box_scale: Tuple[float, ...],
+) -> Tuple[Tuple[int, ...], Tuple[CBufType, ...]]:
     f = partial(
         render_special, cell_width=cell_width, cell_height=cell_height, baseline=baseline,
         underline_position=underline_position, underline_thickness=underline_thickness,
@@ -416,12 +455,89 @@ def prerender_function(
     return tuple(map(ctypes.addressof, tcells)), tcells
 
 
+BOX_PRERENDER_CHUNK_SIZE = 32
+box_prerender_pool: Optional['ProcessPoolExecutor'] = None
+# number of outstanding chunks for every set of rendering parameters being pre-rendered
+box_prerenders_in_flight: Dict[Tuple[int, int, float, Tuple[float, ...]], int] = {}
+# pending futures, so they can be cancelled on shutdown, as cancel_futures needs Python 3.9
+box_prerender_futures: Set['Future[List[Tuple[int, bytes]]]'] = set()
+
+
+@lru_cache(maxsize=2)
+def common_box_codepoints() -> Tuple[int, ...]:
+    # box drawing, block elements and powerline symbols
+    return tuple(sorted(
+        cp for cp in map(ord, box_drawing.box_chars) if 0x2500 <= cp <= 0x259f or 0xe0b0 <= cp <= 0xe0bf))
+
+
+def prerender_box_glyphs(cell_width: int, cell_height: int, dpi: float) -> None:
+    # Render the commonly used box drawing glyphs for a new cell size in worker
+    # processes so that they are already in the glyph cache by the time they
+    # are first drawn, without blocking the GUI thread
+    global box_prerender_pool
+    boss = get_boss()
+    if boss is None or boss.shutting_down:
+        return
+    key = cell_width, cell_height, dpi, box_drawing.scale
+    if key in box_prerenders_in_flight:
+        return
+    missing = [cp for cp in common_box_codepoints() if box_glyph_cache.table(cell_width * cell_height, *key).get(cp) is None]
+    if not missing:
+        return
+    if box_prerender_pool is None:
+        from kitty.multiprocessing import get_process_pool_executor
+        box_prerender_pool = get_process_pool_executor(max_workers=2)
+
+    def merge_results(fut: 'Future[List[Tuple[int, bytes]]]') -> None:
+        box_prerenders_in_flight[key] -= 1
+        if not box_prerenders_in_flight[key]:
+            del box_prerenders_in_flight[key]
+            if not box_prerenders_in_flight:
+                # font size changes are rare, do not keep idle worker processes around
+                shutdown_box_prerender_pool()
+        if fut.cancelled():
+            return
+        if (err := fut.exception()) is not None:
+            log_error(f'Failed to pre-render box drawing glyphs with error: {err}')
+            return
+        table = box_glyph_cache.table(cell_width * cell_height, *key)
+        for cp, bitmap in fut.result():
+            if table.get(cp) is None:
+                table.set(cp, bitmap)
+
+    box_prerenders_in_flight[key] = 0
+    for i in range(0, len(missing), BOX_PRERENDER_CHUNK_SIZE):
+        fut = box_prerender_pool.submit(
+            box_drawing.render_box_glyphs, missing[i:i+BOX_PRERENDER_CHUNK_SIZE], cell_width, cell_height, dpi, box_drawing.scale)
+        box_prerenders_in_flight[key] += 1
+        box_prerender_futures.add(fut)
+        # done callbacks are run in a thread belonging to the pool
+        fut.add_done_callback(box_prerender_futures.discard)
+        fut.add_done_callback(lambda fut: boss.call_in_main_thread(partial(merge_results, fut)))
+
+
+def shutdown_box_prerender_pool() -> None:
+    global box_prerender_pool
+    if box_prerender_pool is not None:
+        for fut in tuple(box_prerender_futures):
+            fut.cancel()
+        box_prerender_futures.clear()
+        box_prerender_pool.shutdown(wait=False)
+        box_prerender_pool = None
+
+
 def render_box_drawing(codepoint: int, cell_width: int, cell_height: int, dpi: float) -> Tuple[int, CBufType]:
     CharTexture = ctypes.c_ubyte * (cell_width * cell_height)
-    buf = CharTexture()
-    render_box_char(
-        chr(codepoint), cast(BufType, buf), cell_width, cell_height, dpi
-    )
+    table = box_glyph_cache.table(cell_width * cell_height, cell_width, cell_height, dpi, box_drawing.scale)
+    cached = table.get(codepoint)
+    if cached is None:
+        buf = CharTexture()
+        render_box_char(
+            chr(codepoint), cast(BufType, buf), cell_width, cell_height, dpi
+        )
+        table.set(codepoint, bytes(buf))
+    else:
+        buf = CharTexture.from_buffer_copy(cached)
     return ctypes.addressof(buf), buf
 
 
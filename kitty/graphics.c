@@ -10,6 +10,8 @@
 #include "disk-cache.h"
 #include "iqsort.h"
 #include "safe-wrappers.h"
+#include "cleanup.h"
+#include "threading.h"
 
 #include <sys/types.h>
 #include <sys/stat.h>
@@ -26,6 +28,14 @@ PyTypeObject GraphicsManager_Type;
 #define REPORT_ERROR(...) { log_error(__VA_ARGS__); }
 #define RAII_CoalescedFrameData(name, initializer) __attribute__((cleanup(cfd_free))) CoalescedFrameData name = initializer
 
+typedef struct {
+    uint8_t *buf;
+    bool is_4byte_aligned, is_opaque;
+} CoalescedFrameData;
+
+static void
+cfd_free(CoalescedFrameData *p) { free((p)->buf); p->buf = NULL; }
+
 // caching {{{
 #define member_size(type, member) sizeof(((type *)0)->member)
 #define CACHE_KEY_BUFFER_SIZE (member_size(ImageAndFrame, image_id) + member_size(ImageAndFrame, frame_id))
@@ -61,6 +71,77 @@ cache_size(const GraphicsManager *self) { return disk_cache_total_size(self->dis
 #undef CK
 // }}}
 
+// Composed frames cache {{{
+// Composing an animation frame requires reading it and every frame it is
+// based on from the disk cache, so recently composed frames are kept in RAM.
+// Consecutive frames are usually based on each other, which makes composing
+// the next frame during playback cheap.
+
+#define COMPOSED_FRAMES_CACHE_SIZE (32u * 1024u * 1024u)
+
+static void
+forget_composed_frame_at(GraphicsManager *self, size_t i) {
+    ComposedFrame *cf = self->composed_frames.items + i;
+    self->composed_frames.total_size -= MIN(cf->sz, self->composed_frames.total_size);
+    free(cf->buf);
+    remove_i_from_array(self->composed_frames.items, i, self->composed_frames.count);
+}
+
+static void
+forget_composed_frames(GraphicsManager *self, id_type image_id) {
+    // an image_id of zero means all images
+    for (size_t i = self->composed_frames.count; i-- > 0;) {
+        if (!image_id || self->composed_frames.items[i].image_id == image_id) forget_composed_frame_at(self, i);
+    }
+}
+
+static ComposedFrame*
+find_composed_frame(GraphicsManager *self, id_type image_id, uint32_t frame_id) {
+    for (size_t i = 0; i < self->composed_frames.count; i++) {
+        ComposedFrame *cf = self->composed_frames.items + i;
+        if (cf->image_id == image_id && cf->frame_id == frame_id) {
+            cf->last_used = ++self->composed_frames.use_counter;
+            return cf;
+        }
+    }
+    return NULL;
+}
+
+static bool
+copy_composed_frame(GraphicsManager *self, const Image *img, const Frame *f, CoalescedFrameData *ans) {
+    ComposedFrame *cf = find_composed_frame(self, img->internal_id, f->id);
+    if (!cf || !(ans->buf = malloc(cf->sz))) return false;
+    memcpy(ans->buf, cf->buf, cf->sz);
+    ans->is_opaque = cf->is_opaque; ans->is_4byte_aligned = cf->is_4byte_aligned;
+    return true;
+}
+
+static void
+remember_composed_frame(GraphicsManager *self, const Image *img, const Frame *f, const CoalescedFrameData *data) {
+    // only animations are worth caching
+    if (!img->extra_framecnt || find_composed_frame(self, img->internal_id, f->id)) return;
+    const size_t sz = (size_t)img->width * img->height * (data->is_opaque ? 3 : 4);
+    // evict least recently used frames, the frame being added is always kept
+    while (self->composed_frames.count && self->composed_frames.total_size + sz > COMPOSED_FRAMES_CACHE_SIZE) {
+        size_t oldest = 0;
+        for (size_t i = 1; i < self->composed_frames.count; i++) {
+            if (self->composed_frames.items[i].last_used < self->composed_frames.items[oldest].last_used) oldest = i;
+        }
+        forget_composed_frame_at(self, oldest);
+    }
+    uint8_t *buf = malloc(sz);
+    if (!buf) return;
+    memcpy(buf, data->buf, sz);
+    ensure_space_for(&self->composed_frames, items, ComposedFrame, self->composed_frames.count + 1, capacity, 8, false);
+    self->composed_frames.items[self->composed_frames.count++] = (ComposedFrame){
+        .image_id = img->internal_id, .frame_id = f->id, .buf = buf, .sz = sz,
+        .is_opaque = data->is_opaque, .is_4byte_aligned = data->is_4byte_aligned,
+        .last_used = ++self->composed_frames.use_counter,
+    };
+    self->composed_frames.total_size += sz;
+}
+// }}}
+
 
 static inline id_type
 next_id(id_type *counter) {
@@ -153,6 +234,7 @@ free_image_resources(GraphicsManager *self, Image *img) {
         img->extra_frames = NULL;
     }
     free_refs_data(img);
+    forget_composed_frames(self, img->internal_id);
     self->used_storage = img->used_storage <= self->used_storage ? self->used_storage - img->used_storage : 0;
 }
 
@@ -177,8 +259,11 @@ free_all_images(GraphicsManager *self) {
 static void
 dealloc(GraphicsManager* self) {
     free_all_images(self);
+    forget_composed_frames(self, 0);
+    free(self->composed_frames.items);
     free(self->render_data.item);
     Py_CLEAR(self->disk_cache);
+    Py_CLEAR(self->respond_for_testing);
     Py_TYPE(self)->tp_free((PyObject*)self);
 }
 
@@ -235,14 +320,33 @@ static void
 remove_images(GraphicsManager *self, bool(*predicate)(Image*), id_type skip_image_internal_id) {
     Image *img, *tmp;
     HASH_ITER(hh, self->images, img, tmp) {
-        if (img->internal_id != skip_image_internal_id && predicate(img)) {
+        if (img->internal_id != skip_image_internal_id && !img->background_load_id && predicate(img)) {
             remove_image(self, img);
         }
     }
 }
 
+PyObject*
+grman_storage_usage(GraphicsManager *main_grman, GraphicsManager *alt_grman) {
+    unsigned long long image_count = 0, used_storage = 0, cached = 0, cached_on_disk = 0;
+    GraphicsManager *grmans[] = {main_grman, alt_grman};
+    for (size_t i = 0; i < arraysz(grmans); i++) {
+        GraphicsManager *g = grmans[i];
+        image_count += HASH_COUNT(g->images);
+        used_storage += g->used_storage;
+        if (g->disk_cache) {
+            cached += disk_cache_total_size(g->disk_cache);
+            cached_on_disk += disk_cache_size_on_disk(g->disk_cache);
+        }
+    }
+    return Py_BuildValue("{sK sK sK sK sK}",
+        "image_count", image_count, "used_storage", used_storage, "storage_limit", (unsigned long long)main_grman->storage_limit,
+        "disk_cache_size", cached, "disk_cache_size_on_disk", cached_on_disk);
+}
+
 void
 grman_pause_rendering(GraphicsManager *self, GraphicsManager *dest) {
+    if (self) grman_finish_background_loads(self);
     make_window_context_current(dest->window_id);
     free_all_images(dest); dest->images = NULL;
     dest->render_data.count = 0;
@@ -276,6 +380,21 @@ grman_pause_rendering(GraphicsManager *self, GraphicsManager *dest) {
 
 // Loading image data {{{
 
+static size_t
+frame_data_size(const Frame *f) {
+    return (size_t)f->width * f->height * (f->is_opaque ? 3 : 4);
+}
+
+static void
+account_frame_storage(GraphicsManager *self, Image *img, const Frame *f, bool added) {
+    const size_t sz = frame_data_size(f);
+    if (added) { img->used_storage += sz; self->used_storage += sz; }
+    else {
+        img->used_storage -= MIN(sz, img->used_storage);
+        self->used_storage -= MIN(sz, self->used_storage);
+    }
+}
+
 static bool
 trim_predicate(Image *img) {
     return !img->root_frame_data_loaded || !img->refs;
@@ -283,7 +402,8 @@ trim_predicate(Image *img) {
 
 static int
 oldest_img_first(const Image *a, const Image *b) {
-    return a->atime - b->atime;
+    // atime is 64 bit so the difference cannot be returned as an int
+    return (a->atime > b->atime) - (a->atime < b->atime);
 }
 
 static void
@@ -292,14 +412,22 @@ apply_storage_quota(GraphicsManager *self, size_t storage_limit, id_type current
     remove_images(self, trim_predicate, currently_added_image_internal_id);
     if (self->used_storage < storage_limit) return;
 
+    // Least recently used images first, used_storage accounts for the data of
+    // all frames of an image, so big animations are not under counted
     HASH_SORT(self->images, oldest_img_first);
-    while (self->used_storage > storage_limit && self->images) {
-        remove_image(self, self->images);
+    Image *img = self->images, *next;
+    while (self->used_storage > storage_limit && img) {
+        next = img->hh.next;
+        // images still being decoded use no storage yet and their load must complete
+        if (!img->background_load_id) remove_image(self, img);
+        img = next;
     }
     if (!self->images) self->used_storage = 0;  // sanity check
 }
 
-static char command_response[512] = {0};
+// Thread local so that image data can be decoded in background threads, see
+// decode_load_data()
+static _Thread_local char command_response[512] = {0};
 
 static void
 set_command_failed_response(const char *code, const char *fmt, ...) {
@@ -334,7 +462,7 @@ err:
 static const char*
 zlib_strerror(int ret) {
 #define Z(x) case x: return #x;
-    static char buf[128];
+    static _Thread_local char buf[128];
     switch(ret) {
         case Z_ERRNO:
             return strerror(errno);
@@ -576,42 +704,51 @@ load_image_data(GraphicsManager *self, Image *img, const GraphicsCommand *g, con
     return img;
 }
 
+static bool
+decode_load_data(LoadData *load_data, const unsigned char compressed, const uint32_t data_fmt) {
+    // Only uses load_data and thread local state, so can be called from any thread
+#define FAIL(code, ...) { set_command_failed_response(code, __VA_ARGS__); load_data->loading_completed_successfully = false; free_load_data(load_data); return false; }
+    uint8_t *buf; size_t bufsz;
+#define IB { if (load_data->buf) { buf = load_data->buf; bufsz = load_data->buf_used; } else { buf = load_data->mapped_file; bufsz = load_data->mapped_file_sz; } }
+    switch(compressed) {
+        case 'z':
+            IB;
+            if (!inflate_zlib(load_data, buf, bufsz)) {
+                load_data->loading_completed_successfully = false; return false;
+            }
+            break;
+        case 0:
+            break;
+        default:
+            FAIL("EINVAL", "Unknown image compression: %c", compressed);
+    }
+    switch(data_fmt) {
+        case PNG:
+            IB;
+            if (!inflate_png(load_data, buf, bufsz)) {
+                load_data->loading_completed_successfully = false; return false;
+            }
+            break;
+        default: break;
+    }
+#undef IB
+    load_data->data = load_data->buf;
+    if (load_data->buf_used < load_data->data_sz) {
+        FAIL("ENODATA", "Insufficient image data: %zu < %zu", load_data->buf_used, load_data->data_sz);
+    }
+    if (load_data->mapped_file) {
+        munmap(load_data->mapped_file, load_data->mapped_file_sz);
+        load_data->mapped_file = NULL; load_data->mapped_file_sz = 0;
+    }
+    return true;
+#undef FAIL
+}
+
 static Image*
 process_image_data(GraphicsManager *self, Image* img, const GraphicsCommand *g, const unsigned char transmission_type, const uint32_t data_fmt) {
     bool needs_processing = g->compressed || data_fmt == PNG;
     if (needs_processing) {
-        uint8_t *buf; size_t bufsz;
-#define IB { if (self->currently_loading.buf) { buf = self->currently_loading.buf; bufsz = self->currently_loading.buf_used; } else { buf = self->currently_loading.mapped_file; bufsz = self->currently_loading.mapped_file_sz; } }
-        switch(g->compressed) {
-            case 'z':
-                IB;
-                if (!inflate_zlib(&self->currently_loading, buf, bufsz)) {
-                    self->currently_loading.loading_completed_successfully = false; return NULL;
-                }
-                break;
-            case 0:
-                break;
-            default:
-                ABRT("EINVAL", "Unknown image compression: %c", g->compressed);
-        }
-        switch(data_fmt) {
-            case PNG:
-                IB;
-                if (!inflate_png(&self->currently_loading, buf, bufsz)) {
-                    self->currently_loading.loading_completed_successfully = false; return NULL;
-                }
-                break;
-            default: break;
-        }
-#undef IB
-        self->currently_loading.data = self->currently_loading.buf;
-        if (self->currently_loading.buf_used < self->currently_loading.data_sz) {
-            ABRT("ENODATA", "Insufficient image data: %zu < %zu", self->currently_loading.buf_used, self->currently_loading.data_sz);
-        }
-        if (self->currently_loading.mapped_file) {
-            munmap(self->currently_loading.mapped_file, self->currently_loading.mapped_file_sz);
-            self->currently_loading.mapped_file = NULL; self->currently_loading.mapped_file_sz = 0;
-        }
+        if (!decode_load_data(&self->currently_loading, g->compressed, data_fmt)) return NULL;
     } else {
         if (transmission_type == 'd') {
             if (self->currently_loading.buf_used < self->currently_loading.data_sz) {
@@ -683,12 +820,304 @@ upload_to_gpu(GraphicsManager *self, Image *img, const bool is_opaque, const boo
     if (img->texture) send_image_to_gpu(&img->texture->id, data, img->width, img->height, is_opaque, is_4byte_aligned, true, REPEAT_CLAMP);
 }
 
+static Image*
+complete_image_load(GraphicsManager *self, Image *img, bool is_query) {
+    size_t required_sz = (size_t)(self->currently_loading.is_opaque ? 3 : 4) * self->currently_loading.width * self->currently_loading.height;
+    if (self->currently_loading.data_sz != required_sz) ABRT("EINVAL", "Image dimensions: %ux%u do not match data size: %zu, expected size: %zu", self->currently_loading.width, self->currently_loading.height, self->currently_loading.data_sz, required_sz);
+    if (self->currently_loading.loading_completed_successfully) {
+        img->width = self->currently_loading.width;
+        img->height = self->currently_loading.height;
+        if (img->root_frame.id) remove_from_cache(self, (const ImageAndFrame){.image_id=img->internal_id, .frame_id=img->root_frame.id});
+        img->root_frame = (const Frame){
+            .id = ++img->frame_id_counter,
+            .is_opaque = self->currently_loading.is_opaque,
+            .is_4byte_aligned = self->currently_loading.is_4byte_aligned,
+            .width = img->width, .height = img->height,
+        };
+        if (!is_query) {
+            if (!add_to_cache(self, (const ImageAndFrame){.image_id = img->internal_id, .frame_id=img->root_frame.id}, self->currently_loading.data, self->currently_loading.data_sz)) {
+                if (PyErr_Occurred()) PyErr_Print();
+                ABRT("ENOSPC", "Failed to store image data in disk cache");
+            }
+            upload_to_gpu(self, img, img->root_frame.is_opaque, img->root_frame.is_4byte_aligned, self->currently_loading.data);
+            self->used_storage += required_sz;
+            img->used_storage = required_sz;
+        }
+        img->root_frame_data_loaded = true;
+    }
+    return img;
+}
+
+
+static const char*
+format_command_response(const GraphicsCommand *g, bool data_loaded, char *response, char *rbuf, const size_t rbuf_sz) {
+    bool is_ok_response = !response[0];
+    if (g->quiet) {
+        if (is_ok_response || g->quiet > 1) return NULL;
+    }
+    if (g->id || g->image_number) {
+        if (is_ok_response) {
+            if (!data_loaded) return NULL;
+            snprintf(response, 10, "OK");
+        }
+        size_t pos = 0;
+        rbuf[pos++] = 'G';
+#define print(fmt, ...) if (rbuf_sz - 1 > pos) pos += snprintf(rbuf + pos, rbuf_sz - 1 - pos, fmt, __VA_ARGS__)
+        if (g->id) print("i=%u", g->id);
+        if (g->image_number) print(",I=%u", g->image_number);
+        if (g->placement_id) print(",p=%u", g->placement_id);
+        if (g->num_lines && (g->action == 'f' || g->action == 'a')) print(",r=%u", g->num_lines);
+        print(";%s", response);
+        return rbuf;
+#undef print
+    }
+    return NULL;
+}
+
+// Background decoding {{{
+// Decompressing and decoding large PNG images takes a long time, blocking the
+// parsing of output from all children. So image data that is transmitted
+// without being displayed is decoded in a pool of worker threads, and the
+// image is added and the response sent on the main thread once decoding is
+// done. Pending loads are completed before any later command or response
+// for the window, so the order of responses is preserved.
+
+#define MAX_DECODE_THREADS 4u
+#define MIN_BACKGROUND_DECODE_SIZE (256u * 1024u)
+
+typedef enum { DECODE_QUEUED, DECODE_RUNNING, DECODE_DONE } DecodeState;
+
+typedef struct DecodeJob {
+    GraphicsManager *grman;
+    id_type id, image_id;
+    LoadData load_data;
+    unsigned char compressed;
+    uint32_t data_fmt;
+    DecodeState state;
+    bool ok;
+    char response[sizeof(command_response)];
+    struct DecodeJob *next;
+} DecodeJob;
+
+static struct {
+    pthread_mutex_t lock;
+    pthread_cond_t job_available, job_done;
+    pthread_t threads[MAX_DECODE_THREADS];
+    unsigned num_threads;
+    DecodeJob *head, *tail;
+    id_type job_id_counter;
+    bool shutting_down;
+} decoder = {.lock = PTHREAD_MUTEX_INITIALIZER, .job_available = PTHREAD_COND_INITIALIZER, .job_done = PTHREAD_COND_INITIALIZER};
+
+static void
+run_decode_job(DecodeJob *job) {
+    command_response[0] = 0;
+    job->ok = decode_load_data(&job->load_data, job->compressed, job->data_fmt);
+    if (!job->ok) memcpy(job->response, command_response, sizeof(job->response));
+}
+
+static void*
+decode_worker(void *x UNUSED) {
+    set_thread_name("ImageDecoder");
+    pthread_mutex_lock(&decoder.lock);
+    while (!decoder.shutting_down) {
+        DecodeJob *job = decoder.head;
+        while (job && job->state != DECODE_QUEUED) job = job->next;
+        if (!job) { pthread_cond_wait(&decoder.job_available, &decoder.lock); continue; }
+        job->state = DECODE_RUNNING;
+        pthread_mutex_unlock(&decoder.lock);
+        run_decode_job(job);
+        pthread_mutex_lock(&decoder.lock);
+        job->state = DECODE_DONE;
+        pthread_cond_broadcast(&decoder.job_done);
+        wakeup_main_loop();
+    }
+    pthread_mutex_unlock(&decoder.lock);
+    return NULL;
+}
+
+static bool
+start_decoder_threads(void) {
+    // must be called with the lock held
+    if (decoder.num_threads) return true;
+    const long num_cpus = sysconf(_SC_NPROCESSORS_ONLN);
+    const unsigned count = num_cpus < 2 ? 1 : MIN((unsigned)num_cpus, MAX_DECODE_THREADS);
+    while (decoder.num_threads < count) {
+        if (pthread_create(&decoder.threads[decoder.num_threads], NULL, decode_worker, NULL) != 0) break;
+        decoder.num_threads++;
+    }
+    return decoder.num_threads > 0;
+}
+
+static void
+shutdown_decoder(void) {
+    pthread_mutex_lock(&decoder.lock);
+    decoder.shutting_down = true;
+    pthread_cond_broadcast(&decoder.job_available);
+    pthread_mutex_unlock(&decoder.lock);
+    for (unsigned i = 0; i < decoder.num_threads; i++) pthread_join(decoder.threads[i], NULL);
+    decoder.num_threads = 0;
+}
+
+static bool
+should_decode_in_background(const GraphicsManager *self, const GraphicsCommand *g, const uint32_t data_fmt) {
+    // Only for transmit only commands as displaying an image needs its
+    // dimensions, which are known only after decoding
+    const bool for_testing = self->respond_for_testing && self->respond_for_testing != Py_None;
+    if ((!self->window_id && !for_testing) || decoder.shutting_down || (g->action && g->action != 't')) return false;
+    if (!g->compressed && data_fmt != PNG) return false;
+    if (for_testing) return true;  // so that tests can use small images
+    const LoadData *ld = &self->currently_loading;
+    return (ld->buf ? ld->buf_used : ld->mapped_file_sz) >= MIN_BACKGROUND_DECODE_SIZE;
+}
+
+static bool
+decode_in_background(GraphicsManager *self, Image *img, const unsigned char compressed, const uint32_t data_fmt, const uint32_t quiet) {
+    DecodeJob *job = calloc(1, sizeof(DecodeJob));
+    if (!job) return false;
+    pthread_mutex_lock(&decoder.lock);
+    if (!start_decoder_threads()) {
+        pthread_mutex_unlock(&decoder.lock);
+        free(job);
+        return false;
+    }
+    job->grman = self; Py_INCREF(self);
+    job->id = ++decoder.job_id_counter;
+    job->image_id = img->internal_id;
+    job->compressed = compressed; job->data_fmt = data_fmt;
+    job->load_data = self->currently_loading;
+    if (quiet) job->load_data.start_command.quiet = quiet;
+    self->currently_loading = (const LoadData){0};
+    img->background_load_id = job->id;
+    self->num_loads_in_background++;
+    if (decoder.tail) decoder.tail->next = job;
+    else decoder.head = job;
+    decoder.tail = job;
+    pthread_cond_signal(&decoder.job_available);
+    pthread_mutex_unlock(&decoder.lock);
+    return true;
+}
+
+static void
+unlink_decode_job(DecodeJob *job) {
+    // must be called with the lock held
+    DecodeJob *prev = NULL;
+    for (DecodeJob *j = decoder.head; j; prev = j, j = j->next) {
+        if (j == job) {
+            if (prev) prev->next = j->next;
+            else decoder.head = j->next;
+            if (decoder.tail == j) decoder.tail = prev;
+            break;
+        }
+    }
+}
+
+static void
+finish_background_load(DecodeJob *job) {
+    GraphicsManager *self = job->grman;
+    const GraphicsCommand g = job->load_data.start_command;
+    bool data_loaded = job->ok;
+    Image *img = img_by_internal_id(self, job->image_id);
+    // the image may have been deleted or replaced while it was being decoded
+    if (!img) {
+        if (job->ok) {
+            snprintf(job->response, sizeof(job->response), "ENOENT:Image was deleted before its data was decoded");
+            data_loaded = false;
+        }
+    } else if (img->background_load_id == job->id) {
+        img->background_load_id = 0;
+        if (job->ok) {
+            LoadData saved = self->currently_loading;
+            self->currently_loading = job->load_data;
+            job->load_data = (const LoadData){0};
+            command_response[0] = 0;
+            self->context_made_current_for_this_command = false;
+            data_loaded = complete_image_load(self, img, false) != NULL;
+            if (!data_loaded) memcpy(job->response, command_response, sizeof(job->response));
+            free_load_data(&self->currently_loading);
+            self->currently_loading = saved;
+            self->layers_dirty = true;
+        }
+    }
+    free_load_data(&job->load_data);
+    char rbuf[sizeof(job->response) + 128];
+    const char *response = format_command_response(&g, data_loaded, job->response, rbuf, arraysz(rbuf));
+    if (response) {
+        if (self->window_id) schedule_write_to_child(self->window_id, 3, "\033_", (size_t)2, response, strlen(response), "\033\\", (size_t)2);
+        else if (self->respond_for_testing && self->respond_for_testing != Py_None) {
+            PyObject *ret = PyObject_CallFunction(self->respond_for_testing, "y", response);
+            if (ret == NULL) PyErr_Print();
+            Py_XDECREF(ret);
+        }
+    }
+    if (self->used_storage > self->storage_limit) apply_storage_quota(self, self->storage_limit, data_loaded ? job->image_id : 0);
+    self->num_loads_in_background--;
+    Py_DECREF(self);
+    free(job);
+}
+
+void
+grman_finish_background_loads(GraphicsManager *self) {
+    // Wait for all pending loads for self to complete, in order
+    if (!self->num_loads_in_background) return;
+    char saved_response[sizeof(command_response)];
+    memcpy(saved_response, command_response, sizeof(saved_response));
+    pthread_mutex_lock(&decoder.lock);
+    while (self->num_loads_in_background) {
+        DecodeJob *job = decoder.head;
+        while (job && job->grman != self) job = job->next;
+        if (!job) break;
+        if (job->state == DECODE_QUEUED) {
+            // no worker has started on it yet, faster to decode it here than to wait
+            job->state = DECODE_RUNNING;
+            pthread_mutex_unlock(&decoder.lock);
+            run_decode_job(job);
+            pthread_mutex_lock(&decoder.lock);
+            job->state = DECODE_DONE;
+        }
+        while (job->state != DECODE_DONE) pthread_cond_wait(&decoder.job_done, &decoder.lock);
+        unlink_decode_job(job);
+        pthread_mutex_unlock(&decoder.lock);
+        finish_background_load(job);
+        pthread_mutex_lock(&decoder.lock);
+    }
+    pthread_mutex_unlock(&decoder.lock);
+    memcpy(command_response, saved_response, sizeof(saved_response));
+}
+
+void
+grman_process_finished_background_loads(void) {
+    // Called on every tick of the main loop, the list is only modified on the main thread
+    if (!decoder.head) return;
+    char saved_response[sizeof(command_response)];
+    memcpy(saved_response, command_response, sizeof(saved_response));
+    pthread_mutex_lock(&decoder.lock);
+    DecodeJob *job = decoder.head;
+    while (job) {
+        bool ready = job->state == DECODE_DONE;
+        // loads for a window must be completed in the order they were started
+        for (DecodeJob *j = decoder.head; ready && j != job; j = j->next) {
+            if (j->grman == job->grman) ready = false;
+        }
+        if (!ready) { job = job->next; continue; }
+        unlink_decode_job(job);
+        pthread_mutex_unlock(&decoder.lock);
+        finish_background_load(job);
+        pthread_mutex_lock(&decoder.lock);
+        job = decoder.head;
+    }
+    pthread_mutex_unlock(&decoder.lock);
+    memcpy(command_response, saved_response, sizeof(saved_response));
+}
+// }}}
+
 static Image*
 handle_add_command(GraphicsManager *self, const GraphicsCommand *g, const uint8_t *payload, bool *is_dirty, uint32_t iid, bool is_query) {
     bool existing, init_img = true;
     Image *img = NULL;
     unsigned char tt = g->transmission_type ? g->transmission_type : 'd';
     uint32_t fmt = g->format ? g->format : RGBA;
+    const uint32_t quiet = g->quiet;
     if (tt == 'd' && self->currently_loading.loading_for.image_id) init_img = false;
     if (init_img) {
         self->currently_loading.loading_for = (const ImageAndFrame){0};
@@ -702,6 +1131,7 @@ handle_add_command(GraphicsManager *self, const GraphicsCommand *g, const uint8_
             img->is_drawn = false;
             img->current_frame_shown_at = 0;
             img->extra_framecnt = 0;
+            img->background_load_id = 0;
             *is_dirty = true;
             self->layers_dirty = true;
         } else {
@@ -726,59 +1156,17 @@ handle_add_command(GraphicsManager *self, const GraphicsCommand *g, const uint8_
     img = load_image_data(self, img, g, tt, fmt, payload);
     if (!img || !self->currently_loading.loading_completed_successfully) return NULL;
         self->currently_loading.loading_for = (const ImageAndFrame){0};
+    if (!is_query && should_decode_in_background(self, g, fmt) && decode_in_background(self, img, g->compressed, fmt, quiet)) return img;
     img = process_image_data(self, img, g, tt, fmt);
     if (!img) return NULL;
-    size_t required_sz = (size_t)(self->currently_loading.is_opaque ? 3 : 4) * self->currently_loading.width * self->currently_loading.height;
-    if (self->currently_loading.data_sz != required_sz) ABRT("EINVAL", "Image dimensions: %ux%u do not match data size: %zu, expected size: %zu", self->currently_loading.width, self->currently_loading.height, self->currently_loading.data_sz, required_sz);
-    if (self->currently_loading.loading_completed_successfully) {
-        img->width = self->currently_loading.width;
-        img->height = self->currently_loading.height;
-        if (img->root_frame.id) remove_from_cache(self, (const ImageAndFrame){.image_id=img->internal_id, .frame_id=img->root_frame.id});
-        img->root_frame = (const Frame){
-            .id = ++img->frame_id_counter,
-            .is_opaque = self->currently_loading.is_opaque,
-            .is_4byte_aligned = self->currently_loading.is_4byte_aligned,
-            .width = img->width, .height = img->height,
-        };
-        if (!is_query) {
-            if (!add_to_cache(self, (const ImageAndFrame){.image_id = img->internal_id, .frame_id=img->root_frame.id}, self->currently_loading.data, self->currently_loading.data_sz)) {
-                if (PyErr_Occurred()) PyErr_Print();
-                ABRT("ENOSPC", "Failed to store image data in disk cache");
-            }
-            upload_to_gpu(self, img, img->root_frame.is_opaque, img->root_frame.is_4byte_aligned, self->currently_loading.data);
-            self->used_storage += required_sz;
-            img->used_storage = required_sz;
-        }
-        img->root_frame_data_loaded = true;
-    }
-    return img;
+    return complete_image_load(self, img, is_query);
 #undef MAX_DATA_SZ
 }
 
 static const char*
 finish_command_response(const GraphicsCommand *g, bool data_loaded) {
     static char rbuf[sizeof(command_response)/sizeof(command_response[0]) + 128];
-    bool is_ok_response = !command_response[0];
-    if (g->quiet) {
-        if (is_ok_response || g->quiet > 1) return NULL;
-    }
-    if (g->id || g->image_number) {
-        if (is_ok_response) {
-            if (!data_loaded) return NULL;
-            snprintf(command_response, 10, "OK");
-        }
-        size_t pos = 0;
-        rbuf[pos++] = 'G';
-#define print(fmt, ...) if (arraysz(rbuf) - 1 > pos) pos += snprintf(rbuf + pos, arraysz(rbuf) - 1 - pos, fmt, __VA_ARGS__)
-        if (g->id) print("i=%u", g->id);
-        if (g->image_number) print(",I=%u", g->image_number);
-        if (g->placement_id) print(",p=%u", g->placement_id);
-        if (g->num_lines && (g->action == 'f' || g->action == 'a')) print(",r=%u", g->num_lines);
-        print(";%s", command_response);
-        return rbuf;
-#undef print
-    }
-    return NULL;
+    return format_command_response(g, data_loaded, command_response, rbuf, arraysz(rbuf));
 }
 
 // }}}
@@ -1198,6 +1586,7 @@ grman_update_layers(GraphicsManager *self, unsigned int scrolled_by, float scree
     self->last_scrolled_by = scrolled_by;
     if (!self->layers_dirty) return false;
     self->layers_dirty = false;
+    const monotonic_t now = monotonic();
     size_t i;
     self->num_of_below_refs = 0;
     self->num_of_negative_refs = 0;
@@ -1272,6 +1661,8 @@ grman_update_layers(GraphicsManager *self, unsigned int scrolled_by, float scree
             remove_image(self, img);
             continue;
         }
+        // images that are displayed are the last to be evicted by the storage quota
+        if (img->is_drawn) img->atime = now;
         if (img->is_drawn && !was_drawn && img->animation_state != ANIMATION_STOPPED && img->extra_framecnt && img->animation_duration) {
             self->has_images_needing_animation = true;
             global_state.check_for_active_animated_images = true;
@@ -1338,11 +1729,6 @@ change_gap(Image *img, Frame *f, int32_t gap) {
     img->animation_duration += f->gap;
 }
 
-typedef struct {
-    uint8_t *buf;
-    bool is_4byte_aligned, is_opaque;
-} CoalescedFrameData;
-
 static void
 blend_on_opaque(uint8_t *under_px, const uint8_t *over_px) {
     const float alpha = (float)over_px[3] / 255.f;
@@ -1482,6 +1868,7 @@ static CoalescedFrameData
 get_coalesced_frame_data_impl(GraphicsManager *self, Image *img, const Frame *f, unsigned count) {
     CoalescedFrameData ans = {0};
     if (count > 32) return ans;  // prevent stack overflows, infinite recursion
+    if (copy_composed_frame(self, img, f, &ans)) return ans;
     size_t frame_data_sz; void *frame_data;
     ImageAndFrame key = {.image_id = img->internal_id, .frame_id = f->id};
     if (!read_from_cache(self, key, &frame_data, &frame_data_sz)) return ans;
@@ -1504,7 +1891,9 @@ get_coalesced_frame_data_impl(GraphicsManager *self, Image *img, const Frame *f,
 
 static CoalescedFrameData
 get_coalesced_frame_data(GraphicsManager *self, Image *img, const Frame *f) {
-    return get_coalesced_frame_data_impl(self, img, f, 0);
+    CoalescedFrameData ans = get_coalesced_frame_data_impl(self, img, f, 0);
+    if (ans.buf) remember_composed_frame(self, img, f, &ans);
+    return ans;
 }
 
 static void
@@ -1539,6 +1928,103 @@ reference_chain_too_large(Image *img, const Frame *frame) {
     return num >= 5 || drawn_area >= limit;
 }
 
+static void
+replace_load_data(LoadData *ld, uint8_t *data, size_t sz) {
+    // takes ownership of data
+    free_load_data(ld);
+    ld->buf = data; ld->buf_capacity = sz; ld->buf_used = sz;
+    ld->data = data; ld->data_sz = sz;
+}
+
+static bool
+changed_rect(const uint8_t *a, const uint8_t *b, const uint32_t width, const uint32_t height, const unsigned bytes_per_pixel, Frame *r) {
+    // Find the bounding rectangle of the pixels that differ between a and b
+    const size_t row_sz = (size_t)width * bytes_per_pixel;
+#define row(buf, y) ((buf) + (size_t)(y) * row_sz)
+#define same_pixel(x, y) (memcmp(row(a, y) + (size_t)(x) * bytes_per_pixel, row(b, y) + (size_t)(x) * bytes_per_pixel, bytes_per_pixel) == 0)
+    uint32_t top = 0, bottom = height, left = width, right = 0;
+    while (top < height && memcmp(row(a, top), row(b, top), row_sz) == 0) top++;
+    if (top == height) return false;
+    while (memcmp(row(a, bottom - 1), row(b, bottom - 1), row_sz) == 0) bottom--;
+    for (uint32_t y = top; y < bottom; y++) {
+        uint32_t x = 0;
+        while (x < left && same_pixel(x, y)) x++;
+        left = x;
+        x = width;
+        while (x > right && same_pixel(x - 1, y)) x--;
+        right = x;
+    }
+#undef same_pixel
+#undef row
+    r->x = left; r->y = top; r->width = right - left; r->height = bottom - top;
+    return true;
+}
+
+static void
+store_as_delta(GraphicsManager *self, Image *img, const Frame *prev, Frame *f, LoadData *ld) {
+    // Programs that cannot compute frame differences, such as players of
+    // screen recordings, send complete frames. Store only the rectangle that
+    // changed from the previous frame, with a key frame whenever the chain of
+    // deltas gets too long, to bound the cost of composing a frame.
+    if (!prev || reference_chain_too_large(img, prev)) return;
+    RAII_CoalescedFrameData(prev_data, get_coalesced_frame_data(self, img, prev));
+    if (!prev_data.buf) { if (PyErr_Occurred()) PyErr_Print(); return; }
+    uint8_t *frame_data = malloc(ld->data_sz);
+    if (!frame_data) return;
+    memcpy(frame_data, ld->data, ld->data_sz);
+    RAII_CoalescedFrameData(cfd, get_coalesced_frame_data_standalone(img, f, frame_data));
+    if (!cfd.buf || cfd.is_opaque != prev_data.is_opaque) return;
+    const unsigned bytes_per_pixel = cfd.is_opaque ? 3 : 4;
+    Frame r = {.width = 1, .height = 1};  // an unchanged frame is stored as a single pixel
+    changed_rect(prev_data.buf, cfd.buf, img->width, img->height, bytes_per_pixel, &r);
+    if (r.width == img->width && r.height == img->height) return;
+    const size_t row_sz = (size_t)r.width * bytes_per_pixel;
+    uint8_t *delta = malloc(row_sz * r.height);
+    if (!delta) return;
+    for (uint32_t y = 0; y < r.height; y++) {
+        memcpy(delta + y * row_sz, cfd.buf + ((size_t)(r.y + y) * img->width + r.x) * bytes_per_pixel, row_sz);
+    }
+    replace_load_data(ld, delta, row_sz * r.height);
+    f->x = r.x; f->y = r.y; f->width = r.width; f->height = r.height;
+    f->base_frame_id = prev->id; f->bgcolor = 0; f->alpha_blend = false; f->is_implicit_delta = true;
+    f->is_opaque = cfd.is_opaque; f->is_4byte_aligned = bytes_per_pixel == 4 || r.width % 4 == 0;
+    remember_composed_frame(self, img, f, &cfd);
+}
+
+static bool
+is_composed_from(Image *img, const Frame *f, const Frame *base) {
+    // Whether base is in the chain of frames that f is composed from
+    for (unsigned count = 0; f->base_frame_id && count < 32; count++) {
+        if (f->base_frame_id == base->id) return true;
+        if (!(f = frame_for_id(img, f->base_frame_id))) break;
+    }
+    return false;
+}
+
+static void
+make_dependent_deltas_standalone(GraphicsManager *self, Image *img, const Frame *base) {
+    // Frames stored as implicit deltas were transmitted as complete frames, so
+    // they must not change when a frame they are composed from is modified or
+    // deleted, even via explicit deltas in between. Store them as complete
+    // frames before that happens. Frames are checked in order, so once a
+    // delta is standalone later deltas based on it no longer depend on base.
+    for (unsigned i = 0; i <= img->extra_framecnt; i++) {
+        Frame *f = i ? img->extra_frames + i - 1 : &img->root_frame;
+        if (!f->is_implicit_delta || !is_composed_from(img, f, base)) continue;
+        RAII_CoalescedFrameData(cfd, get_coalesced_frame_data(self, img, f));
+        const ImageAndFrame key = {.image_id = img->internal_id, .frame_id = f->id};
+        if (!cfd.buf || !add_to_cache(self, key, cfd.buf, (size_t)img->width * img->height * (cfd.is_opaque ? 3 : 4))) {
+            if (PyErr_Occurred()) PyErr_Print();
+            continue;
+        }
+        account_frame_storage(self, img, f, false);
+        f->x = 0; f->y = 0; f->width = img->width; f->height = img->height;
+        f->base_frame_id = 0; f->bgcolor = 0; f->alpha_blend = false; f->is_implicit_delta = false;
+        f->is_opaque = cfd.is_opaque; f->is_4byte_aligned = cfd.is_4byte_aligned;
+        account_frame_storage(self, img, f, true);
+    }
+}
+
 static Image*
 handle_animation_frame_load_command(GraphicsManager *self, GraphicsCommand *g, Image *img, const uint8_t *payload, bool *is_dirty) {
     uint32_t frame_number = g->frame_number, fmt = g->format ? g->format : RGBA;
@@ -1610,8 +2096,7 @@ handle_animation_frame_load_command(GraphicsManager *self, GraphicsCommand *g, I
                     .needs_blending = transmitted_frame.alpha_blend && !transmitted_frame.is_opaque
                 };
                 compose(d, cfd.buf, load_data->data);
-                free_load_data(load_data);
-                load_data->data = cfd.buf; load_data->data_sz = (size_t)img->width * img->height * d.under_px_sz;
+                replace_load_data(load_data, cfd.buf, (size_t)img->width * img->height * d.under_px_sz);
                 transmitted_frame.width = img->width; transmitted_frame.height = img->height;
                 transmitted_frame.x = 0; transmitted_frame.y = 0;
                 transmitted_frame.is_4byte_aligned = cfd.is_4byte_aligned;
@@ -1619,13 +2104,14 @@ handle_animation_frame_load_command(GraphicsManager *self, GraphicsCommand *g, I
             } else {
                 transmitted_frame.base_frame_id = other_frame->id;
             }
-        }
+        } else store_as_delta(self, img, frame_for_number(img, frame_number - 1), &transmitted_frame, load_data);
         *frame = transmitted_frame;
         if (!add_to_cache(self, key, load_data->data, load_data->data_sz)) {
             img->extra_framecnt--;
             if (PyErr_Occurred()) PyErr_Print();
             ABRT("ENOSPC", "Failed to cache data for image frame");
         }
+        account_frame_storage(self, img, frame, true);
         img->animation_duration += frame->gap;
         if (img->animation_state == ANIMATION_LOADING) {
             self->has_images_needing_animation = true;
@@ -1637,9 +2123,13 @@ handle_animation_frame_load_command(GraphicsManager *self, GraphicsCommand *g, I
         if (g->gap != 0) change_gap(img, frame, transmitted_frame.gap);
         CoalescedFrameData cfd = get_coalesced_frame_data(self, img, frame);
         if (!cfd.buf) ABRT("EINVAL", "No data associated with frame number: %u", frame_number);
-        frame->alpha_blend = false; frame->base_frame_id = 0; frame->bgcolor = 0;
+        make_dependent_deltas_standalone(self, img, frame);
+        forget_composed_frames(self, img->internal_id);
+        account_frame_storage(self, img, frame, false);
+        frame->alpha_blend = false; frame->base_frame_id = 0; frame->bgcolor = 0; frame->is_implicit_delta = false;
         frame->is_opaque = cfd.is_opaque; frame->is_4byte_aligned = cfd.is_4byte_aligned;
         frame->x = 0; frame->y = 0; frame->width = img->width; frame->height = img->height;
+        account_frame_storage(self, img, frame, true);
         const unsigned bytes_per_pixel = frame->is_opaque ? 3: 4;
         ComposeData d = {
             .over_px_sz = transmitted_frame.is_opaque ? 3 : 4, .under_px_sz = bytes_per_pixel,
@@ -1681,6 +2171,8 @@ handle_delete_frame_command(GraphicsManager *self, const GraphicsCommand *g, boo
     if (!frame_number) frame_number = 1;
     if (!img->extra_framecnt) return g->delete_action == 'F' ? img : NULL;
     *is_dirty = true;
+    make_dependent_deltas_standalone(self, img, frame_for_number(img, frame_number));
+    forget_composed_frames(self, img->internal_id);
     ImageAndFrame key = {.image_id=img->internal_id};
     bool remove_root = frame_number == 1;
     uint32_t removed_gap = 0;
@@ -1688,6 +2180,7 @@ handle_delete_frame_command(GraphicsManager *self, const GraphicsCommand *g, boo
         key.frame_id = img->root_frame.id;
         remove_from_cache(self, key);
         if (PyErr_Occurred()) PyErr_Print();
+        account_frame_storage(self, img, &img->root_frame, false);
         removed_gap = img->root_frame.gap;
         img->root_frame = img->extra_frames[0];
     }
@@ -1696,6 +2189,7 @@ handle_delete_frame_command(GraphicsManager *self, const GraphicsCommand *g, boo
         key.frame_id = img->extra_frames[removed_idx].id;
         removed_gap = img->extra_frames[removed_idx].gap;
         remove_from_cache(self, key);
+        account_frame_storage(self, img, img->extra_frames + removed_idx, false);
     }
     img->animation_duration = removed_gap < img->animation_duration ? img->animation_duration - removed_gap : 0;
     if (PyErr_Occurred()) PyErr_Print();
@@ -1798,9 +2292,6 @@ scan_active_animations(GraphicsManager *self, const monotonic_t now, monotonic_t
 // }}}
 
 // {{{ composition a=c
-static void
-cfd_free(CoalescedFrameData *p) { free((p)->buf); p->buf = NULL; }
-
 static void
 handle_compose_command(GraphicsManager *self, bool *is_dirty, const GraphicsCommand *g, Image *img) {
     Frame *src_frame = frame_for_number(img, g->frame_number);
@@ -1851,6 +2342,8 @@ handle_compose_command(GraphicsManager *self, bool *is_dirty, const GraphicsComm
         .over_width = width, .over_height = height, .under_width = width, .under_height = height,
         .stride = img->width
     };
+    make_dependent_deltas_standalone(self, img, dest_frame);
+    forget_composed_frames(self, img->internal_id);
     compose_rectangles(d, dest_data.buf, src_data.buf);
     const ImageAndFrame key = { .image_id = img->internal_id, .frame_id = dest_frame->id };
     if (!add_to_cache(self, key, dest_data.buf, ((size_t)(dest_data.is_opaque ? 3 : 4)) * img->width * img->height)) {
@@ -1858,8 +2351,11 @@ handle_compose_command(GraphicsManager *self, bool *is_dirty, const GraphicsComm
         set_command_failed_response("ENOSPC", "Failed to store image data in disk cache");
     }
     // frame is now a fully coalesced frame
+    account_frame_storage(self, img, dest_frame, false);
     dest_frame->x = 0; dest_frame->y = 0; dest_frame->width = img->width; dest_frame->height = img->height;
-    dest_frame->base_frame_id = 0; dest_frame->bgcolor = 0;
+    dest_frame->base_frame_id = 0; dest_frame->bgcolor = 0; dest_frame->is_implicit_delta = false;
+    dest_frame->is_opaque = dest_data.is_opaque; dest_frame->is_4byte_aligned = dest_data.is_4byte_aligned;
+    account_frame_storage(self, img, dest_frame, true);
     *is_dirty = (g->other_frame_number - 1) == img->current_frame_index;
     if (*is_dirty) update_current_frame(self, img, &dest_data);
 }
@@ -2156,6 +2652,8 @@ grman_rescale(GraphicsManager *self, CellPixelSize cell) {
 const char*
 grman_handle_command(GraphicsManager *self, const GraphicsCommand *g, const uint8_t *payload, Cursor *c, bool *is_dirty, CellPixelSize cell) {
     const char *ret = NULL;
+    // pending loads must complete before commands that could refer to their images
+    if (g->action && g->action != 't') grman_finish_background_loads(self);
     command_response[0] = 0;
     self->context_made_current_for_this_command = false;
 
@@ -2173,6 +2671,7 @@ grman_handle_command(GraphicsManager *self, const GraphicsCommand *g, const uint
             bool is_query = g->action == 'q';
             if (is_query) { iid = 0; if (!q_iid) { REPORT_ERROR("Query graphics command without image id"); break; } }
             Image *image = handle_add_command(self, g, payload, is_dirty, iid, is_query);
+            if (image && image->background_load_id) break;  // the response is sent once decoding is done
             if (!self->currently_loading.loading_for.image_id) free_load_data(&self->currently_loading);
             GraphicsCommand *lg = &self->currently_loading.start_command;
             if (g->quiet) lg->quiet = g->quiet;
@@ -2348,12 +2847,19 @@ W(update_layers) {
     return ans;
 }
 
+static PyObject*
+pyfinish_background_loads(GraphicsManager *self, PyObject *args UNUSED) {
+    grman_finish_background_loads(self);
+    Py_RETURN_NONE;
+}
+
 #define M(x, va) {#x, (PyCFunction)py##x, va, ""}
 
 static PyMethodDef methods[] = {
     M(image_for_client_id, METH_O),
     M(image_for_client_number, METH_O),
     M(update_layers, METH_VARARGS),
+    M(finish_background_loads, METH_NOARGS),
     {NULL}  /* Sentinel */
 };
 
@@ -2370,6 +2876,7 @@ static PyGetSetDef getsets[] = {
 static PyMemberDef members[] = {
     {"storage_limit", T_PYSSIZET, offsetof(GraphicsManager, storage_limit), 0, "storage_limit"},
     {"disk_cache", T_OBJECT_EX, offsetof(GraphicsManager, disk_cache), READONLY, "disk_cache"},
+    {"respond_for_testing", T_OBJECT, offsetof(GraphicsManager, respond_for_testing), 0, "respond_for_testing"},
     {NULL},
 };
 
@@ -2411,10 +2918,123 @@ pycreate_canvas(PyObject *self UNUSED, PyObject *args) {
     return ans;
 }
 
+// Resizing {{{
+// When shrinking, resampling uses a box filter, i.e. each destination pixel is
+// the average of the source pixels it covers, weighted by coverage, and when
+// enlarging, linear interpolation. Done separably, first horizontally then
+// vertically. Colors are weighted by alpha so that transparent pixels do not
+// darken the edges of opaque regions.
+
+typedef struct {
+    uint32_t *start, *count, max_count;
+    float *weights;
+} Contributions;
+
+static void
+free_contributions(Contributions *c) {
+    free(c->start); free(c->count); free(c->weights);
+    *c = (Contributions){0};
+}
+
+static bool
+compute_contributions(Contributions *c, const uint32_t src_sz, const uint32_t dest_sz) {
+    const double scale = (double)src_sz / dest_sz;
+    c->max_count = (uint32_t)ceil(scale) + 1;
+    c->start = malloc(sizeof(c->start[0]) * dest_sz);
+    c->count = malloc(sizeof(c->count[0]) * dest_sz);
+    c->weights = malloc(sizeof(c->weights[0]) * dest_sz * c->max_count);
+    if (!c->start || !c->count || !c->weights) { free_contributions(c); return false; }
+    for (uint32_t i = 0; i < dest_sz; i++) {
+        float *w = c->weights + (size_t)i * c->max_count;
+        if (scale < 1) {
+            // enlarging, interpolate linearly between the two nearest pixels
+            const double center = MAX(0., (i + 0.5) * scale - 0.5);
+            const uint32_t first = MIN((uint32_t)center, src_sz - 1);
+            const float frac = (float)(center - first);
+            c->start[i] = first; c->count[i] = 1; w[0] = 1.f;
+            if (first + 1 < src_sz && frac > 0) { c->count[i] = 2; w[0] = 1.f - frac; w[1] = frac; }
+            continue;
+        }
+        const double left = i * scale, right = MIN((i + 1) * scale, (double)src_sz);
+        const uint32_t first = (uint32_t)left, last = MIN((uint32_t)ceil(right), src_sz);
+        c->start[i] = first; c->count[i] = 0;
+        for (uint32_t x = first; x < last && c->count[i] < c->max_count; x++) {
+            const double overlap = MIN(right, (double)x + 1) - MAX(left, (double)x);
+            w[c->count[i]++] = (float)(overlap / (right - left));
+        }
+    }
+    return true;
+}
+
+static void
+resize_pixels(const uint8_t *src, const uint32_t width, const uint32_t height, uint8_t *dest, const uint32_t new_width, const uint32_t new_height, const unsigned bpp, const Contributions *horiz, const Contributions *vert, float *tmp) {
+    const bool has_alpha = bpp == 4;
+    // horizontal pass into tmp which is new_width x height, with colors premultiplied by alpha
+    for (uint32_t y = 0; y < height; y++) {
+        const uint8_t *row = src + (size_t)y * width * bpp;
+        float *out = tmp + (size_t)y * new_width * bpp;
+        for (uint32_t x = 0; x < new_width; x++, out += bpp) {
+            const float *w = horiz->weights + (size_t)x * horiz->max_count;
+            const uint8_t *px = row + (size_t)horiz->start[x] * bpp;
+            float acc[4] = {0};
+            for (uint32_t i = 0; i < horiz->count[x]; i++, px += bpp) {
+                const float a = has_alpha ? w[i] * px[3] : w[i];
+                acc[0] += a * px[0]; acc[1] += a * px[1]; acc[2] += a * px[2];
+                if (has_alpha) acc[3] += a;
+            }
+            for (unsigned c = 0; c < bpp; c++) out[c] = acc[c];
+        }
+    }
+    // vertical pass
+    const size_t stride = (size_t)new_width * bpp;
+    for (uint32_t y = 0; y < new_height; y++) {
+        const float *w = vert->weights + (size_t)y * vert->max_count;
+        uint8_t *out = dest + (size_t)y * stride;
+        for (size_t x = 0; x < stride; x += bpp) {
+            const float *px = tmp + (size_t)vert->start[y] * stride + x;
+            float acc[4] = {0};
+            for (uint32_t i = 0; i < vert->count[y]; i++, px += stride) {
+                for (unsigned c = 0; c < bpp; c++) acc[c] += w[i] * px[c];
+            }
+            const float divisor = has_alpha ? acc[3] : 1.f;
+            if (has_alpha) {
+                out[x + 3] = (uint8_t)MIN(255.f, acc[3] + 0.5f);
+                if (divisor <= 0) { out[x] = 0; out[x + 1] = 0; out[x + 2] = 0; continue; }
+            }
+            for (unsigned c = 0; c < 3; c++) out[x + c] = (uint8_t)MIN(255.f, acc[c] / divisor + 0.5f);
+        }
+    }
+}
+
+static PyObject*
+pyresize_image_data(PyObject *self UNUSED, PyObject *args) {
+    unsigned int width, height, new_width, new_height, bytes_per_pixel;
+    RAII_PY_BUFFER(src);
+    if (!PyArg_ParseTuple(args, "y*IIIII", &src, &width, &height, &new_width, &new_height, &bytes_per_pixel)) return NULL;
+    if (bytes_per_pixel != 3 && bytes_per_pixel != 4) { PyErr_SetString(PyExc_ValueError, "bytes_per_pixel must be 3 or 4"); return NULL; }
+    if (!width || !height || !new_width || !new_height) { PyErr_SetString(PyExc_ValueError, "Zero width or height not allowed"); return NULL; }
+    if ((size_t)src.len < (size_t)width * height * bytes_per_pixel) { PyErr_SetString(PyExc_ValueError, "Insufficient image data for specified dimensions"); return NULL; }
+    PyObject *ans = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)new_width * new_height * bytes_per_pixel);
+    if (!ans) return NULL;
+    Contributions horiz = {0}, vert = {0};
+    float *tmp = malloc(sizeof(float) * new_width * height * bytes_per_pixel);
+    if (!tmp || !compute_contributions(&horiz, width, new_width) || !compute_contributions(&vert, height, new_height)) {
+        free(tmp); free_contributions(&horiz); free_contributions(&vert); Py_DECREF(ans);
+        return PyErr_NoMemory();
+    }
+    Py_BEGIN_ALLOW_THREADS
+    resize_pixels(src.buf, width, height, (uint8_t*)PyBytes_AS_STRING(ans), new_width, new_height, bytes_per_pixel, &horiz, &vert, tmp);
+    Py_END_ALLOW_THREADS
+    free(tmp); free_contributions(&horiz); free_contributions(&vert);
+    return ans;
+}
+// }}}
+
 static PyMethodDef module_methods[] = {
     M(shm_write, METH_VARARGS),
     M(shm_unlink, METH_VARARGS),
     M(create_canvas, METH_VARARGS),
+    M(resize_image_data, METH_VARARGS),
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
@@ -2426,6 +3046,7 @@ init_graphics(PyObject *module) {
     if (PyModule_AddFunctions(module, module_methods) != 0) return false;
     if (PyModule_AddIntMacro(module, IMAGE_PLACEHOLDER_CHAR) != 0) return false;
     Py_INCREF(&GraphicsManager_Type);
+    register_at_exit_cleanup_func(GRAPHICS_CLEANUP_FUNC, shutdown_decoder);
     return true;
 }
 // }}}
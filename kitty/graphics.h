@@ -56,9 +56,21 @@ typedef struct {
 
 typedef struct {
     uint32_t gap, id, width, height, x, y, base_frame_id, bgcolor;
-    bool is_opaque, is_4byte_aligned, alpha_blend;
+    // is_implicit_delta is set for frames that were transmitted as complete
+    // frames but are stored as only the rectangle that differs from the
+    // previous frame
+    bool is_opaque, is_4byte_aligned, alpha_blend, is_implicit_delta;
 } Frame;
 
+typedef struct {
+    id_type image_id;
+    uint32_t frame_id;
+    uint8_t *buf;
+    size_t sz;
+    bool is_opaque, is_4byte_aligned;
+    uint64_t last_used;
+} ComposedFrame;
+
 typedef enum { ANIMATION_STOPPED = 0, ANIMATION_LOADING = 1, ANIMATION_RUNNING = 2} AnimationState;
 
 typedef struct TextureRef {
@@ -83,6 +95,8 @@ typedef struct {
     AnimationState animation_state;
     uint32_t max_loops, current_loop;
     monotonic_t current_frame_shown_at;
+    // Non-zero while the image data is being decoded in a background thread
+    id_type background_load_id;
 
     hash_handle_type hh;
 } Image;
@@ -141,6 +155,15 @@ typedef struct {
     PyObject *disk_cache;
     bool has_images_needing_animation, context_made_current_for_this_command;
     id_type window_id;
+    unsigned int num_loads_in_background;
+    // When set, image data is decoded in the background even without a window
+    // and responses to such loads are passed to it, used in tests
+    PyObject *respond_for_testing;
+    struct {
+        ComposedFrame *items;
+        size_t count, capacity, total_size;
+        uint64_t use_counter;
+    } composed_frames;
 } GraphicsManager;
 
 
@@ -197,3 +220,6 @@ bool png_from_data(void *png_data, size_t png_data_sz, const char *path_for_erro
 bool scan_active_animations(GraphicsManager *self, const monotonic_t now, monotonic_t *minimum_gap, bool os_window_context_set);
 void scale_rendered_graphic(ImageRenderData*, float xstart, float ystart, float x_scale, float y_scale);
 void grman_pause_rendering(GraphicsManager *self, GraphicsManager *dest);
+void grman_finish_background_loads(GraphicsManager *self);
+void grman_process_finished_background_loads(void);
+PyObject* grman_storage_usage(GraphicsManager *main_grman, GraphicsManager *alt_grman);
@@ -2,7 +2,8 @@
 # License: GPL v3 Copyright: 2016, Kovid Goyal <kovid at kovidgoyal.net>
 
 from gettext import gettext as _
-from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Sequence, TypeVar
+from weakref import WeakKeyDictionary
 
 from .constants import is_macos
 from .fast_data_types import (
@@ -25,9 +26,11 @@
 from .typing import ScreenType
 
 if TYPE_CHECKING:
+    from .search_query_parser import SearchTreeNode
     from .window import Window
 
 mod_mask = GLFW_MOD_ALT | GLFW_MOD_CONTROL | GLFW_MOD_SHIFT | GLFW_MOD_SUPER | GLFW_MOD_META | GLFW_MOD_HYPER
+T = TypeVar('T')
 
 
 def keyboard_mode_name(screen: ScreenType) -> str:
@@ -37,7 +40,7 @@ def keyboard_mode_name(screen: ScreenType) -> str:
     return 'application' if screen.cursor_key_mode else 'normal'
 
 
-def get_shortcut(keymap: KeyMap, ev: KeyEvent) -> Optional[List[KeyDefinition]]:
+def get_shortcut(keymap: Mapping[SingleKey, T], ev: KeyEvent) -> Optional[T]:
     mods = ev.mods & mod_mask
     ans = keymap.get(SingleKey(mods, False, ev.key))
     if ans is None and ev.shifted_key and mods & GLFW_MOD_SHIFT:
@@ -59,12 +62,99 @@ def shortcut_matches(s: SingleKey, ev: KeyEvent) -> bool:
     return False
 
 
+class KeyTrie:
+
+    '''
+    A node in a compiled keymap. definitions are all the key definitions whose
+    key sequence passes through this node, in the order they were defined.
+    '''
+
+    __slots__ = ('depth', 'definitions', 'children')
+
+    def __init__(self, depth: int = 0) -> None:
+        self.depth = depth
+        self.definitions: List[KeyDefinition] = []
+        self.children: Dict[SingleKey, KeyTrie] = {}
+
+    def is_terminal(self, defn: KeyDefinition) -> bool:
+        return len(defn.rest) + 1 == self.depth
+
+
+def compile_keymap(keymap: KeyMap) -> KeyTrie:
+    root = KeyTrie()
+    for trigger, definitions in keymap.items():
+        for defn in definitions:
+            node = root
+            # The keymap key is used rather than defn.trigger, as definitions
+            # created at runtime, such as for visual window selection, are
+            # added to the keymap without setting trigger
+            for key in (trigger,) + defn.rest:
+                child = node.children.get(key)
+                if child is None:
+                    child = node.children[key] = KeyTrie(node.depth + 1)
+                node = child
+                node.definitions.append(defn)
+    return root
+
+
+def is_cacheable_match(location: str, query: str) -> bool:
+    # Whether the result of matching the focused window against this term can
+    # only change when the focus, title or user variables change
+    if location == 'id':
+        return not query.startswith('-')
+    if location == 'state':
+        return query in ('active', 'focused', 'parent_active', 'parent_focused', 'self')
+    return location in ('title', 'pid', 'env', 'var')
+
+
+class FocusCondition:
+
+    ' A --when-focus-on expression, parsed once when the keymap is compiled '
+
+    def __init__(self, expr: str) -> None:
+        from .search_query_parser import build_tree
+        from .window import window_match_locations
+        self.expr = expr
+        self.query: Optional['SearchTreeNode'] = None
+        try:
+            self.query = build_tree(expr, window_match_locations)
+        except Exception:
+            # evaluated every time, reporting the error to the user then
+            self.is_cacheable = False
+        else:
+            self.is_cacheable = all(is_cacheable_match(n.location, n.query) for n in self.query.iter_token_nodes())
+
+
+class SequenceMode(KeyboardMode):
+
+    ' The mode used while in the middle of a multi-key shortcut '
+
+    sequence_keys: List[KeyEvent]
+
+    def __init__(self, ev: KeyEvent, node: KeyTrie, candidates: Sequence[KeyDefinition]) -> None:
+        super().__init__('__sequence__')
+        self.on_action = 'end'
+        self.sequence_keys = [ev]
+        self.advance(node, candidates)
+
+    def advance(self, node: KeyTrie, candidates: Sequence[KeyDefinition]) -> None:
+        self.node = node
+        self.candidates: FrozenSet[int] = frozenset(map(id, candidates))
+
+    def candidates_for(self, node: KeyTrie) -> List[KeyDefinition]:
+        return [d for d in node.definitions if id(d) in self.candidates]
+
+
 class Mappings:
 
     ' Manage all keyboard mappings '
 
     def __init__(self, global_shortcuts:Optional[Dict[str, SingleKey]] = None, callback_on_mode_change: Callable[[], Any] = lambda: None) -> None:
         self.keyboard_mode_stack: List[KeyboardMode] = []
+        self.compiled_keymaps: 'WeakKeyDictionary[KeyboardMode, KeyTrie]' = WeakKeyDictionary()
+        self.focus_conditions: Dict[str, FocusCondition] = {}
+        self.focus_match_cache: Dict[str, bool] = {}
+        self.focus_match_cache_window_id = 0
         self.update_keymap(global_shortcuts)
         self.callback_on_mode_change = callback_on_mode_change
 
@@ -82,6 +172,44 @@ def update_keymap(self, global_shortcuts:Optional[Dict[str, SingleKey]] = None)
         self.keyboard_modes[''].keymap = km = km.copy()
         for sc in self.global_shortcuts.values():
             km.pop(sc, None)
+        self.compiled_keymaps.clear()
+        self.focus_conditions.clear()
+        self.invalidate_focus_match_cache()
+        for mode in self.keyboard_modes.values():
+            self.compiled_keymap(mode)
+
+    def compiled_keymap(self, mode: KeyboardMode) -> KeyTrie:
+        if isinstance(mode, SequenceMode):
+            return mode.node
+        ans = self.compiled_keymaps.get(mode)
+        if ans is None:
+            ans = self.compiled_keymaps[mode] = compile_keymap(mode.keymap)
+            for node in ans.children.values():
+                for defn in node.definitions:
+                    if defn.options.when_focus_on:
+                        self.focus_condition(defn.options.when_focus_on)
+        return ans
+
+    def focus_condition(self, expr: str) -> FocusCondition:
+        ans = self.focus_conditions.get(expr)
+        if ans is None:
+            ans = self.focus_conditions[expr] = FocusCondition(expr)
+        return ans
+
+    def invalidate_focus_match_cache(self) -> None:
+        self.focus_match_cache.clear()
+
+    def focus_matches(self, w: 'Window', expr: str) -> bool:
+        condition = self.focus_condition(expr)
+        if not condition.is_cacheable:
+            return self.window_matches(w, condition)
+        if w.id != self.focus_match_cache_window_id:
+            self.focus_match_cache.clear()
+            self.focus_match_cache_window_id = w.id
+        ans = self.focus_match_cache.get(expr)
+        if ans is None:
+            ans = self.focus_match_cache[expr] = self.window_matches(w, condition)
+        return ans
 
     def clear_keyboard_modes(self) -> None:
         had_mode = bool(self.keyboard_mode_stack)
@@ -114,7 +242,7 @@ def push_keyboard_mode(self, new_mode: str) -> None:
         mode = self.keyboard_modes[new_mode]
         self._push_keyboard_mode(mode)
 
-    def matching_key_actions(self, candidates: Iterable[KeyDefinition]) -> List[KeyDefinition]:
+    def matching_key_actions(self, candidates: Iterable[KeyDefinition], node: KeyTrie) -> List[KeyDefinition]:
         w = self.get_active_window()
         matches = []
         has_sequence_match = False
@@ -122,7 +250,7 @@ def matching_key_actions(self, candidates: Iterable[KeyDefinition]) -> List[KeyD
             is_applicable = False
             if x.options.when_focus_on:
                 try:
-                    if w and w in self.match_windows(x.options.when_focus_on):
+                    if w and self.focus_matches(w, x.options.when_focus_on):
                         is_applicable = True
                 except Exception:
                     self.clear_keyboard_modes()
@@ -133,12 +261,12 @@ def matching_key_actions(self, candidates: Iterable[KeyDefinition]) -> List[KeyD
                 is_applicable = True
             if is_applicable:
                 matches.append(x)
-                if x.is_sequence:
+                if not node.is_terminal(x):
                     has_sequence_match = True
         if has_sequence_match:
             last_terminal_idx = -1
             for i, x in enumerate(matches):
-                if not x.rest:
+                if node.is_terminal(x):
                     last_terminal_idx = i
             if last_terminal_idx > -1:
                 if last_terminal_idx == len(matches) -1:
@@ -147,7 +275,7 @@ def matching_key_actions(self, candidates: Iterable[KeyDefinition]) -> List[KeyD
                     matches = matches[last_terminal_idx+1:]
             q = matches[-1].options.when_focus_on
             matches = [x for x in matches if x.options.when_focus_on == q]
-        else:
+        elif matches:
             matches = [matches[-1]]
         return matches
 
@@ -155,11 +283,14 @@ def dispatch_possible_special_key(self, ev: KeyEvent) -> bool:
         # Handles shortcuts, return True if the key was consumed
         is_root_mode = not self.keyboard_mode_stack
         mode = self.keyboard_modes[''] if is_root_mode else self.keyboard_mode_stack[-1]
-        key_action = get_shortcut(mode.keymap, ev)
-        if key_action is None:
+        node = get_shortcut(self.compiled_keymap(mode).children, ev)
+        candidates: Sequence[KeyDefinition] = ()
+        if node is not None:
+            candidates = mode.candidates_for(node) if isinstance(mode, SequenceMode) else node.definitions
+        if node is None or not candidates:
             if is_modifier_key(ev.key):
                 return False
-            if self.global_shortcuts_map and get_shortcut(self.global_shortcuts_map, ev):
+            if self.global_shortcuts_map and get_shortcut(self.global_shortcuts_map, ev) is not None:
                 return True
             if not is_root_mode:
                 if mode.sequence_keys is not None:
@@ -178,20 +309,15 @@ def dispatch_possible_special_key(self, ev: KeyEvent) -> bool:
                 self.ring_bell()
                 return True
         else:
-            final_actions = self.matching_key_actions(key_action)
+            final_actions = self.matching_key_actions(candidates, node)
             if final_actions:
                 mode_pos = len(self.keyboard_mode_stack) - 1
-                if final_actions[0].is_sequence:
-                    if mode.sequence_keys is None:
-                        sm = KeyboardMode('__sequence__')
-                        sm.on_action = 'end'
-                        sm.sequence_keys = [ev]
-                        for fa in final_actions:
-                            sm.keymap[fa.rest[0]].append(fa.shift_sequence_and_copy())
-                        self._push_keyboard_mode(sm)
+                if isinstance(mode, SequenceMode) or not node.is_terminal(final_actions[0]):
+                    if not isinstance(mode, SequenceMode):
+                        self._push_keyboard_mode(SequenceMode(ev, node, final_actions))
                         self.debug_print('\n\x1b[35mKeyPress\x1b[m matched sequence prefix, ', end='')
                     else:
-                        if len(final_actions) == 1 and not final_actions[0].rest:
+                        if len(final_actions) == 1 and node.is_terminal(final_actions[0]):
                             self.pop_keyboard_mode()
                             consumed = self.combine(final_actions[0].definition)
                             if not consumed:
@@ -201,9 +327,7 @@ def dispatch_possible_special_key(self, ev: KeyEvent) -> bool:
                             return consumed
                         mode.sequence_keys.append(ev)
                         self.debug_print('\n\x1b[35mKeyPress\x1b[m matched sequence prefix, ', end='')
-                        mode.keymap.clear()
-                        for fa in final_actions:
-                            mode.keymap[fa.rest[0]].append(fa.shift_sequence_and_copy())
+                        mode.advance(node, final_actions)
                     return True
                 final_action = final_actions[0]
                 consumed = self.combine(final_action.definition)
@@ -223,6 +347,11 @@ def get_active_window(self) -> Optional['Window']:
     def match_windows(self, expr: str) -> Iterator['Window']:
         return get_boss().match_windows(expr)
 
+    def window_matches(self, w: 'Window', condition: FocusCondition) -> bool:
+        if condition.query is None:
+            return w in self.match_windows(condition.expr)
+        return get_boss().window_matches_query(w, condition.query)
+
     def show_error(self, title: str, msg: str) -> None:
         return get_boss().show_error(title, msg)
 
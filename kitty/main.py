@@ -29,6 +29,7 @@
     running_in_kitty,
     website_url,
 )
+from .debug_startup import startup_milestone
 from .fast_data_types import (
     GLFW_MOD_ALT,
     GLFW_MOD_SHIFT,
@@ -270,8 +271,10 @@ def _run_app(opts: Options, args: CLIOptions, bad_lines: Sequence[BadLine] = ())
                     pre_show_callback,
                     args.title or appname, args.name or args.cls or appname,
                     wincls, wstate, load_all_shaders, disallow_override_title=bool(args.title), layer_shell_config=run_app.layer_shell_config)
+        startup_milestone('OS window created')
         boss = Boss(opts, args, cached_values, global_shortcuts)
         boss.start(window_id, startup_sessions)
+        startup_milestone('Startup session created')
         if bad_lines or boss.misc_config_errors:
             boss.show_bad_config_lines(bad_lines, boss.misc_config_errors)
             boss.misc_config_errors = []
@@ -294,6 +297,7 @@ def __call__(self, opts: Options, args: CLIOptions, bad_lines: Sequence[BadLine]
         set_options(opts, is_wayland(), args.debug_rendering, args.debug_font_fallback)
         try:
             set_font_family(opts, debug_font_matching=args.debug_font_fallback)
+            startup_milestone('Fonts loaded')
             _run_app(opts, args, bad_lines)
         finally:
             set_options(None)
@@ -484,6 +488,7 @@ def set_locale() -> None:
 
 
 def _main() -> None:
+    startup_milestone('Python modules imported')
     running_in_kitty(True)
 
     args = sys.argv[1:]
@@ -528,6 +533,7 @@ def _main() -> None:
             return
     bad_lines: List[BadLine] = []
     opts = create_opts(cli_opts, accumulate_bad_lines=bad_lines)
+    startup_milestone('Config loaded')
     setup_environment(opts, cli_opts)
 
     # set_locale on macOS uses cocoa APIs when LANG is not set, so we have to
@@ -548,6 +554,7 @@ def _main() -> None:
     # kitty can handle them. See https://github.com/kovidgoyal/kitty/issues/4636
     mask_kitty_signals_process_wide()
     init_glfw(opts, cli_opts.debug_keyboard, cli_opts.debug_rendering)
+    startup_milestone('GLFW initialized')
     try:
         with setup_profiling():
             # Avoid needing to launch threads to reap zombies
@@ -10,9 +10,11 @@
 #include "cleanup.h"
 #include "state.h"
 #include <lcms2.h>
+#include <pthread.h>
 
 
 static cmsHPROFILE srgb_profile = NULL;
+static pthread_mutex_t srgb_profile_lock = PTHREAD_MUTEX_INITIALIZER;
 struct fake_file { const uint8_t *buf; size_t sz, cur; };
 
 static void
@@ -83,13 +85,13 @@ inflate_png_inner(png_read_data *d, const uint8_t *buf, size_t bufsz) {
         if (png_get_iCCP(png, info, &name, &compression_type, &profdata, &proflen) & PNG_INFO_iCCP) {
             input_profile = cmsOpenProfileFromMem(profdata, proflen);
             if (input_profile) {
-                if (!srgb_profile) {
-                    srgb_profile = cmsCreate_sRGBProfile();
-                    if (!srgb_profile) ABRT(ENOMEM, "Out of memory allocating sRGB colorspace profile");
-                }
-                colorspace_transform = cmsCreateTransform(
+                // images are decoded in multiple threads, see graphics.c
+                pthread_mutex_lock(&srgb_profile_lock);
+                if (!srgb_profile) srgb_profile = cmsCreate_sRGBProfile();
+                if (srgb_profile) colorspace_transform = cmsCreateTransform(
                     input_profile, TYPE_RGBA_8, srgb_profile, TYPE_RGBA_8, INTENT_PERCEPTUAL, 0);
-
+                pthread_mutex_unlock(&srgb_profile_lock);
+                if (!srgb_profile) ABRT(ENOMEM, "Out of memory allocating sRGB colorspace profile");
             }
         }
     }
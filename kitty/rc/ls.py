@@ -26,7 +26,9 @@ class LS(RemoteCommand):
         f' operating system {appname} windows. Each OS window has an :italic:`id` and a list'
         ' of :italic:`tabs`. Each tab has its own :italic:`id`, a :italic:`title` and a list of :italic:`windows`.'
         ' Each window has an :italic:`id`, :italic:`title`, :italic:`current working directory`, :italic:`process id (PID)`,'
-        ' :italic:`command-line` and :italic:`environment` of the process running in the window. Additionally, when'
+        ' :italic:`command-line` and :italic:`environment` of the process running in the window. The :italic:`graphics`'
+        ' key has the number of images in the window and the bytes they use in memory and in the disk cache, useful'
+        ' for sizing the graphics storage quota. Additionally, when'
         ' running the command inside a kitty window, that window can be identified by the :italic:`is_self` parameter.\n\n'
         'You can use these criteria to select windows/tabs for the other commands.\n\n'
         'You can limit the windows/tabs in the output by using the :option:`--match` and :option:`--match-tab` options.'
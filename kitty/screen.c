@@ -975,9 +975,17 @@ get_prefix_and_suffix_for_escape_code(unsigned char which, const char ** prefix,
     }
 }
 
+static void
+finish_background_image_loads(Screen *self) {
+    // so that responses to graphics commands are sent before responses to later escape codes
+    grman_finish_background_loads(self->main_grman);
+    grman_finish_background_loads(self->alt_grman);
+}
+
 bool
 write_escape_code_to_child(Screen *self, unsigned char which, const char *data) {
     bool written = false;
+    finish_background_image_loads(self);
     const char *prefix, *suffix;
     get_prefix_and_suffix_for_escape_code(which, &prefix, &suffix);
     if (self->window_id) {
@@ -998,6 +1006,7 @@ write_escape_code_to_child(Screen *self, unsigned char which, const char *data)
 static bool
 write_escape_code_to_child_python(Screen *self, unsigned char which, PyObject *data) {
     bool written = false;
+    finish_background_image_loads(self);
     const char *prefix, *suffix;
     get_prefix_and_suffix_for_escape_code(which, &prefix, &suffix);
     if (self->window_id) written = schedule_write_to_child_python(self->window_id, prefix, data, suffix);
@@ -2396,6 +2405,7 @@ process_cwd_notification(Screen *self, unsigned int code, const char *data, size
         if (x) {
             Py_CLEAR(self->last_reported_cwd);
             self->last_reported_cwd = x;
+            CALLBACK("on_cwd_reported", NULL);
         } else { PyErr_Clear(); }
     }  // we ignore OSC 6 document reporting as we dont have a use for it
 }
@@ -4461,6 +4471,20 @@ send_escape_code_to_child(Screen *self, PyObject *args) {
     if (written) { Py_RETURN_TRUE; } else { Py_RETURN_FALSE; }
 }
 
+static PyObject*
+write_buffer_credit(Screen *self, PyObject *args) {
+    unsigned long window, resume_below;
+    if (!PyArg_ParseTuple(args, "kk", &window, &resume_below)) return NULL;
+    size_t credit = 0;
+    pthread_mutex_lock(&self->write_buf_lock);
+    if (self->write_buf_used < window) {
+        credit = window - self->write_buf_used;
+        self->write_buf_drain_threshold = 0;
+    } else self->write_buf_drain_threshold = MAX(1u, resume_below);
+    pthread_mutex_unlock(&self->write_buf_lock);
+    return PyLong_FromSize_t(credit);
+}
+
 static void
 screen_mark_all(Screen *self) {
     for (index_type y = 0; y < self->main_linebuf->ynum; y++) {
@@ -4729,6 +4753,11 @@ line_edge_colors(Screen *self, PyObject *a UNUSED) {
     return Py_BuildValue("kk", (unsigned long)left, (unsigned long)right);
 }
 
+static PyObject*
+graphics_usage(Screen *self, PyObject *a UNUSED) {
+    return grman_storage_usage(self->main_grman, self->alt_grman);
+}
+
 WRAP0(update_only_line_graphics_data)
 WRAP0(bell)
 
@@ -4766,6 +4795,7 @@ static PyMethodDef methods[] = {
     METHODB(test_commit_write_buffer, METH_VARARGS),
     METHODB(test_parse_written_data, METH_VARARGS),
     MND(line_edge_colors, METH_NOARGS)
+    MND(graphics_usage, METH_NOARGS)
     MND(line, METH_O)
     MND(dump_lines_with_attrs, METH_O)
     MND(cursor_at_prompt, METH_NOARGS)
@@ -4835,6 +4865,7 @@ static PyMethodDef methods[] = {
     MND(scroll, METH_VARARGS)
     MND(scroll_to_prompt, METH_VARARGS)
     MND(send_escape_code_to_child, METH_VARARGS)
+    MND(write_buffer_credit, METH_VARARGS)
     MND(pause_rendering, METH_VARARGS)
     MND(hyperlink_at, METH_VARARGS)
     MND(toggle_alt_screen, METH_NOARGS)
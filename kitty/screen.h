@@ -114,6 +114,9 @@ typedef struct {
     uint8_t *write_buf;
     size_t write_buf_sz, write_buf_used;
     pthread_mutex_t write_buf_lock;
+    // when non-zero, on_write_buffer_drained() is called once write_buf_used drops to this
+    size_t write_buf_drain_threshold;
+    bool write_buf_drained;
 
     CursorRenderInfo cursor_render_info;
 
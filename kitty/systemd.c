@@ -46,6 +46,13 @@ FUNC(sd_bus_message_open_container, int, sd_bus_message *m, char type, const cha
 FUNC(sd_bus_message_close_container, int, sd_bus_message *m);
 FUNC(sd_pid_get_user_slice, int, pid_t pid, char **slice);
 FUNC(sd_bus_call, int, sd_bus *bus, sd_bus_message *m, uint64_t usec, sd_bus_error *ret_error, sd_bus_message **reply);
+typedef int (*sd_bus_message_handler_t)(sd_bus_message *m, void *userdata, sd_bus_error *ret_error);
+typedef struct sd_bus_slot sd_bus_slot;
+FUNC(sd_bus_call_async, int, sd_bus *bus, sd_bus_slot **slot, sd_bus_message *m, sd_bus_message_handler_t callback, void *userdata, uint64_t usec);
+FUNC(sd_bus_process, int, sd_bus *bus, sd_bus_message **r);
+FUNC(sd_bus_wait, int, sd_bus *bus, uint64_t timeout_usec);
+FUNC(sd_bus_slot_unref, sd_bus_slot*, sd_bus_slot *slot);
+FUNC(sd_bus_message_get_error, const sd_bus_error*, sd_bus_message *m);
 
 static void
 ensure_initialized(void) {
@@ -81,6 +88,11 @@ ensure_initialized(void) {
     LOAD_FUNC(sd_bus_message_close_container);
     LOAD_FUNC(sd_pid_get_user_slice);
     LOAD_FUNC(sd_bus_call);
+    LOAD_FUNC(sd_bus_call_async);
+    LOAD_FUNC(sd_bus_process);
+    LOAD_FUNC(sd_bus_wait);
+    LOAD_FUNC(sd_bus_slot_unref);
+    LOAD_FUNC(sd_bus_message_get_error);
     systemd.functions_loaded = true;
 
     int ret = sd_bus_default_user(&systemd.user_bus);
@@ -117,59 +129,126 @@ set_reply_error(const char* func_name, int r, const sd_bus_error *err) {
     return false;
 }
 
-static bool
-move_pid_into_new_scope(pid_t pid, const char* scope_name, const char *description) {
+// Does not use the Python API so can be called without holding the GIL.
+// On failure returns a negative errno and sets failed_func.
+static int
+create_scope_message(sd_bus_message **m, pid_t pid, const char* scope_name, const char *description, const char **failed_func) {
     pid_t parent_pid = getpid();
-    RAII_bus_error(err); RAII_message(m); RAII_message(reply);
     int r;
-#define checked_call(func, ...) if ((r = func(__VA_ARGS__)) < 0) { return set_systemd_error(r, #func); }
-    checked_call(sd_bus_message_new_method_call, systemd.user_bus, &m, SYSTEMD_DESTINATION, SYSTEMD_PATH, SYSTEMD_INTERFACE, "StartTransientUnit");
+#define checked_call(func, ...) if ((r = func(__VA_ARGS__)) < 0) { *failed_func = #func; return r; }
+    checked_call(sd_bus_message_new_method_call, systemd.user_bus, m, SYSTEMD_DESTINATION, SYSTEMD_PATH, SYSTEMD_INTERFACE, "StartTransientUnit");
     // mode is "fail" which means it will fail if a unit with scope_name already exists
-    checked_call(sd_bus_message_append, m, "ss", scope_name, "fail");
-    checked_call(sd_bus_message_open_container, m, 'a', "(sv)");
+    checked_call(sd_bus_message_append, *m, "ss", scope_name, "fail");
+    checked_call(sd_bus_message_open_container, *m, 'a', "(sv)");
     if (description && description[0]) {
-        checked_call(sd_bus_message_append, m, "(sv)", "Description", "s", description);
+        checked_call(sd_bus_message_append, *m, "(sv)", "Description", "s", description);
     }
     RAII_ALLOC(char, slice, NULL);
     if (sd_pid_get_user_slice(parent_pid, &slice) >= 0) {
-        checked_call(sd_bus_message_append, m, "(sv)", "Slice", "s", slice);
+        checked_call(sd_bus_message_append, *m, "(sv)", "Slice", "s", slice);
     } else {
         // Fallback
-        checked_call(sd_bus_message_append, m, "(sv)", "Slice", "s", "kitty.slice");
+        checked_call(sd_bus_message_append, *m, "(sv)", "Slice", "s", "kitty.slice");
     }
 
     // Add the PID to this scope
-    checked_call(sd_bus_message_open_container, m, 'r', "sv");
-    checked_call(sd_bus_message_append, m, "s", "PIDs");
-    checked_call(sd_bus_message_open_container, m, 'v', "au");
-    checked_call(sd_bus_message_open_container, m, 'a', "u");
-    checked_call(sd_bus_message_append, m, "u", pid);
-    checked_call(sd_bus_message_close_container, m); // au
-    checked_call(sd_bus_message_close_container, m); // v
-    checked_call(sd_bus_message_close_container, m); // (sv)
+    checked_call(sd_bus_message_open_container, *m, 'r', "sv");
+    checked_call(sd_bus_message_append, *m, "s", "PIDs");
+    checked_call(sd_bus_message_open_container, *m, 'v', "au");
+    checked_call(sd_bus_message_open_container, *m, 'a', "u");
+    checked_call(sd_bus_message_append, *m, "u", pid);
+    checked_call(sd_bus_message_close_container, *m); // au
+    checked_call(sd_bus_message_close_container, *m); // v
+    checked_call(sd_bus_message_close_container, *m); // (sv)
 
     // If something in this process group is OOMkilled dont kill the rest of
     // the process group. Since typically the shell is not causing the OOM
     // something being run inside it is.
-    checked_call(sd_bus_message_append, m, "(sv)", "OOMPolicy", "s", "continue");
+    checked_call(sd_bus_message_append, *m, "(sv)", "OOMPolicy", "s", "continue");
 
     // Make sure shells are terminated with SIGHUP not just SIGTERM
-    checked_call(sd_bus_message_append, m, "(sv)", "SendSIGHUP", "b", true);
+    checked_call(sd_bus_message_append, *m, "(sv)", "SendSIGHUP", "b", true);
 
     // Unload this unit in failed state as well
-    checked_call(sd_bus_message_append, m, "(sv)", "CollectMode", "s", "inactive-or-failed");
+    checked_call(sd_bus_message_append, *m, "(sv)", "CollectMode", "s", "inactive-or-failed");
 
     // Only kill the main process on stop
-    checked_call(sd_bus_message_append, m, "(sv)", "KillMode", "s", "process");
+    checked_call(sd_bus_message_append, *m, "(sv)", "KillMode", "s", "process");
+
+    checked_call(sd_bus_message_close_container, *m); // End properties a(sv)
+                                                      //
+    checked_call(sd_bus_message_append, *m, "a(sa(sv))", 0);  // No auxiliary units
+    return 0;
+#undef checked_call
+}
 
-    checked_call(sd_bus_message_close_container, m); // End properties a(sv)
-                                                     //
-    checked_call(sd_bus_message_append, m, "a(sa(sv))", 0);  // No auxiliary units
-                                                             //
+static bool
+move_pid_into_new_scope(pid_t pid, const char* scope_name, const char *description) {
+    RAII_bus_error(err); RAII_message(m); RAII_message(reply);
+    const char *failed_func = "";
+    int r = create_scope_message(&m, pid, scope_name, description, &failed_func);
+    if (r < 0) return set_systemd_error(r, failed_func);
     if ((r=sd_bus_call(systemd.user_bus, m, 0 /* timeout default */, &err, &reply)) < 0) return set_reply_error("StartTransientUnit", r, &err);
 
     return true;
-#undef checked_call
+}
+
+typedef struct {
+    pid_t pid;
+    const char *scope_name, *description;
+    char error[512];
+    bool done;
+    sd_bus_slot *slot;
+} ScopeRequest;
+
+static int
+on_scope_reply(sd_bus_message *m, void *userdata, sd_bus_error *ret_error UNUSED) {
+    ScopeRequest *req = userdata;
+    req->done = true;
+    const sd_bus_error *e = sd_bus_message_get_error(m);
+    if (e) snprintf(req->error, sizeof(req->error), "Failed to call StartTransientUnit: %s: %s", e->name ? e->name : "", e->message ? e->message : "");
+    return 0;
+}
+
+// Sends all the StartTransientUnit calls before waiting for any replies, so a
+// burst of N children costs a single D-Bus round trip instead of N. Does not
+// use the Python API so can be called without holding the GIL.
+static void
+move_pids_into_new_scopes(ScopeRequest *reqs, size_t count) {
+    size_t pending = 0;
+    for (size_t i = 0; i < count; i++) {
+        ScopeRequest *req = reqs + i;
+        RAII_message(m);
+        const char *failed_func = "";
+        int r = create_scope_message(&m, req->pid, req->scope_name, req->description, &failed_func);
+        if (r >= 0 && (r = sd_bus_call_async(systemd.user_bus, &req->slot, m, on_scope_reply, req, 0 /* timeout default */)) < 0) failed_func = "sd_bus_call_async";
+        if (r < 0) {
+            snprintf(req->error, sizeof(req->error), "Failed to %s: %s", failed_func, strerror(-r));
+            req->done = true;
+        } else pending++;
+    }
+    while (pending) {
+        int r = sd_bus_process(systemd.user_bus, NULL);
+        if (r < 0) {
+            for (size_t i = 0; i < count; i++) {
+                if (!reqs[i].done) { snprintf(reqs[i].error, sizeof(reqs[i].error), "Failed to sd_bus_process: %s", strerror(-r)); }
+            }
+            break;
+        }
+        pending = 0;
+        for (size_t i = 0; i < count; i++) if (!reqs[i].done) pending++;
+        if (pending && r == 0 && (r = sd_bus_wait(systemd.user_bus, UINT64_MAX)) < 0 && r != -EINTR) {
+            for (size_t i = 0; i < count; i++) {
+                if (!reqs[i].done) { snprintf(reqs[i].error, sizeof(reqs[i].error), "Failed to sd_bus_wait: %s", strerror(-r)); }
+            }
+            break;
+        }
+    }
+    // Releasing the slots cancels any calls still in flight, so that their
+    // replies do not call on_scope_reply() with userdata that has been freed
+    for (size_t i = 0; i < count; i++) {
+        if (reqs[i].slot) reqs[i].slot = sd_bus_slot_unref(reqs[i].slot);
+    }
 }
 
 static void
@@ -206,9 +285,43 @@ systemd_move_pid_into_new_scope(PyObject *self UNUSED, PyObject *args) {
     Py_RETURN_NONE;
 }
 
+static PyObject*
+systemd_move_pids_into_new_scopes(PyObject *self UNUSED, PyObject *items) {
+    if (!PyTuple_Check(items)) { PyErr_SetString(PyExc_TypeError, "items must be a tuple"); return NULL; }
+    const size_t count = PyTuple_GET_SIZE(items);
+    RAII_ALLOC(ScopeRequest, reqs, calloc(MAX(1u, count), sizeof(ScopeRequest)));
+    if (!reqs) return PyErr_NoMemory();
+    for (size_t i = 0; i < count; i++) {
+        long pid;
+        if (!PyArg_ParseTuple(PyTuple_GET_ITEM(items, i), "lss", &pid, &reqs[i].scope_name, &reqs[i].description)) return NULL;
+        reqs[i].pid = pid;
+    }
+#ifdef __APPLE__
+    (void)move_pids_into_new_scopes;
+    PyErr_SetString(PyExc_NotImplementedError, "not supported on this platform");
+    return NULL;
+#else
+    if (!ensure_initialized_and_useable()) return NULL;
+    // The strings in reqs are owned by items which we hold a reference to
+    Py_BEGIN_ALLOW_THREADS
+    move_pids_into_new_scopes(reqs, count);
+    Py_END_ALLOW_THREADS
+    RAII_PyObject(ans, PyTuple_New(count));
+    if (!ans) return NULL;
+    for (size_t i = 0; i < count; i++) {
+        PyObject *e = Py_None;
+        if (reqs[i].error[0]) { if (!(e = PyUnicode_FromString(reqs[i].error))) return NULL; }
+        else Py_INCREF(e);
+        PyTuple_SET_ITEM(ans, i, e);
+    }
+    Py_INCREF(ans);
+    return ans;
+#endif
+}
 
 static PyMethodDef module_methods[] = {
     METHODB(systemd_move_pid_into_new_scope, METH_VARARGS),
+    METHODB(systemd_move_pids_into_new_scopes, METH_O),
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
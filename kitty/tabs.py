@@ -491,9 +491,9 @@ def launch_child(
         pwid = platform_window_id(self.os_window_id)
         if pwid is not None:
             fenv['WINDOWID'] = str(pwid)
-        ans = Child(cmd, cwd or self.cwd, stdin, fenv, cwd_from, is_clone_launch=is_clone_launch, add_listen_on_env_var=add_listen_on_env_var, hold=hold)
-        ans.fork()
-        return ans
+        # The child process is spawned in the background by new_window()
+        # once the window exists, see Child.fork_in_background()
+        return Child(cmd, cwd or self.cwd, stdin, fenv, cwd_from, is_clone_launch=is_clone_launch, add_listen_on_env_var=add_listen_on_env_var, hold=hold)
 
     def _add_window(self, window: Window, location: Optional[str] = None, overlay_for: Optional[int] = None, overlay_behind: bool = False) -> None:
         self.current_layout.add_window(self.windows, window, location, overlay_for, put_overlay_behind=overlay_behind)
@@ -530,8 +530,13 @@ def new_window(
             copy_colors_from=copy_colors_from, watchers=watchers,
             allow_remote_control=allow_remote_control, remote_control_passwords=remote_control_passwords
         )
+        # The pty is created before the child process is spawned, so the
+        # window can be shown and buffer input while the spawn happens in a
+        # worker thread.
+        child.prepare_for_fork()
         # Must add child before laying out so that resize_pty succeeds
         get_boss().add_child(window)
+        child.fork_in_background(window.on_child_spawned)
         self._add_window(window, location=location, overlay_for=overlay_for, overlay_behind=overlay_behind)
         if marker:
             try:
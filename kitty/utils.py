@@ -866,59 +866,216 @@ def which(name: str, only_system: bool = False) -> Optional[str]:
     return None
 
 
+def wait_via_child_monitor(p: 'PopenType[bytes]') -> Callable[[float], int]:
+    # The ChildMonitor reaps exited children with waitpid(-1), so a process
+    # spawned from a thread other than the main thread can have its exit
+    # status stolen, making wait() fail with ECHILD. Instead get the status
+    # from the ChildMonitor, the same as for background processes launched
+    # by the boss. If the process was reaped before it could be registered,
+    # the status is never received and waiting times out.
+    import subprocess
+    from threading import Event
+
+    from .fast_data_types import get_boss, monitor_pid
+    done = Event()
+
+    def on_death(status: int, err: Optional[Exception]) -> None:
+        p.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        done.set()
+
+    get_boss().background_process_death_notify_map[p.pid] = on_death
+    monitor_pid(p.pid)
+
+    def wait(timeout: float) -> int:
+        if not done.wait(timeout):
+            raise subprocess.TimeoutExpired(p.args, timeout)
+        return cast(int, p.returncode)
+    return wait
+
+
+def _read_shell_environment(shell: List[str], in_thread: bool = False) -> Optional[Dict[str, str]]:
+    import subprocess
+
+    from .child import openpty
+    master, slave = openpty()
+    os.set_blocking(master, False)
+    try:
+        p = subprocess.Popen(
+            shell + ['-c', 'env'], stdout=slave, stdin=slave, stderr=slave, start_new_session=True, close_fds=True,
+            preexec_fn=clear_handled_signals)
+    except FileNotFoundError:
+        os.close(master)
+        os.close(slave)
+        log_error('Could not find shell to read environment')
+        return None
+    wait: Callable[[float], Optional[int]] = p.wait
+    from .fast_data_types import get_boss
+    boss = get_boss() if in_thread else None
+    if boss is not None:
+        wait = wait_via_child_monitor(p)
+    ans: Optional[Dict[str, str]] = None
+    with os.fdopen(master, 'rb') as stdout, os.fdopen(slave, 'wb'):
+        raw = b''
+        from time import monotonic
+        start_time = monotonic()
+        while monotonic() - start_time < 1.5:
+            try:
+                ret = wait(0.01)
+            except subprocess.TimeoutExpired:
+                ret = None
+            with suppress(Exception):
+                raw += stdout.read()
+            if ret is not None:
+                break
+        if cast(Optional[int], p.returncode) is None:
+            log_error('Timed out waiting for shell to quit while reading shell environment')
+            p.kill()
+        elif p.returncode == 0:
+            while True:
+                try:
+                    x = stdout.read()
+                except Exception:
+                    break
+                if not x:
+                    break
+                raw += x
+            draw = raw.decode('utf-8', 'replace')
+            ans = {}
+            for line in draw.splitlines():
+                k, v = line.partition('=')[::2]
+                if k and v:
+                    ans[k] = v
+        else:
+            log_error('Failed to run shell to read its environment')
+    if boss is not None:
+        boss.background_process_death_notify_map.pop(p.pid, None)
+    return ans
+
+
+def shell_rc_files() -> Iterator[str]:
+    home = os.path.expanduser('~')
+    zdotdir = os.environ.get('ZDOTDIR') or home
+    for x in ('.zshenv', '.zprofile', '.zshrc', '.zlogin'):
+        yield os.path.join(zdotdir, x)
+    for x in ('/etc/zshenv', '/etc/zprofile', '/etc/zshrc', '/etc/zlogin', '/etc/zsh/zshenv', '/etc/zsh/zprofile', '/etc/zsh/zshrc', '/etc/zsh/zlogin'):
+        yield x
+    for x in ('.bashrc', '.bash_profile', '.bash_login', '.profile'):
+        yield os.path.join(home, x)
+    yield from ('/etc/profile', '/etc/bashrc', '/etc/bash.bashrc', '/etc/environment')
+    fish_dir = os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config'), 'fish')
+    yield os.path.join(fish_dir, 'config.fish')
+    with suppress(OSError):
+        for x in sorted(os.listdir(os.path.join(fish_dir, 'conf.d'))):
+            yield os.path.join(fish_dir, 'conf.d', x)
+    with suppress(OSError):
+        for x in sorted(os.listdir('/etc/profile.d')):
+            yield os.path.join('/etc/profile.d', x)
+
+
+def shell_environment_cache_key(shell: Sequence[str]) -> str:
+    # The environment of the login shell depends on the shell, the rc files it
+    # reads and the few environment variables that determine where those are
+    import hashlib
+
+    from .constants import str_version
+    h = hashlib.sha256()
+    h.update(str_version.encode())
+    h.update('\0'.join(shell).encode())
+    for x in (shell[0], *shell_rc_files()):
+        try:
+            st = os.stat(x)
+        except OSError:
+            continue
+        h.update(f'\0{x}:{st.st_mtime_ns}:{st.st_size}'.encode())
+    for x in ('HOME', 'USER', 'SHELL', 'ZDOTDIR', 'XDG_CONFIG_HOME'):
+        h.update(f'\0{x}={os.environ.get(x, "")}'.encode())
+    return h.hexdigest()
+
+
+# The only variables from the login shell environment that kitty uses, only
+# these are cached as the environment can contain secrets
+CACHED_SHELL_ENV_VARS = ('PATH', 'VISUAL', 'EDITOR')
+
+
+def shell_environment_subset(env: Mapping[str, str]) -> Dict[str, str]:
+    return {k: env[k] for k in CACHED_SHELL_ENV_VARS if isinstance(env.get(k), str)}
+
+
+def shell_environment_cache_path() -> str:
+    from .constants import cache_dir
+    return os.path.join(cache_dir(), 'shell-environment.json')
+
+
+def load_cached_shell_environment(key: str) -> Optional[Dict[str, str]]:
+    import json
+    try:
+        with open(shell_environment_cache_path(), 'rb') as f:
+            data = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as err:
+        log_error(f'Failed to read cached shell environment with error: {err}')
+        return None
+    if isinstance(data, dict) and data.get('key') == key and isinstance(data.get('environment'), dict):
+        return shell_environment_subset(data['environment'])
+    return None
+
+
+def save_cached_shell_environment(key: str, env: Dict[str, str]) -> None:
+    import json
+    import tempfile
+    path = shell_environment_cache_path()
+    try:
+        # mkstemp makes the file readable only by the user
+        fd, tpath = tempfile.mkstemp(dir=os.path.dirname(path), prefix='shell-environment-', suffix='.json.tmp')
+        try:
+            with open(fd, 'wb') as f:
+                f.write(json.dumps({'key': key, 'environment': shell_environment_subset(env)}).encode('utf-8'))
+            os.replace(tpath, path)
+        except BaseException:
+            with suppress(OSError):
+                os.remove(tpath)
+            raise
+    except Exception as err:
+        log_error(f'Failed to save cached shell environment with error: {err}')
+
+
+def refresh_cached_shell_environment(shell: List[str], key: str, delay: float = 5) -> None:
+    # Re-read the environment in a background thread after startup so that
+    # changes the cache key cannot detect, such as in files sourced from the rc
+    # files, are picked up by the next launch
+    from threading import Thread
+
+    def run() -> None:
+        from time import sleep
+        sleep(delay)
+        env = _read_shell_environment(shell, in_thread=True)
+        if env is not None:
+            save_cached_shell_environment(key, env)
+
+    Thread(target=run, name='RefreshShellEnv', daemon=True).start()
+
+
 def read_shell_environment(opts: Optional[Options] = None) -> Dict[str, str]:
     ans: Optional[Dict[str, str]] = getattr(read_shell_environment, 'ans', None)
     if ans is None:
-        from .child import openpty
         ans = {}
         setattr(read_shell_environment, 'ans', ans)
-        import subprocess
         shell = resolved_shell(opts)
-        master, slave = openpty()
-        os.set_blocking(master, False)
         if '-l' not in shell and '--login' not in shell:
             shell += ['-l']
         if '-i' not in shell and '--interactive' not in shell:
             shell += ['-i']
-        try:
-            p = subprocess.Popen(
-                shell + ['-c', 'env'], stdout=slave, stdin=slave, stderr=slave, start_new_session=True, close_fds=True,
-                preexec_fn=clear_handled_signals)
-        except FileNotFoundError:
-            log_error('Could not find shell to read environment')
-            return ans
-        with os.fdopen(master, 'rb') as stdout, os.fdopen(slave, 'wb'):
-            raw = b''
-            from time import monotonic
-            start_time = monotonic()
-            while monotonic() - start_time < 1.5:
-                try:
-                    ret: Optional[int] = p.wait(0.01)
-                except subprocess.TimeoutExpired:
-                    ret = None
-                with suppress(Exception):
-                    raw += stdout.read()
-                if ret is not None:
-                    break
-            if cast(Optional[int], p.returncode) is None:
-                log_error('Timed out waiting for shell to quit while reading shell environment')
-                p.kill()
-            elif p.returncode == 0:
-                while True:
-                    try:
-                        x = stdout.read()
-                    except Exception:
-                        break
-                    if not x:
-                        break
-                    raw += x
-                draw = raw.decode('utf-8', 'replace')
-                for line in draw.splitlines():
-                    k, v = line.partition('=')[::2]
-                    if k and v:
-                        ans[k] = v
-            else:
-                log_error('Failed to run shell to read its environment')
+        key = shell_environment_cache_key(shell)
+        env = load_cached_shell_environment(key)
+        if env is None:
+            env = _read_shell_environment(shell)
+            if env is not None:
+                save_cached_shell_environment(key, env)
+        else:
+            refresh_cached_shell_environment(shell, key)
+        if env:
+            ans.update(shell_environment_subset(env))
     return ans
 
 
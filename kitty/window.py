@@ -32,7 +32,6 @@
 
 from .child import ProcessDesc
 from .cli_stub import CLIOptions
-from .clipboard import ClipboardRequestManager, set_clipboard_string
 from .config import build_ansi_color_table
 from .constants import (
     appname,
@@ -88,15 +87,6 @@
     wakeup_main_loop,
 )
 from .keys import keyboard_mode_name, mod_mask
-from .notify import (
-    NotificationCommand,
-    NotifyImplementation,
-    OnlyWhen,
-    Urgency,
-    handle_notification_cmd,
-    notify_with_command,
-    sanitize_identifier_pat,
-)
 from .options.types import Options
 from .rgb import to_color
 from .terminfo import get_capabilities
@@ -126,7 +116,9 @@
 if TYPE_CHECKING:
     from kittens.tui.handler import OpenUrlHandler
 
+    from .clipboard import ClipboardRequestManager
     from .file_transmission import FileTransmission
+    from .notify import NotificationCommand
 
 
 class CwdRequestType(Enum):
@@ -209,6 +201,9 @@ def process_title_from_child(title: memoryview, is_base64: bool, default_title:
     return sanitize_title(stitle or default_title)
 
 
+window_match_locations = ('id', 'title', 'pid', 'cwd', 'cmdline', 'num', 'env', 'var', 'recent', 'state', 'neighbor')
+
+
 @lru_cache(maxsize=64)
 def compile_match_query(exp: str, is_simple: bool = True) -> MatchPatternType:
     if is_simple:
@@ -250,6 +245,8 @@ class WindowDict(TypedDict):
     user_vars: Dict[str, str]
     at_prompt: bool
     created_at: int
+    graphics: Dict[str, int]
+    file_transfers: List[Dict[str, Any]]
 
 
 class PipeData(TypedDict):
@@ -565,7 +562,7 @@ def __init__(
         self.current_remote_data: List[str] = []
         self.current_mouse_event_button = 0
         self.current_clipboard_read_ask: Optional[bool] = None
-        self.prev_osc99_cmd = NotificationCommand()
+        self.prev_osc99_cmd: Optional['NotificationCommand'] = None
         self.last_cmd_output_start_time = 0.
         self.open_url_handler: 'OpenUrlHandler' = None
         self.last_cmd_cmdline = ''
@@ -585,7 +582,6 @@ def __init__(
         self.title_stack: Deque[str] = deque(maxlen=10)
         self.user_vars: Dict[str, str] = {}
         self.id: int = add_window(tab.os_window_id, tab.id, self.title)
-        self.clipboard_request_manager = ClipboardRequestManager(self.id)
         self.margin = EdgeWidths()
         self.padding = EdgeWidths()
         self.kitten_result: Optional[Dict[str, Any]] = None
@@ -623,6 +619,14 @@ def file_transmission_control(self) -> 'FileTransmission':
             ans = self._file_transmission = FileTransmission(self.id)
         return ans
 
+    @property
+    def clipboard_request_manager(self) -> 'ClipboardRequestManager':
+        ans: Optional['ClipboardRequestManager'] = getattr(self, '_clipboard_request_manager', None)
+        if ans is None:
+            from .clipboard import ClipboardRequestManager
+            ans = self._clipboard_request_manager = ClipboardRequestManager(self.id)
+        return ans
+
     def on_dpi_change(self, font_sz: float) -> None:
         self.update_effective_padding()
 
@@ -710,6 +714,8 @@ def as_dict(self, is_focused: bool = False, is_self: bool = False, is_active: bo
             'columns': self.screen.columns,
             'user_vars': self.user_vars,
             'created_at': self.created_at,
+            'graphics': self.screen.graphics_usage(),
+            'file_transfers': ft.transfer_stats() if (ft := getattr(self, '_file_transmission', None)) is not None else [],
         }
 
     def serialize_state(self) -> Dict[str, Any]:
@@ -960,6 +966,7 @@ def write_to_child(self, data: Union[str, bytes]) -> None:
                 log_error(f'Failed to write to child {self.id} as it does not exist')
 
     def title_updated(self) -> None:
+        get_boss().mappings.invalidate_focus_match_cache()
         update_window_title(self.os_window_id, self.tab_id, self.id, self.title)
         t = self.tabref()
         if t is not None:
@@ -1008,6 +1015,7 @@ def set_user_var(self, key: str, val: Optional[Union[str, bytes]]) -> None:
         if len(self.user_vars) > 64:  # dont store too many user vars
             oldest_key = next(iter(self.user_vars))
             self.user_vars.pop(oldest_key)
+        get_boss().mappings.invalidate_focus_match_cache()
         if val is not None:
             if isinstance(val, bytes):
                 val = val.decode('utf-8', 'replace')
@@ -1034,6 +1042,9 @@ def desktop_notify(self, osc_code: int, raw_datab: memoryview) -> None:
                 log_error(f'Ignoring unknown OSC 777: {raw_data}')
                 return  # unknown OSC 777
             raw_data = raw_data[len('notify;'):]
+        from .notify import NotificationCommand, handle_notification_cmd
+        if self.prev_osc99_cmd is None:
+            self.prev_osc99_cmd = NotificationCommand()
         cmd = handle_notification_cmd(osc_code, raw_data, self.id, self.prev_osc99_cmd)
         if cmd is not None and osc_code == 99:
             self.prev_osc99_cmd = cmd
@@ -1088,7 +1099,7 @@ def hyperlink_open_confirmed(self, url: str, cwd: Optional[str], q: str) -> None
         if q == 'o':
             get_boss().open_url(url, cwd=cwd)
         elif q == 'c':
-            set_clipboard_string(url)
+            get_boss().clipboard.set_text(url)
 
     def handle_remote_file(self, netloc: str, remote_path: str) -> None:
         from kittens.remote_file.main import is_ssh_kitten_sentinel
@@ -1124,6 +1135,7 @@ def focus_changed(self, focused: bool) -> None:
         if self.destroyed or self.ignore_focus_changes or self.is_focused == focused:
             return
         self.is_focused = focused
+        get_boss().mappings.invalidate_focus_match_cache()
         call_watchers(weakref.ref(self), 'on_focus_change', {'focused': focused})
         for c in self.actions_on_focus_change:
             try:
@@ -1145,7 +1157,22 @@ def focus_changed(self, focused: bool) -> None:
             # Cancel IME composition after loses focus
             update_ime_position_for_window(self.id, False, -1)
 
+    def on_foreground_process_group_change(self, pgrp: int) -> None:
+        self.child.on_foreground_process_group_change(pgrp)
+
+    def on_write_buffer_drained(self) -> None:
+        ft: Optional['FileTransmission'] = getattr(self, '_file_transmission', None)
+        if ft is not None:
+            ft.on_write_buffer_drained()
+
+    def on_cwd_reported(self) -> None:
+        self.child.on_cwd_reported()
+
     def title_changed(self, new_title: Optional[memoryview], is_base64: bool = False) -> None:
+        # Programs often set the title when they start, which can happen
+        # without the foreground process group changing, for example, when run
+        # from a script
+        self.child.invalidate_foreground_process_cache()
         self.child_title = process_title_from_child(new_title or memoryview(b''), is_base64, self.default_title)
         self.call_watchers(self.watchers.on_title_change, {'title': self.child_title, 'from_child': True})
         if self.override_title is None:
@@ -1219,6 +1246,7 @@ def report_color(self, code: str, r: int, g: int, b: int) -> None:
         self.screen.send_escape_code_to_child(ESC_OSC, f'{code};rgb:{r:04x}/{g:04x}/{b:04x}')
 
     def report_notification_activated(self, identifier: str) -> None:
+        from .notify import sanitize_identifier_pat
         identifier = sanitize_identifier_pat().sub('', identifier)
         self.screen.send_escape_code_to_child(ESC_OSC, f'99;i={identifier};')
 
@@ -1423,6 +1451,7 @@ def handle_cmd_end(self, exit_status: str = '') -> None:
         when, duration, action, notify_cmdline = opts.notify_on_cmd_finish
 
         if last_cmd_output_duration >= duration and when != 'never':
+            from .notify import NotificationCommand, NotifyImplementation, OnlyWhen, Urgency, notify_with_command
             cmd = NotificationCommand()
             cmd.title = 'kitty'
             s = self.last_cmd_cmdline.replace('\\\n', ' ')
@@ -1451,6 +1480,7 @@ def __call__(self, title: str, body: str, identifier: str, urgency: Urgency = Ur
                 raise ValueError(f'Unknown action in option `notify_on_cmd_finish`: {action}')
 
     def cmd_output_marking(self, is_start: Optional[bool], cmdline: str = '') -> None:
+        self.child.invalidate_foreground_process_cache()
         if is_start:
             start_time = monotonic()
             self.last_cmd_output_start_time = start_time
@@ -1557,10 +1587,27 @@ def call_watchers(self, which: Iterable[Watcher], data: Dict[str, Any]) -> None:
                 import traceback
                 traceback.print_exc()
 
+    def on_child_spawned(self, err: Optional[Exception]) -> None:
+        boss = get_boss()
+        if err is not None:
+            log_error(f'Failed to launch child process in window {self.id} with error: {err}')
+            if not self.destroyed:
+                boss.mark_window_for_close(self)
+            return
+        if self.destroyed:
+            # The window was closed before its child was spawned
+            self.child.hangup()
+            return
+        assert self.child.pid is not None
+        if not boss.child_monitor.set_child_pid(self.id, self.child.pid):
+            self.child.hangup()
+
     def destroy(self) -> None:
         self.call_watchers(self.watchers.on_close, {})
         self.destroyed = True
-        self.clipboard_request_manager.close()
+        crm: Optional['ClipboardRequestManager'] = getattr(self, '_clipboard_request_manager', None)
+        if crm is not None:
+            crm.close()
         del self.kitten_result_processors
         if hasattr(self, 'screen'):
             if self.is_active and self.os_window_id == current_focused_os_window_id():
@@ -1784,13 +1831,13 @@ def paste(self, text: str) -> None:
     def copy_to_clipboard(self) -> None:
         text = self.text_for_selection()
         if text:
-            set_clipboard_string(text)
+            get_boss().clipboard.set_text(text)
 
     @ac('cp', 'Copy the selected text from the active window to the clipboard with ANSI formatting codes')
     def copy_ansi_to_clipboard(self) -> None:
         text = self.text_for_selection(as_ansi=True)
         if text:
-            set_clipboard_string(text)
+            get_boss().clipboard.set_text(text)
 
     def encoded_key(self, key_event: KeyEvent) -> bytes:
         return encode_key_for_tty(
@@ -1804,7 +1851,7 @@ def encoded_key(self, key_event: KeyEvent) -> bytes:
     def copy_or_interrupt(self) -> None:
         text = self.text_for_selection()
         if text:
-            set_clipboard_string(text)
+            get_boss().clipboard.set_text(text)
         else:
             self.scroll_end()
             self.write_to_child(self.encoded_key(KeyEvent(key=ord('c'), mods=GLFW_MOD_CONTROL)))
@@ -68,6 +68,9 @@ def set_color_table_color(self, code, data='') -> None:
     def color_profile_popped(self, x) -> None:
         pass
 
+    def on_cwd_reported(self) -> None:
+        pass
+
     def cmd_output_marking(self, is_start: Optional[bool], data: str = '') -> None:
         if is_start:
             self.last_cmd_at = monotonic()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# License: GPL v3 Copyright: 2024, Kovid Goyal <kovid at kovidgoyal.net>
+
+# Benchmarks for performance sensitive code paths. Run with:
+#   kitty +launch kitty_tests/benchmarks.py [name ...]
+
+import os
+import sys
+import tempfile
+import time
+from contextlib import suppress
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+def timed(func: Callable[[], object], repeat: int = 20) -> float:
+    ' Return the best time in milliseconds of repeat calls of func '
+    best = float('inf')
+    for i in range(repeat):
+        st = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - st)
+    return best * 1000
+
+
+def report(name: str, ms: float, baseline: float = 0) -> None:
+    extra = f' ({baseline / ms:.1f}x faster)' if baseline and ms else ''
+    print(f'  {name:<30} {ms:8.3f} ms{extra}', flush=True)
+
+
+def generated_config(tdir: str) -> str:
+    from kitty.options.definition import definition
+    conf = os.path.join(tdir, 'kitty.conf')
+    inc = os.path.join(tdir, 'keys.conf')
+    # every option and shortcut explicitly set, with the shortcuts in an
+    # included file, approximates a large user config
+    lines = definition.as_conf()
+    with open(conf, 'w') as f:
+        f.write('\n'.join(x for x in lines if not x.startswith(('map ', 'mouse_map '))))
+        f.write('\ninclude keys.conf\n')
+    with open(inc, 'w') as f:
+        f.write('\n'.join(x for x in lines if x.startswith(('map ', 'mouse_map '))))
+    return conf
+
+
+def bench_config() -> None:
+    from kitty.config import load_config
+    from kitty.utils import suppress_error_logging
+    with tempfile.TemporaryDirectory() as tdir, suppress_error_logging():
+        conf = generated_config(tdir)
+        uncached = timed(lambda: load_config(conf))
+        load_config(conf, use_cache=True)
+        cached = timed(lambda: load_config(conf, use_cache=True))
+        report('parse config', uncached)
+        report('load compiled config', cached, uncached)
+
+
+def bench_box_drawing(width: int = 40, height: int = 88, dpi: float = 192., num_slowest: int = 10) -> None:
+    from kitty.fonts.box_drawing import box_chars, render_box_char
+    times = {}
+    for ch in box_chars:
+        times[ch] = timed(lambda: render_box_char(ch, bytearray(width * height), width, height, dpi), repeat=3)
+    report(f'all glyphs at {width}x{height}@{dpi:g}', sum(times.values()))
+    for ch in sorted(times, key=times.__getitem__, reverse=True)[:num_slowest]:
+        report(f'U+{ord(ch):04X} {ch}', times[ch])
+
+
+def make_png(width: int, height: int) -> bytes:
+    import struct
+    import zlib
+    row = bytes((x * 7 + (x >> 5)) & 0xff for x in range(width * 4))
+    raw = b''.join(b'\0' + row[y:] + row[:y] for y in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) + chunk(
+        b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b'')
+
+
+def transmit_commands(data: bytes, count: int, fmt: str, chunk_size: int = 4096) -> bytes:
+    from base64 import standard_b64encode
+    encoded = standard_b64encode(data)
+    ans = []
+    for i in range(count):
+        for pos in range(0, len(encoded), chunk_size):
+            more = int(pos + chunk_size < len(encoded))
+            cmd = f'a=t,{fmt},i={i + 1},q=2,m={more}' if pos == 0 else f'm={more}'
+            ans.append(b'\033_G' + cmd.encode() + b';' + encoded[pos:pos + chunk_size] + b'\033\\')
+    return b''.join(ans)
+
+
+def bench_graphics(count: int = 16, width: int = 1920, height: int = 1080) -> None:
+    # The time the parser is blocked while a program streams large images. In
+    # a real window PNG decoding happens in background threads so the
+    # difference between the two is no longer spent on the main thread.
+    from kitty.fast_data_types import Screen, set_options
+    from kitty.options.types import defaults
+    set_options(defaults)
+
+    def parse(data: bytes) -> None:
+        s = Screen(None, 24, 80, 0, 10, 20, 0, None)
+        mv = memoryview(data)
+        while mv:
+            dest = s.test_create_write_buffer()
+            mv = mv[s.test_commit_write_buffer(mv, dest):]
+            s.test_parse_written_data()
+
+    png = make_png(width, height)
+    rgba = transmit_commands(bytes(width * height * 4), count, f'f=32,s={width},v={height}')
+    pngs = transmit_commands(png, count, 'f=100')
+    try:
+        report(f'{count} RGBA {width}x{height}', timed(lambda: parse(rgba), repeat=3))
+        report(f'{count} PNG {width}x{height}', timed(lambda: parse(pngs), repeat=3))
+    finally:
+        set_options(None)
+
+
+def bench_image_transmission(megapixels: Tuple[int, ...] = (1, 4, 12)) -> None:
+    from base64 import standard_b64encode
+
+    from kittens.tui.images import GraphicsCommand
+
+    def quadratic_chunks(gc: GraphicsCommand, data: bytes) -> Iterator[bytes]:
+        # how the chunks used to be generated
+        data = standard_b64encode(data)
+        while data:
+            chunk, data = data[:4096], data[4096:]
+            gc.m = 1 if data else 0
+            yield gc.serialize(chunk)
+            gc.clear()
+
+    gc = GraphicsCommand()
+    gc.a, gc.f = 't', 32
+    for mp in megapixels:
+        data = os.urandom(mp * 1000000 * 4)
+        # slicing is quadratic, so only time it for smaller images
+        sliced = timed(lambda: sum(map(len, quadratic_chunks(gc.clone(), data))), repeat=1) if mp < 8 else 0
+        if sliced:
+            report(f'{mp} megapixel, sliced', sliced)
+        report(f'{mp} megapixel, streamed', timed(lambda: sum(map(len, gc.iter_transmission_chunks(data, level=0))), repeat=3), sliced)
+        data = bytes(range(256)) * (len(data) // 256)
+        report(f'{mp} megapixel, compressed', timed(lambda: sum(map(len, gc.iter_transmission_chunks(data))), repeat=3))
+
+def bench_file_transfer(size_mb: int = 32) -> None:
+    # Throughput of sending a file to a program reading as fast as it can from
+    # a pty. The write buffer and I/O thread of the child monitor are emulated
+    # by the run loop below. Without flow control the data is read and queued
+    # on the main thread till the buffer limit is hit, then retried every 50ms.
+    import select
+    import threading
+    import tty
+    from queue import Empty
+
+    from kitty.file_transmission import RESUME_SENDS_BELOW, SEND_WINDOW, Action, FileTransmissionCommand, TestFileTransmission
+
+    class Transfer(TestFileTransmission):
+
+        def __init__(self, flow_control: bool) -> None:
+            super().__init__()
+            self.flow_control = flow_control
+            self.write_buf = bytearray()
+            self.write_pos = self.peak_buffered = self.resume_below = 0
+            self.timers: List[Tuple[float, Callable[[Optional[int]], None]]] = []
+            self.finished = False
+            if flow_control:
+                self.use_io_thread()
+
+        @property
+        def buffered(self) -> int:
+            return len(self.write_buf) - self.write_pos
+
+        def write_ftc_to_child(self, payload: FileTransmissionCommand, appendleft: bool = False, use_pending: bool = True) -> bool:
+            if self.buffered > 100 * 1024 * 1024:  # the limit in child-monitor.c
+                return False
+            self.write_buf += b'\x1b]' + payload.serialize(prefix_with_osc_code=True).encode() + b'\x1b\\'
+            self.peak_buffered = max(self.peak_buffered, self.buffered)
+            self.finished = self.finished or payload.action is Action.end_data
+            return True
+
+        def send_credit(self) -> int:
+            if not self.flow_control:
+                return sys.maxsize
+            if self.buffered < SEND_WINDOW:
+                self.resume_below = 0
+                return SEND_WINDOW - self.buffered
+            self.resume_below = RESUME_SENDS_BELOW
+            return 0
+
+        def callback_after(self, callback: Callable[[Optional[int]], None], timeout: float = 0) -> Optional[int]:
+            self.timers.append((time.monotonic() + timeout, callback))
+            return None
+
+        def run(self, fd: int) -> None:
+            while not self.finished or self.buffered:
+                now = time.monotonic()
+                for t in [t for t in self.timers if t[0] <= now]:
+                    self.timers.remove(t)
+                    t[1](None)
+                if self.io_worker is not None:
+                    try:
+                        self.main_thread_jobs.get(timeout=0 if self.buffered else 0.001)()
+                        while True:
+                            self.main_thread_jobs.get_nowait()()
+                    except Empty:
+                        pass
+                if self.buffered and select.select([], [fd], [], 0.001)[1]:
+                    self.write_pos += os.write(fd, memoryview(self.write_buf)[self.write_pos:self.write_pos + 65536])
+                    if self.write_pos > 8 * 1024 * 1024:
+                        del self.write_buf[:self.write_pos]
+                        self.write_pos = 0
+                    if self.resume_below and self.buffered <= self.resume_below:
+                        self.resume_below = 0
+                        self.on_write_buffer_drained()
+                elif not self.buffered and self.io_worker is None:
+                    time.sleep(0.001)
+
+    def drain(fd: int) -> None:
+        with suppress(OSError):
+            while os.read(fd, 1024 * 1024):
+                pass
+
+    with tempfile.NamedTemporaryFile() as src:
+        src.write(os.urandom(size_mb * 1024 * 1024))
+        src.flush()
+        results = {}
+        for flow_control in (False, True):
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            os.set_blocking(master, False)
+            reader = threading.Thread(target=drain, args=(slave,), daemon=True)
+            reader.start()
+            ft = Transfer(flow_control)
+            for cmd in (
+                FileTransmissionCommand(id='b', action=Action.receive, size=1), FileTransmissionCommand(id='b', action=Action.file, file_id='s', name=src.name)
+            ):
+                ft.handle_serialized_command(memoryview(cmd.serialize().encode()))
+            ft.wait_for_io()
+            st = time.perf_counter()
+            ft.handle_serialized_command(memoryview(FileTransmissionCommand(id='b', action=Action.file, file_id='s', name=src.name).serialize().encode()))
+            ft.run(master)
+            results[flow_control] = ms = (time.perf_counter() - st) * 1000
+            name = 'flow control' if flow_control else 'timer polling'
+            report(f'{size_mb} MB, {name}', ms, results[False] if flow_control else 0)
+            print(f'    {size_mb * 1000 / ms:.0f} MB/s, peak write buffer: {ft.peak_buffered / (1024 * 1024):.1f} MB', flush=True)
+            os.close(master)
+            reader.join()
+            os.close(slave)
+
+
+benchmarks: Dict[str, Callable[[], None]] = {
+    'config': bench_config,
+    'box_drawing': bench_box_drawing,
+    'graphics': bench_graphics,
+    'image_transmission': bench_image_transmission,
+    'file_transfer': bench_file_transfer,
+}
+
+
+def main() -> None:
+    names = sys.argv[1:] or list(benchmarks)
+    with tempfile.TemporaryDirectory() as tdir:
+        os.environ['KITTY_CACHE_DIRECTORY'] = tdir
+        for name in names:
+            print(f'{name}:', flush=True)
+            benchmarks[name]()
+
+
+if __name__ == '__main__':
+    main()
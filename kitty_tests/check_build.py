@@ -2,6 +2,7 @@
 # License: GPLv3 Copyright: 2021, Kovid Goyal <kovid at kovidgoyal.net>
 
 
+import json
 import os
 import stat
 import subprocess
@@ -118,6 +119,27 @@ def test_launcher_ensures_stdio(self):
 '''])
         self.assertEqual(cp.returncode, 0)
 
+    def test_startup_imports(self) -> None:
+        # Modules not needed to render the first frame such as remote control,
+        # file transmission, notifications, etc. must be imported lazily. If
+        # this test fails either make the new import lazy or, if the module
+        # really is needed at startup, add it below.
+        allowed = frozenset('''
+        kitty kitty.borders kitty.boss kitty.child kitty.cli kitty.cli_stub kitty.conf kitty.conf.utils
+        kitty.config kitty.constants kitty.debug_startup kitty.entry_points kitty.fast_data_types kitty.fonts
+        kitty.fonts.box_drawing kitty.fonts.core_text kitty.fonts.fallback_cache kitty.fonts.fontconfig kitty.fonts.glyph_cache
+        kitty.fonts.render kitty.key_encoding kitty.key_names kitty.keys kitty.layout kitty.layout.base kitty.layout.grid
+        kitty.layout.interface kitty.layout.splits kitty.layout.stack kitty.layout.tall kitty.layout.vertical
+        kitty.main kitty.options kitty.options.types kitty.options.utils kitty.os_window_size kitty.rgb
+        kitty.session kitty.shaders kitty.tab_bar kitty.tabs kitty.terminfo kitty.types kitty.typing
+        kitty.utils kitty.window kitty.window_list
+        '''.split())
+        cp = subprocess.run(self.cmd_to_run_python_code(
+            'import json, sys; import kitty.main; print(json.dumps(list(sys.modules)))'), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(cp.returncode, 0, cp.stderr.decode())
+        imported = {m for m in json.loads(cp.stdout) if m.partition('.')[0] in ('kitty', 'kittens')}
+        self.assertFalse(imported - allowed, f'Unexpected modules imported at startup: {sorted(imported - allowed)}')
+
 
 def main() -> None:
     tests = unittest.defaultTestLoader.loadTestsFromTestCase(TestBuild)
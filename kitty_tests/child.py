@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# License: GPLv3 Copyright: 2024, Kovid Goyal <kovid at kovidgoyal.net>
+
+
+import os
+import signal
+import subprocess
+import tempfile
+import time
+from contextlib import suppress
+
+from kitty.child import Child
+
+from . import BaseTest
+
+
+class TestChild(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tdir = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        self.rmtree_ignoring_errors(self.tdir)
+        super().tearDown()
+
+    def test_foreground_process_cache(self):
+        master, slave = os.openpty()
+        # a script that starts another program in its process group when sent a line
+        p = subprocess.Popen(['sh', '-c', 'read x; sleep 30 & wait'], stdin=slave, stdout=slave, stderr=slave, cwd=self.tdir, start_new_session=True,
+                             preexec_fn=lambda: os.close(os.open(os.ttyname(0), os.O_RDWR)))
+        os.close(slave)
+        try:
+            end_time = time.monotonic() + 5
+            while os.tcgetpgrp(master) != p.pid and time.monotonic() < end_time:
+                time.sleep(0.01)
+            pgrp = os.tcgetpgrp(master)
+            self.ae(pgrp, p.pid)
+            child = Child(['sleep', '30'], self.tdir)
+            child.child_fd, child.pid = master, p.pid
+            calls = []
+
+            def compute(pid):
+                calls.append(pid)
+                return str(len(calls))
+
+            def data(which='exe'):
+                return child.cached_foreground_data(which, False, compute)
+
+            self.ae(child.foreground_cwd, self.tdir)
+            # nothing is cached till the I/O thread tracks the foreground process group
+            self.ae((data(), data()), ('1', '2'))
+            child.on_foreground_process_group_change(pgrp)
+            self.ae((data(), data()), ('3', '3'))
+            self.ae(calls[-1], p.pid)
+            # changes to the process group invalidate the cache
+            child.on_foreground_process_group_change(pgrp)
+            self.ae(data(), '4')
+
+            # the cwd is cached only after the shell reports it
+            self.ae((data('cwd'), data('cwd')), ('5', '6'))
+            child.on_cwd_reported()
+            self.ae((data('cwd'), data('cwd')), ('7', '7'))
+            self.ae(data(), '8')
+            # and each report invalidates it
+            child.on_cwd_reported()
+            self.ae(data('cwd'), '9')
+
+            # cwds of foreground programs other than the shell are never cached
+            child.pid = p.pid + 1
+            child.invalidate_foreground_process_cache()
+            self.ae((data('cwd'), data('cwd')), ('10', '11'))
+            self.ae((data(), data()), ('12', '12'))
+
+            # processes joining the group without it changing are noticed
+            os.write(master, b'\n')
+            end_time = time.monotonic() + 5
+            while len(child.foreground_process_group_and_members()[1]) < 2 and time.monotonic() < end_time:
+                time.sleep(0.01)
+            pgrp_, members = child.foreground_process_group_and_members()
+            self.ae((pgrp_, len(members)), (pgrp, 2))
+            self.ae(data(), '13')
+            self.ae(calls[-1], max(members))
+            self.assertNotEqual(calls[-1], p.pid)
+        finally:
+            with suppress(OSError):
+                os.killpg(p.pid, signal.SIGKILL)
+            p.wait()
+            os.close(master)
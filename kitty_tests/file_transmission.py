@@ -11,9 +11,19 @@
 from pathlib import Path
 
 from kittens.transfer.rsync import Differ, Hasher, Patcher, parse_ftc
-from kittens.transfer.utils import set_paths
+from kittens.transfer.utils import is_compressible, set_paths, zstd_supported
 from kitty.constants import kitten_exe
-from kitty.file_transmission import Action, Compression, FileTransmissionCommand, FileType, TransmissionType, ZlibDecompressor
+from kitty.file_transmission import (
+    Action,
+    Compression,
+    FileTransmissionCommand,
+    FileType,
+    TransmissionType,
+    ZlibDecompressor,
+    compressor_for,
+    decompressor_for,
+    split_for_transfer,
+)
 from kitty.file_transmission import TestFileTransmission as FileTransmission
 
 from . import PTY, BaseTest
@@ -302,6 +312,159 @@ def test_file_get(self):
             received = b''.join(x['data'] for x in ft.test_responses)
             self.ae(received.decode('utf-8'), src)
 
+    def test_file_io_in_thread(self):
+        import threading
+        ft = FileTransmission()
+        ft.use_io_thread()
+        dest = os.path.join(self.tdir, 'sub', 'dest')
+        data = os.urandom(64 * 1024)
+        ft.handle_serialized_command(serialized_cmd(action='send'))
+        ft.handle_serialized_command(serialized_cmd(action='file', file_id='d', name=dest))
+        for ftc in split_for_transfer(data, session_id='test', file_id='d', mark_last=True):
+            ft.handle_serialized_command(ftc.serialize())
+        self.assertFalse(ft.test_responses[1:], 'File I/O responses sent before the main loop ran')
+        ft.handle_serialized_command(serialized_cmd(action='finish'))
+        ft.wait_for_io()
+        self.cr(ft.test_responses, [
+            response(status='OK'), response(status='STARTED', file_id='d', name=dest), response(status='OK', file_id='d', name=dest)])
+        with open(dest, 'rb') as f:
+            self.ae(f.read(), data)
+        self.assertFalse(ft.active_receives)
+
+        # commands are deferred, not blocked on, while the I/O thread is behind
+        bp = FileTransmission()
+        bp.use_io_thread()
+        bp.io_worker.max_queued_jobs = 2
+        bp_dest = os.path.join(self.tdir, 'bp')
+        bp.handle_serialized_command(serialized_cmd(action='send'))
+        bp.handle_serialized_command(serialized_cmd(action='file', file_id='b', name=bp_dest))
+        for ftc in split_for_transfer(data, session_id='test', file_id='b', mark_last=True):
+            bp.handle_serialized_command(ftc.serialize())
+        bp.handle_serialized_command(serialized_cmd(action='finish'))
+        self.assertLessEqual(bp.io_worker.in_flight, 2)
+        self.assertTrue(bp.deferred_commands)
+        bp.wait_for_io()
+        self.assertFalse(bp.deferred_commands)
+        self.cr(bp.test_responses, [
+            response(status='OK'), response(status='STARTED', file_id='b', name=bp_dest), response(status='OK', file_id='b', name=bp_dest)])
+        with open(bp_dest, 'rb') as f:
+            self.ae(f.read(), data)
+
+        # transfers fail rather than buffer too much while the I/O thread is behind
+        ov = FileTransmission()
+        ov.use_io_thread()
+        ov.io_worker.max_queued_jobs = 1
+        ov.max_deferred_bytes = 8192
+        ov.handle_serialized_command(serialized_cmd(action='send'))
+        ov.handle_serialized_command(serialized_cmd(action='file', file_id='o', name=os.path.join(self.tdir, 'ov')))
+        for ftc in split_for_transfer(data, session_id='test', file_id='o', mark_last=True):
+            ov.handle_serialized_command(ftc.serialize())
+            self.assertLessEqual(ov.deferred_bytes, ov.max_deferred_bytes)
+        ov.handle_serialized_command(serialized_cmd(action='finish'))
+        ov.wait_for_io()
+        self.assertFalse(ov.deferred_commands)
+        self.assertFalse(ov.active_receives)
+        self.assertFalse(ov.overflowed_transfers)
+        self.assertIn('EIO', [x['status'].partition(':')[0] for x in ov.test_responses])
+
+        ft.test_responses = []
+        ft.handle_serialized_command(serialized_cmd(action='receive', size=1))
+        ft.handle_serialized_command(serialized_cmd(action='file', file_id='s', name=dest))
+        ft.wait_for_io()
+        ft.test_responses = []
+        ft.handle_serialized_command(serialized_cmd(action='file', file_id='s', name=dest))
+        ft.wait_for_io()
+        self.ae(b''.join(x['data'] for x in ft.test_responses), data)
+        self.ae(ft.io_worker.thread.name, 'FileTransmissionIO')
+        self.assertIsNot(ft.io_worker.thread, threading.current_thread())
+
+        # many small files are read in batches
+        src = os.path.join(self.tdir, 'many')
+        os.mkdir(src)
+        expected = {}
+        for i in range(100):
+            expected[str(i)] = data[:i * 97]
+            with open(os.path.join(src, str(i)), 'wb') as f:
+                f.write(expected[str(i)])
+        ft = FileTransmission()
+        ft.use_io_thread()
+        ft.handle_serialized_command(serialized_cmd(action='receive', size=1))
+        ft.handle_serialized_command(serialized_cmd(action='file', file_id='m', name=src))
+        ft.wait_for_io()
+        ft.test_responses = []
+        reads = []
+        read_chunks = ft.active_sends['test'].read_chunks
+        ft.active_sends['test'].read_chunks = lambda: reads.append(1) or read_chunks()
+        for fid in expected:
+            ft.handle_serialized_command(serialized_cmd(action='file', file_id=fid, name=os.path.join(src, fid)))
+        ft.wait_for_io()
+        received, ended = {}, []
+        for r in ft.test_responses:
+            received[r['file_id']] = received.get(r['file_id'], b'') + r.get('data', b'')
+            if r['action'] == 'end_data':
+                ended.append(r['file_id'])
+        self.ae(ended, list(expected))
+        self.ae(received, expected)
+        self.assertLess(len(reads), len(expected))
+
+    def test_file_compression(self):
+        self.assertFalse(is_compressible(os.urandom(64 * 1024)))
+        self.assertTrue(is_compressible(b'abcd' * 16 * 1024))
+        self.assertTrue(is_compressible(os.urandom(64)))
+        text = b'some highly compressible text\n' * 8192
+        noise = os.urandom(len(text))
+        zstd = 'zstd' if zstd_supported() else 'zlib'
+
+        # sending, compression is skipped for data that does not compress
+        base = os.path.join(self.tdir, 'compression')
+        os.mkdir(base)
+        for name, data in (('text', text), ('noise', noise)):
+            with open(os.path.join(base, name), 'wb') as f:
+                f.write(data)
+        for compress in ('zlib', 'zstd'):
+            ft = FileTransmission()
+            ft.handle_serialized_command(serialized_cmd(action='receive', size=1))
+            ft.handle_serialized_command(serialized_cmd(action='file', file_id='x', name=base))
+            ft.active_sends['test'].metadata_sent = True
+            sizes = {}
+            for name, data in (('text', text), ('noise', noise)):
+                ft.test_responses = []
+                ft.handle_serialized_command(serialized_cmd(action='file', file_id=name, name=os.path.join(base, name), compression=compress))
+                received = b''.join(x['data'] for x in ft.test_responses)
+                sizes[name] = len(received)
+                if compress == 'zstd':
+                    self.ae(ft.test_responses[0]['compression'], zstd)
+                self.ae(decompressor_for(Compression[ft.test_responses[0].get('compression', compress)])(received, True), data)
+            self.assertLess(sizes['text'], len(text) // 10)
+            self.assertLess(sizes['noise'], len(noise) * 1.01)
+            stats = ft.active_sends['test'].stats
+            self.ae((stats.files, stats.uncompressed_bytes), (2, len(text) + len(noise)))
+            self.ae(stats.transmitted_bytes, sum(sizes.values()))
+            ft.handle_serialized_command(serialized_cmd(action='finish'))
+            kind, tid, stats = ft.finished_transfers[-1]
+            self.ae((kind, tid), ('send', 'test'))
+            self.assertLess(stats.ratio, 0.6)
+            self.assertGreater(stats.throughput, 0)
+
+        # receiving, the client is told to fall back to zlib if zstd is not available
+        dest = os.path.join(self.tdir, 'zdest')
+        ft = FileTransmission()
+        ft.handle_serialized_command(serialized_cmd(action='send'))
+        ft.handle_serialized_command(serialized_cmd(action='file', file_id='z', name=dest, compression='zstd'))
+        self.cr(ft.test_responses, [response(status='OK'), dict(response(status='STARTED', file_id='z', name=dest), compression=zstd)])
+        cdata = compressor_for(Compression[zstd], text)
+        payload = cdata.compress(text) + cdata.flush()
+        for ftc in split_for_transfer(payload, session_id='test', file_id='z', mark_last=True):
+            ft.handle_serialized_command(ftc.serialize())
+        ft.handle_serialized_command(serialized_cmd(action='finish'))
+        with open(dest, 'rb') as f:
+            self.ae(f.read(), text)
+        kind, tid, stats = ft.finished_transfers[-1]
+        self.ae((kind, tid, stats.files, stats.uncompressed_bytes, stats.transmitted_bytes), ('receive', 'test', 1, len(text), len(payload)))
+        d = ft.transfer_stats()[-1]
+        self.ae((d['kind'], d['id'], d['files'], d['transmitted_bytes']), ('receive', 'test', 1, len(payload)))
+        self.assertIn('1 files', d['summary'])
+
     def test_parse_ftc(self):
         def t(raw, *expected):
             a = []
@@ -58,6 +58,98 @@ def test_box_drawing(self):
         test_render_line(line)
         self.assertEqual(len(self.sprites) - prerendered, len(box_chars))
 
+    def test_box_drawing_output(self):
+        # Guards against unintended changes to the rendering of box drawing
+        # characters. When changing or adding glyphs on purpose, update the
+        # hashes by printing the actual values.
+        import ctypes
+        import hashlib
+
+        from kitty.fonts import box_drawing
+        from kitty.fonts.box_drawing import render_box_char
+        expected = {
+            (8, 16, 96.): '8e75ba4cf579cce1f8af270c56ca615645b56e7988eec3c99d765d523f4bf20c',
+            (11, 23, 110.): 'b82942299713901f17337d14418e79d6245d071cc30c6e954447357d4856dd1c',
+            (20, 44, 192.): '6689921e14024f2bde12df7e5bc228953e4f7ede217c80fc0a85af343ef4aee7',
+        }
+        orig_scale = box_drawing.scale
+        box_drawing.set_scale((0.001, 1, 1.5, 2))
+        try:
+            for (width, height, dpi), h in expected.items():
+                m = hashlib.sha256()
+                for ch in box_chars:
+                    buf = bytearray(width * height)
+                    render_box_char(ch, buf, width, height, dpi)
+                    cbuf = (ctypes.c_ubyte * (width * height))()
+                    render_box_char(ch, cbuf, width, height, dpi)
+                    self.ae(bytes(cbuf), buf, f'Rendering of {ch!r} differs between buffer types')
+                    m.update(buf)
+                self.ae(m.hexdigest(), h, f'Rendering of box drawing characters at {width}x{height}@{dpi} has changed')
+        finally:
+            box_drawing.set_scale(orig_scale)
+
+    def test_glyph_cache(self):
+        from kitty.fonts.glyph_cache import GlyphCache
+        gc = GlyphCache('test-glyph-cache')
+        t = gc.table(4, 1, 2.5)
+        self.assertIsNone(t.get(1))
+        t.set(1, b'abcd')
+        # records are written in batches
+        self.assertFalse(os.path.exists(t.path))
+        t.save()
+        with open(t.path, 'ab') as f:
+            f.write(b'partial')
+        gc = GlyphCache('test-glyph-cache')
+        gc.table(4, 1, 2.5).set(2, b'efgh')
+        gc.table(4, 1, 2.5).save()
+        gc = GlyphCache('test-glyph-cache')
+        t = gc.table(4, 1, 2.5)
+        self.ae((t.get(1), t.get(2)), (b'abcd', b'efgh'))
+        self.assertIsNone(gc.table(4, 1, 3).get(1))
+        self.assertIs(gc.table(4, 1, 2.5), t)
+        self.assertRaises(ValueError, t.set, 3, b'abc')
+        # corrupted tables are discarded
+        with open(t.path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'x')
+        gc = GlyphCache('test-glyph-cache')
+        t = gc.table(4, 1, 2.5)
+        self.assertIsNone(t.get(1))
+        self.assertFalse(os.path.exists(t.path))
+
+    def test_fallback_font_cache(self):
+        from kitty.fonts.fallback_cache import FallbackFontCache
+
+        class Cache(FallbackFontCache):
+            cache_dir = self.tdir
+
+        c = Cache()
+        a, b = {'path': 'a.ttf', 'index': 0}, {'path': 'b.ttf', 'index': 1}
+        self.assertIsNone(c.lookup('\u4e00', False, False, False))
+        c.store('\u4e00', False, False, False, a)
+        # the font is used for all characters in the block unless they have their own entry
+        self.ae(c.lookup('\u4e01', False, False, False), a)
+        self.assertIsNone(c.lookup('\u4e01', True, False, False))
+        c.store('\u4e01', False, False, False, b)
+        c.store('e\u0301', False, False, False, b)
+        c.save()
+        c = Cache()
+        self.ae(c.lookup('\u4e00', False, False, False), a)
+        self.ae(c.lookup('\u4e01', False, False, False), b)
+        self.ae(c.lookup('e\u0301', False, False, False), b)
+        self.assertIsNone(c.lookup('e', False, False, False))
+        self.ae(len(c.descriptors), 2)
+
+    def test_prerendered_cells(self):
+        from kitty.fonts.render import prerender_function
+        args = (10, 20, 15, 17, 2, 10, 1, 1.5, 2.0, 96.0, 96.0)
+        addresses, cells = prerender_function(*args)
+        self.ae(len(addresses), len(cells))
+        self.assertIs(prerender_function(*args)[1], cells)
+        self.assertIsNot(prerender_function(*args[:-1], 192.0)[1], cells)
+        # dashed underline
+        self.ae(bytes(cells[4][17 * 10:18 * 10]), b'\xff' * 4 + b'\0' * 2 + b'\xff' * 4)
+
     def test_font_rendering(self):
         render_string('ab\u0347\u0305你好|\U0001F601|\U0001F64f|\U0001F63a|')
         text = 'He\u0347\u0305llo\u0341, w\u0302or\u0306l\u0354d!'
@@ -11,7 +11,7 @@
 from dataclasses import dataclass
 from io import BytesIO
 
-from kitty.fast_data_types import base64_decode, base64_encode, has_avx2, has_sse4_2, load_png_data, shm_unlink, shm_write, test_xor64
+from kitty.fast_data_types import base64_decode, base64_encode, has_avx2, has_sse4_2, load_png_data, resize_image_data, shm_unlink, shm_write, test_xor64
 
 from . import BaseTest, parse_bytes
 
@@ -328,6 +328,22 @@ def clear_predicate(key):
         dc.wait_for_write()
         self.ae(sz, dc.size_on_disk())
 
+        # compression
+        reset()
+        self.assertTrue(dc.compress)
+        add('compressible', bytes(range(256)) * 64)
+        add('incompressible', os.urandom(8192))
+        add('small', b'x' * 100)
+        dc.wait_for_write()
+        check_data()
+        self.ae(dc.total_size, sum(map(len, data.values())))
+        self.assertLess(dc.size_on_disk(), 8192 + 100 + 2048)
+        dc.compress = False
+        add('uncompressed', bytes(range(256)) * 64)
+        dc.wait_for_write()
+        check_data()
+        self.assertGreater(dc.size_on_disk(), 8192 + 100 + 256 * 64)
+
     def test_suppressing_gr_command_responses(self):
         s, g, pl, sl = load_helpers(self)
         self.ae(pl('abcd', s=10, v=10, q=1), 'ENODATA:Insufficient image data: 4 < 400')
@@ -434,6 +450,81 @@ def load_temp(prefix='tty-graphics-protocol-'):
         s.reset()
         self.assertEqual(g.disk_cache.total_size, 0)
 
+    def test_background_image_decoding(self):
+        s = self.create_screen()
+        g = s.grman
+        # decode compressed images in the background, as for a screen with a window
+        g.respond_for_testing = s.callbacks.write
+        data = byte_block(32 * 1024)
+        compressed = zlib.compress(data)
+
+        def t(payload=compressed, **kw):
+            kw = {'a': 't', 's': 1024, 'v': 8, 'o': 'z', **kw}
+            cmd = ','.join(f'{k}={v}' for k, v in kw.items() if v)
+            return send_command(s, cmd, payload)
+
+        def responses(res):
+            return [parse_response_with_ids(b'\033_G' + x) for x in res.split(b'\033_G') if x]
+
+        # responses are sent once decoding is done, before responses to later commands
+        self.ae(t(i=1), b'')
+        self.ae(t(i=2), b'')
+        self.ae(g.image_count, 2)
+        self.ae(responses(t(b'abcd', i=3, a='q', s=1, v=1, o='')), [('OK', 'i=1'), ('OK', 'i=2'), ('OK', 'i=3')])
+        self.ae(g.image_for_client_id(1)['data'], data)
+        self.ae(g.image_for_client_id(2)['data'], data)
+        self.ae(t(i=4), b'')
+        c = s.callbacks
+        c.clear()
+        parse_bytes(s, b'\033[c')
+        self.assertTrue(c.wtcbuf.startswith(b'\033_Gi=4;OK\033\\\033['), c.wtcbuf)
+        self.ae(t(i=5), b'')
+        c.clear()
+        g.finish_background_loads()
+        self.ae(responses(c.wtcbuf), [('OK', 'i=5')])
+
+        # failures are reported once decoding is done
+        self.ae(t(compressed[:-16], i=6), b'')
+        self.ae(t(zlib.compress(data[:-4]), i=7), b'')
+        self.ae(t(b'not zlib data' * 8, i=8, q=1), b'')
+        self.ae(t(b'not zlib data' * 8, i=9, q=2), b'')
+        c.clear()
+        g.finish_background_loads()
+        self.ae([x[0] for x in responses(c.wtcbuf)], ['EINVAL', 'EINVAL', 'EINVAL'])
+        self.ae([x[1] for x in responses(c.wtcbuf)], ['i=6', 'i=7', 'i=8'])
+
+        # replacing an image while its data is being decoded
+        self.ae(t(i=1), b'')
+        self.ae(responses(t(b'abcd', i=1, s=1, v=1, o='')), [('OK', 'i=1'), ('OK', 'i=1')])
+        self.ae(g.image_for_client_id(1)['data'], b'abcd')
+        self.ae(t(i=1), b'')
+        self.ae(t(i=1), b'')
+        c.clear()
+        g.finish_background_loads()
+        self.ae(responses(c.wtcbuf), [('OK', 'i=1'), ('OK', 'i=1')])
+        self.ae(g.image_for_client_id(1)['data'], data)
+
+        # deleting an image while its data is being decoded
+        self.ae(t(i=2), b'')
+        self.ae(responses(send_command(s, 'a=d,d=I,i=2')), [('OK', 'i=2')])
+        self.assertIsNone(g.image_for_client_id(2))
+        s.reset()
+        self.ae(g.image_count, 0)
+
+        # images being decoded are not evicted by the storage quota
+        g.storage_limit = len(data) * 2
+        self.ae(send_command(s, 'a=T,q=1,s=1024,v=8,i=1', data), b'')
+        self.ae(send_command(s, 'a=T,q=1,s=1024,v=8,i=2', data), b'')
+        self.ae(t(i=3), b'')
+        # make the pending image the least recently used one
+        g.update_layers(0, -1, 1, 2 / s.columns, 2 / s.lines, s.columns, s.lines, 10, 20)
+        self.ae(send_command(s, 'a=t,q=1,s=1024,v=8,i=4', data), b'')
+        self.assertIsNone(g.image_for_client_id(1))
+        c.clear()
+        g.finish_background_loads()
+        self.ae(responses(c.wtcbuf), [('OK', 'i=3')])
+        self.ae(g.image_for_client_id(3)['data'], data)
+
     @unittest.skipIf(Image is None, 'PIL not available, skipping PNG tests')
     def test_load_png(self):
         s, g, pl, sl = load_helpers(self)
@@ -475,6 +566,18 @@ def test_load_png_simple(self):
         # test error handling for loading bad png data
         self.assertRaisesRegex(ValueError, '[EBADPNG]', load_png_data, b'dsfsdfsfsfd')
 
+    def test_resize_image_data(self):
+        px = bytes((10, 200, 30, 255))
+        self.ae(resize_image_data(px * 35, 7, 5, 3, 2, 4), px * 6)
+        self.ae(resize_image_data(px * 35, 7, 5, 20, 13, 4), px * 260)
+        # shrinking averages
+        self.ae(resize_image_data(bytes((0, 0, 0, 255, 255, 255, 255, 255)) * 2, 2, 2, 1, 1, 4), bytes((128, 128, 128, 255)))
+        # transparent pixels must not darken the color
+        self.ae(resize_image_data(bytes((255, 0, 0, 255, 0, 0, 0, 0)), 2, 1, 1, 1, 4), bytes((255, 0, 0, 128)))
+        # enlarging interpolates
+        self.ae(resize_image_data(bytes((0, 0, 0, 255, 255, 255)), 2, 1, 4, 1, 3), bytes((0, 0, 0, 64, 64, 64, 191, 191, 191, 255, 255, 255)))
+        self.assertRaises(ValueError, resize_image_data, px, 2, 2, 1, 1, 4)
+
     def test_gr_operations_with_numbers(self):
         s = self.create_screen()
         g = s.grman
@@ -1186,6 +1289,54 @@ def expand(*rows):
             {'gap': 40, 'id': 3, 'data': b'3' * 12 + (b'333abc' + b'3' * 6) * 2},
         ))
 
+    def test_animation_frames_stored_as_deltas(self):
+        s = self.create_screen()
+        g = s.grman
+        li = make_send_command(s)
+        root = 'abcdefghijkl' * 3
+        changed = root[:15] + 'XYZ' + root[18:]
+        self.assertEqual(li(a='t').code, 'OK')
+        # a complete frame is stored as the rectangle that changed from the previous frame
+        self.assertEqual(li(payload=changed).code, 'OK')
+        self.assertEqual(li(payload=changed).code, 'OK')
+        self.assertEqual(g.disk_cache.total_size, 36 + 3 + 3)
+        img = g.image_for_client_id(1)
+        self.ae(img['data'], root.encode())
+        self.ae([f['data'] for f in img['extra_frames']], [changed.encode()] * 2)
+        # modifying or deleting the previous frame must not change the frame
+        self.assertEqual(li(payload='0' * 36, r=1).code, 'OK')
+        img = g.image_for_client_id(1)
+        self.ae(img['data'], b'0' * 36)
+        self.ae([f['data'] for f in img['extra_frames']], [changed.encode()] * 2)
+        self.assertEqual(g.disk_cache.total_size, 36 + 36 + 3)
+        self.assertIsNone(li(a='d', d='f', i=1, r=2))
+        img = g.image_for_client_id(1)
+        self.ae([f['data'] for f in img['extra_frames']], [changed.encode()])
+        self.assertEqual(g.disk_cache.total_size, 36 + 36)
+
+        # also when the frame is based on it via an explicit delta
+        explicit = root[:3] + 'XYZ' + root[6:]
+        complete = explicit[:9] + 'QRS' + explicit[12:]
+
+        def chain(i):
+            self.assertEqual(li(a='t', i=i).code, 'OK')
+            self.assertEqual(li(payload='XYZ', s=1, v=1, x=1, c=1, i=i).code, 'OK')
+            self.assertEqual(li(payload=complete, i=i).code, 'OK')
+            img = g.image_for_client_id(i)
+            self.ae([f['data'] for f in img['extra_frames']], [explicit.encode(), complete.encode()])
+
+        chain(2)
+        self.assertEqual(li(payload='0' * 36, r=1, i=2).code, 'OK')
+        img = g.image_for_client_id(2)
+        self.ae(img['data'], b'0' * 36)
+        self.ae([f['data'] for f in img['extra_frames']], [b'000XYZ' + b'0' * 30, complete.encode()])
+        chain(3)
+        self.assertIsNone(li(a='d', d='f', i=3, r=1))
+        self.assertIsNone(li(a='d', d='f', i=3, r=1))
+        img = g.image_for_client_id(3)
+        self.ae(img['data'], complete.encode())
+        self.ae(img['extra_frames'], ())
+
     def test_graphics_quota_enforcement(self):
         s = self.create_screen()
         g = s.grman
@@ -1209,3 +1360,16 @@ def test_graphics_quota_enforcement(self):
         s.reset()
         self.ae(g.image_count, 0)
         self.assertEqual(g.disk_cache.total_size, 0)
+
+        # test least recently used images are evicted first
+        self.assertEqual(li(a='T').code, 'OK')
+        self.assertEqual(li(a='T', i=2).code, 'OK')
+        self.assertEqual(li(a='p', i=1).code, 'OK')
+        self.assertEqual(li(a='T', i=3).code, 'OK')
+        usage = s.graphics_usage()
+        self.ae(usage['image_count'], 2)
+        self.ae(usage['used_storage'], 72)
+        self.ae(usage['storage_limit'], 72)
+        self.ae(usage['disk_cache_size'], 72)
+        self.assertIsNotNone(g.image_for_client_id(1))
+        self.assertIsNone(g.image_for_client_id(2))
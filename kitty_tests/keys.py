@@ -531,6 +531,7 @@ def __init__(self, *lines, active_window = Window()):
                 self.options = load_config(overrides=lines, accumulate_bad_lines=bad_lines)
                 af(bad_lines)
                 self.ignore_os_keyboard_processing = False
+                self.focus_match_evaluations = 0
                 super().__init__()
 
             def get_active_window(self):
@@ -541,6 +542,12 @@ def match_windows(self, expr: str):
                     if str(w.id) == expr:
                         yield w
 
+            def window_matches(self, w, condition):
+                self.focus_match_evaluations += 1
+                if condition.query is None:
+                    return super().window_matches(w, condition)
+                return condition.expr == f'id:{w.id}'
+
             def show_error(self, title: str, msg: str) -> None:
                 pass
 
@@ -634,6 +641,21 @@ def __call__(self, *keys: str):
         tm.active_window = tm.windows[1]
         self.ae(tm('ctrl+shift+t'), [False])
 
+        # results of focus selection are cached till the focused window changes
+        tm = TM('map --when-focus-on id:2 kitty_mod+t new_window')
+        tm.windows.append(Window(2))
+        tm.active_window = tm.windows[1]
+        self.ae(tm('ctrl+shift+t', 'ctrl+shift+t'), [True, True])
+        self.ae(tm.actions, ['new_window', 'new_window'])
+        self.ae(tm.focus_match_evaluations, 1)
+        tm.invalidate_focus_match_cache()
+        self.ae(tm('ctrl+shift+t'), [True])
+        self.ae(tm.focus_match_evaluations, 2)
+        tm.active_window = tm.windows[0]
+        self.ae(tm('ctrl+shift+t'), [True])
+        self.ae(tm.actions, ['new_tab'])
+        self.ae(tm.focus_match_evaluations, 3)
+
         # modal mappings
         tm = TM('map --new-mode mw --on-unknown end kitty_mod+f7', 'map --mode mw left neighboring_window left', 'map --mode mw right neighboring_window right')
         self.ae(tm('ctrl+shift+f7'), [True])
@@ -645,6 +667,24 @@ def __call__(self, *keys: str):
         self.ae(tm('x'), [True])
         af(tm.keyboard_mode_stack)
 
+        # definitions added at runtime are matched by their key in the keymap, not their trigger
+        from kitty.options.utils import KeyboardMode, KeyDefinition
+        from kitty.types import SingleKey
+        tm = TM()
+        km = KeyboardMode('__visual_select__')
+        km.on_action = 'end'
+        for wid, ch in ((1, 'a'), (2, 'b')):
+            ac = KeyDefinition(definition=f'visual_window_select_action_trigger {wid}')
+            for mods in (0, defines.GLFW_MOD_CONTROL):
+                km.keymap[SingleKey(mods=mods, key=ord(ch))].append(ac)
+        tm._push_keyboard_mode(km)
+        self.ae(tm('b'), [True])
+        self.ae(tm.actions, ['visual_window_select_action_trigger 2'])
+        af(tm.keyboard_mode_stack)
+        tm._push_keyboard_mode(km)
+        self.ae(tm('ctrl+a'), [True])
+        self.ae(tm.actions, ['visual_window_select_action_trigger 1'])
+
         # modal mapping with --on-action=end must restore OS keyboard processing
         tm = TM('map --new-mode mw --on-action end m', 'map --mode mw a new_window')
         self.ae(tm('m', 'a'), [True, True])
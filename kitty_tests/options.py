@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # License: GPL v3 Copyright: 2018, Kovid Goyal <kovid at kovidgoyal.net>
 
+import os
 
 from kitty.fast_data_types import Color
 from kitty.options.utils import DELETE_ENV_VAR
@@ -137,3 +138,107 @@ def ac(which=0):
                  " \\ blue")
         self.ae(opts.font_size, 12.35)
         self.ae(opts.color25, Color(0, 0, 255))
+
+    def test_compiled_config(self):
+        import tempfile
+
+        from kitty.config import compiled_config_path, load_compiled_config, load_config
+        with tempfile.TemporaryDirectory() as tdir:
+            conf = os.path.join(tdir, 'kitty.conf')
+            inc = os.path.join(tdir, 'inc.conf')
+
+            def w(path, *lines):
+                with open(path, 'w') as f:
+                    f.write('\n'.join(lines))
+
+            def load():
+                del self.error_messages[:]
+                return load_config(conf, overrides=('cursor_blink_interval 3',), use_cache=True)
+
+            def is_cached():
+                return load_compiled_config(compiled_config_path((conf,), ('cursor_blink_interval 3',))) is not None
+
+            w(conf, 'font_size 13', 'include inc.conf', 'globinclude g-*.conf', 'map kitty_mod+f1 launch --title=xyz', 'moose 1')
+            self.assertFalse(is_cached())
+            opts = load()
+            self.ae((opts.font_size, opts.cursor_blink_interval), (13, 3))
+            self.ae(len(self.error_messages), 2)
+            # configs with errors are never cached, so the errors are always reported
+            self.assertFalse(is_cached())
+            self.ae(load().font_size, 13)
+            self.ae(len(self.error_messages), 2)
+            bad = os.path.join(tdir, 'bad.conf')
+            w(bad, 'font_size abc')
+            bad_lines = []
+            load_config(bad, accumulate_bad_lines=bad_lines, use_cache=True)
+            self.ae(len(bad_lines), 1)
+            self.assertIsNone(load_compiled_config(compiled_config_path((bad,), ())))
+
+            w(inc, '')
+            w(conf, 'font_size 13', 'include inc.conf', 'globinclude g-*.conf', 'map kitty_mod+f1 launch --title=xyz')
+            self.ae(load().font_size, 13)
+            self.assertTrue(is_cached())
+            opts = load()
+            self.ae(opts.font_size, 13)
+            self.ae(len(self.error_messages), 0)
+            self.ae(opts.config_paths, (conf,))
+            keys = [k for k, v in opts.keyboard_modes[''].keymap.items() if v[0].definition == 'launch --title=xyz']
+            self.ae(len(keys), 1)
+            self.assertTrue(keys[0].defined_with_kitty_mod)
+            self.ae(keys[0].mods, opts.kitty_mod)
+
+            w(inc, 'font_size 14')
+            self.assertFalse(is_cached())
+            self.ae(load().font_size, 14)
+            self.assertTrue(is_cached())
+            w(os.path.join(tdir, 'g-1.conf'), 'font_size 15')
+            self.assertFalse(is_cached())
+            self.ae(load().font_size, 15)
+            w(inc, 'font_size 16', 'font_size 17')
+            self.ae(load().font_size, 15)
+            os.remove(os.path.join(tdir, 'g-1.conf'))
+            self.ae(load().font_size, 17)
+            self.assertTrue(is_cached())
+
+    def test_include_order(self):
+        import tempfile
+
+        from kitty.config import load_config
+        with tempfile.TemporaryDirectory() as tdir:
+            conf = os.path.join(tdir, 'kitty.conf')
+
+            def w(name, *lines):
+                with open(os.path.join(tdir, name), 'w') as f:
+                    f.write('\n'.join(lines))
+
+            w('kitty.conf', 'globinclude g-*.conf', 'include missing.conf')
+            for i in range(9):
+                w(f'g-{i}.conf', f'font_size {i + 10}', f'scrollback_lines {i + 100}' if i % 2 else '')
+            w('g-5.conf', 'font_size 25', 'include inc.conf', 'font_size 15')
+            w('inc.conf', 'scrollback_lines 35', 'cursor_blink_interval 3')
+            del self.error_messages[:]
+            opts = load_config(conf)
+            self.ae((opts.font_size, opts.scrollback_lines, opts.cursor_blink_interval), (18, 107, 3))
+            self.ae(len(self.error_messages), 1)
+
+    def test_changed_option_categories(self):
+        from kitty.config import changed_option_categories, load_config
+
+        def c(*a, base=()):
+            return set(changed_option_categories(load_config(overrides=base), load_config(overrides=a)))
+
+        self.ae(c(), set())
+        self.ae(c('font_size 23'), {'fonts'})
+        self.ae(c('font_features FiraCode-Retina +zero', base=('font_features FiraCode-Retina +zero',)), set())
+        self.ae(c('color3 red', 'cursor blue'), {'colors'})
+        self.ae(c('active_tab_foreground red', 'tab_bar_style fade'), {'tab_bar'})
+        self.ae(c('window_padding_width 3', 'enabled_layouts tall'), {'layout'})
+        self.ae(c('map f1 new_window'), {'keys'})
+        self.ae(c('kitty_mod alt'), {'keys'})
+        self.ae(c('text_composition_strategy legacy', 'scrollback_lines 7'), {'shaders', 'other'})
+        # these are applied by reloading all GPU data, which happens only for shaders and fonts
+        self.ae(c('text_composition_strategy 1.2 30'), {'shaders'})
+        self.ae(c('text_fg_override_threshold 10'), {'shaders'})
+        self.ae(c('dim_opacity 0.5'), {'shaders'})
+        self.ae(c('inactive_text_alpha 0.5'), {'colors'})
+        self.ae(c('background_image /x.png'), {'background_image'})